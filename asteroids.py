@@ -0,0 +1,81 @@
+import math
+
+import numpy as np
+
+# --------------------------
+# Asteroid belt stored as contiguous arrays
+# --------------------------
+class AsteroidField:
+    def __init__(self, count, rng=None):
+        rng = rng if rng is not None else np.random.default_rng()
+        self.count = count
+
+        # Position in polar coordinates, then convert to cartesian
+        angle = rng.uniform(0, 2 * math.pi, count)
+        # Place them in a belt between Mars and Jupiter
+        radius = rng.uniform(280, 340, count)
+
+        self.base = np.empty((count, 3), dtype=np.float32)
+        self.base[:, 0] = radius * np.cos(angle)
+        self.base[:, 1] = rng.uniform(-15, 15, count) # Give them some vertical displacement
+        self.base[:, 2] = radius * np.sin(angle)
+
+        self.size = rng.uniform(0.5, 3.5, count).astype(np.float32)
+
+        # Orbital speed - slower for farther asteroids to simulate Kepler's laws
+        self.speed = (rng.uniform(0.2, 0.35, count) * (340 / radius)).astype(np.float32)
+
+        # Random rotation axis and speed for tumbling effect
+        self.rot_speed = rng.uniform(-40, 40, count).astype(np.float32)
+        axis = rng.uniform(-1, 1, (count, 3))
+        self.rot_axis = (axis / np.linalg.norm(axis, axis=1)[:, None]).astype(np.float32)
+
+        self.positions = self.base.copy()
+        # One column-major 4x4 model matrix per asteroid, ready for glMultMatrixf
+        # or a per-instance vertex attribute
+        self.matrices = np.zeros((count, 4, 4), dtype=np.float32)
+        self.matrices[:, 3, 3] = 1.0
+
+    def orbit_velocities(self, sun_gm):
+        # Velocity of a circular orbit about the sun from every starting
+        # point, turning the same way as update() does
+        radius = np.hypot(self.base[:, 0], self.base[:, 2])
+        speed = np.sqrt(sun_gm / radius)
+        velocities = np.zeros((self.count, 3))
+        velocities[:, 0] = -self.base[:, 2] / radius * speed
+        velocities[:, 2] = self.base[:, 0] / radius * speed
+        return velocities
+
+    def update(self, t, positions=None):
+        if positions is not None:
+            # Integrated elsewhere (see gravity.py)
+            self.positions[:] = positions
+        else:
+            # Asteroids revolve around the sun at their own speed, starting
+            # from their initial (x, z) on the orbit circle
+            # (in float64 and reduced first, so far-off epochs stay exact)
+            orbit_angle = np.radians(np.mod(t * 10.0 * self.speed.astype(np.float64), 360.0))
+            cos_a, sin_a = np.cos(orbit_angle), np.sin(orbit_angle)
+            x, z = self.base[:, 0], self.base[:, 2]
+            self.positions[:, 0] = x * cos_a - z * sin_a
+            self.positions[:, 2] = x * sin_a + z * cos_a
+
+        # Tumble about each rotation axis (Rodrigues' formula, same as glRotatef),
+        # written straight into the column-major matrices with the size folded in
+        spin = np.radians(np.mod(t * self.rot_speed.astype(np.float64), 360.0))
+        c, s = np.cos(spin), np.sin(spin)
+        kx, ky, kz = self.rot_axis[:, 0], self.rot_axis[:, 1], self.rot_axis[:, 2]
+        oc = (1 - c) * self.size
+        c = c * self.size
+        s = s * self.size
+        m = self.matrices
+        m[:, 0, 0] = kx * kx * oc + c
+        m[:, 0, 1] = ky * kx * oc + s * kz
+        m[:, 0, 2] = kz * kx * oc - s * ky
+        m[:, 1, 0] = kx * ky * oc - s * kz
+        m[:, 1, 1] = ky * ky * oc + c
+        m[:, 1, 2] = kz * ky * oc + s * kx
+        m[:, 2, 0] = kx * kz * oc + s * ky
+        m[:, 2, 1] = ky * kz * oc - s * kx
+        m[:, 2, 2] = kz * kz * oc + c
+        m[:, 3, :3] = self.positions
@@ -0,0 +1,103 @@
+import argparse
+import json
+import os
+import subprocess
+import sys
+import tempfile
+
+from scenarios import SCENARIOS
+
+# --------------------------
+# Offscreen benchmark: python benchmark.py [scenario ...] [--out results.json]
+# --------------------------
+# Each scenario runs main.py in its own process, rendering into an SDL
+# offscreen window on a surfaceless EGL context, so no display is needed.
+# Mesa's llvmpipe gives CPU-only machines the same GL the desktop has.
+OFFSCREEN_ENV = {
+    "SDL_VIDEODRIVER": "offscreen",
+    "PYOPENGL_PLATFORM": "egl",
+    "EGL_PLATFORM": "surfaceless",
+}
+SOFTWARE_ENV = {
+    "LIBGL_ALWAYS_SOFTWARE": "1",
+    "GALLIUM_DRIVER": "llvmpipe",
+}
+
+def git_commit():
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True,
+                              text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+def run_scenario(name, renderer, size, software):
+    env = dict(os.environ, **OFFSCREEN_ENV)
+    if software:
+        env.update(SOFTWARE_ENV)
+    fd, path = tempfile.mkstemp(suffix=".json")
+    os.close(fd)
+    try:
+        subprocess.run([sys.executable, "main.py", "--scenario", name, "--renderer", renderer,
+                        "--size", size, "--profile", path],
+                       env=env, check=True, cwd=os.path.dirname(os.path.abspath(__file__)))
+        with open(path) as f:
+            profile = json.load(f)
+    finally:
+        os.remove(path)
+    return {
+        "info": profile["info"],
+        "frames": profile["frames"],
+        "frame_ms": profile["frame_ms"],
+        "sections": profile["sections"],
+        # The full distribution, for comparisons beyond the percentiles
+        "frame_times_ms": [sample["frame_ms"] for sample in profile["samples"]],
+    }
+
+def compare(results, baseline):
+    # Frame-time percentiles of both runs, in ms, and the relative change
+    print(f"Compared with {baseline.get('commit')}:")
+    for name, result in results["scenarios"].items():
+        before = baseline.get("scenarios", {}).get(name)
+        if before is None:
+            continue
+        cells = []
+        for p in ("p50", "p95", "p99"):
+            old, new = before["frame_ms"][p], result["frame_ms"][p]
+            change = (new - old) / old if old else 0.0
+            cells.append(f"{p} {old:.2f} -> {new:.2f} ({change:+.0%})")
+        print(f"  {name}: " + ", ".join(cells))
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Run the scripted scenarios offscreen and "
+                                                 "record their frame-time distributions")
+    default_scenarios = [name for name, scenario in SCENARIOS.items() if not scenario.optional]
+    parser.add_argument("scenarios", nargs="*", metavar="scenario",
+                        help=f"scenarios to run: {', '.join(SCENARIOS)} "
+                             f"(default: all but {', '.join(sorted(set(SCENARIOS) - set(default_scenarios)))})")
+    parser.add_argument("--renderer", choices=("shader", "fixed"), default="shader")
+    parser.add_argument("--size", default="1280x720", metavar="WxH")
+    parser.add_argument("--software", action="store_true",
+                        help="force Mesa's llvmpipe even when a GPU driver is available")
+    parser.add_argument("--out", default="benchmark.json", metavar="PATH",
+                        help="where to write the results (default: benchmark.json)")
+    parser.add_argument("--compare", metavar="PATH",
+                        help="results of an earlier run (e.g. another commit) to compare against")
+    args = parser.parse_args()
+    unknown = set(args.scenarios) - set(SCENARIOS)
+    if unknown:
+        parser.error(f"unknown scenario(s): {', '.join(sorted(unknown))}")
+
+    results = {"commit": git_commit(), "renderer": args.renderer, "size": args.size, "scenarios": {}}
+    for name in args.scenarios or default_scenarios:
+        result = run_scenario(name, args.renderer, args.size, args.software)
+        results["scenarios"][name] = result
+        stats = result["frame_ms"]
+        print(f"{name}: {result['frames']} frames, mean {stats['mean']:.2f} ms, "
+              f"p50 {stats['p50']:.2f} / p95 {stats['p95']:.2f} / p99 {stats['p99']:.2f} ms "
+              f"({result['info']['gl_renderer']})")
+
+    with open(args.out, "w") as f:
+        json.dump(results, f, indent=1)
+    if args.compare:
+        with open(args.compare) as f:
+            compare(results, json.load(f))
@@ -0,0 +1,80 @@
+import numpy as np
+
+# Like simulation.py, nothing here may import pygame or OpenGL.
+
+# Edge of a broad-phase cell: about the rocket plus the largest asteroid,
+# so a rocket-sized query only looks at a few cells
+GRID_CELL = 16.0
+# Cell coordinates are packed into one int64 key, 21 bits per axis
+_BIAS = 1 << 20
+
+def _cell_keys(cells):
+    cells = np.clip(cells + _BIAS, 0, (1 << 21) - 1)
+    return cells[..., 0] << 42 | cells[..., 1] << 21 | cells[..., 2]
+
+# --------------------------
+# Broad phase: uniform grid over many small moving spheres
+# --------------------------
+class SpatialGrid:
+    # Rebuilt from scratch every step: one cell key per body and one sort,
+    # so the cost grows with the number of bodies, never with pairs of
+    # them. Each body is filed under the cell of its center; queries reach
+    # out by the largest radius to catch bodies that overlap from next door.
+    def __init__(self, cell=GRID_CELL):
+        self.cell = cell
+        self.centers = np.zeros((0, 3))
+        self.radii = np.zeros(0)
+        self.max_radius = 0.0
+        self.keys = np.zeros(0, dtype=np.int64)
+        self.order = np.zeros(0, dtype=np.intp)
+
+    def rebuild(self, centers, radii):
+        self.centers = np.asarray(centers, dtype=np.float64).reshape(-1, 3)
+        self.radii = np.asarray(radii, dtype=np.float64)
+        self.max_radius = float(self.radii.max(initial=0.0))
+        keys = _cell_keys(np.floor(self.centers / self.cell).astype(np.int64))
+        self.order = np.argsort(keys)
+        self.keys = keys[self.order]
+
+    def query(self, center, radius):
+        # Indices of the bodies whose spheres overlap this one (broad phase
+        # by cell, then the exact sphere test)
+        center = np.asarray(center, dtype=np.float64)
+        reach = radius + self.max_radius
+        low = np.floor((center - reach) / self.cell).astype(np.int64)
+        high = np.floor((center + reach) / self.cell).astype(np.int64)
+        if np.prod(high - low + 1) > len(self.keys):
+            # A query bigger than the whole grid: test everything
+            candidates = np.arange(len(self.keys))
+        else:
+            axes = [np.arange(lo, hi + 1) for lo, hi in zip(low, high)]
+            cells = np.stack(np.meshgrid(*axes, indexing="ij"), axis=-1).reshape(-1, 3)
+            keys = _cell_keys(cells)
+            starts = np.searchsorted(self.keys, keys, "left")
+            ends = np.searchsorted(self.keys, keys, "right")
+            candidates = np.concatenate([self.order[s:e] for s, e in zip(starts, ends) if e > s] or
+                                        [np.zeros(0, dtype=np.intp)])
+        d = self.centers[candidates] - center
+        reach2 = (radius + self.radii[candidates]) ** 2
+        return candidates[np.einsum("ij,ij->i", d, d) < reach2]
+
+# --------------------------
+# Narrow phase results
+# --------------------------
+class Collision:
+    def __init__(self, kind, index, normal, depth):
+        self.kind = kind     # "sun", "planet", "black_hole", "asteroid" or "ufo"
+        self.index = index   # Into the scene's bodies, the asteroids or the UFOs
+        self.normal = normal # Unit vector from the body's center towards the rocket
+        self.depth = depth   # How far the spheres overlap
+
+def sphere_contacts(center, radius, centers, radii):
+    # Exact sphere tests against a few bodies at once: indices, normals
+    # and depths of the overlapping ones
+    d = np.asarray(center, dtype=np.float64) - np.asarray(centers, dtype=np.float64).reshape(-1, 3)
+    distance = np.sqrt(np.einsum("ij,ij->i", d, d))
+    depth = radius + np.asarray(radii, dtype=np.float64) - distance
+    hit = np.flatnonzero(depth > 0)
+    # Dead center gives no direction; push out along y
+    normal = np.where(distance[hit, None] > 0, d[hit] / np.maximum(distance[hit, None], 1e-12), (0.0, 1.0, 0.0))
+    return hit, normal, depth[hit]
@@ -0,0 +1,57 @@
+import numpy as np
+
+# --------------------------
+# View frustum as six world-space planes, with per-frame visible/culled counts
+# --------------------------
+class Frustum:
+    def __init__(self):
+        # Rows are (a, b, c, d) with the normal pointing into the frustum;
+        # starts out accepting everything until the first update()
+        self.planes = np.zeros((6, 4), dtype=np.float64)
+        self.planes[:, 3] = 1.0
+        self.visible = 0
+        self.culled = 0
+        # Totals of the last finished frame
+        self.frame_visible = 0
+        self.frame_culled = 0
+
+    def update(self, projection, modelview):
+        # Both matrices as returned by glGetFloatv (column-major), with the
+        # modelview holding only the camera transform. The rows of the
+        # combined clip matrix give the planes directly (Gribb/Hartmann).
+        clip = (np.asarray(modelview, dtype=np.float64) @ np.asarray(projection, dtype=np.float64)).T
+        planes = np.array([
+            clip[3] + clip[0], # Left
+            clip[3] - clip[0], # Right
+            clip[3] + clip[1], # Bottom
+            clip[3] - clip[1], # Top
+            clip[3] + clip[2], # Near
+            clip[3] - clip[2], # Far
+        ])
+        self.planes = planes / np.linalg.norm(planes[:, :3], axis=1)[:, None]
+
+    def contains(self, center, radius):
+        # True if a sphere around a world-space center may be on screen
+        distances = self.planes[:, :3] @ center + self.planes[:, 3]
+        return bool((distances >= -radius).all())
+
+    def test(self, center, radius):
+        # Same as contains(), counting the body as visible or culled
+        if self.contains(center, radius):
+            self.visible += 1
+            return True
+        self.culled += 1
+        return False
+
+    def test_many(self, centers, radii):
+        # Vectorized variant; returns a mask of the spheres that may be on screen
+        distances = centers @ self.planes[:, :3].T + self.planes[:, 3]
+        mask = (distances >= -np.reshape(radii, (-1, 1))).all(axis=1)
+        visible = int(np.count_nonzero(mask))
+        self.visible += visible
+        self.culled += len(mask) - visible
+        return mask
+
+    def end_frame(self):
+        self.frame_visible, self.frame_culled = self.visible, self.culled
+        self.visible = self.culled = 0
@@ -0,0 +1,175 @@
+import ctypes
+import os
+import queue
+import shlex
+import subprocess
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+from PIL import Image
+from OpenGL.GL import *
+# The high-level wrapper allocates its own output array; with a pixel pack
+# buffer bound, the last argument is an offset into the buffer instead
+from OpenGL.raw.GL.VERSION.GL_1_0 import glReadPixels
+
+# Pixel pack buffers frames are read into; a frame is mapped this many
+# frames after its readback was issued, by when the GPU has long finished it
+READBACK_RING = 3
+# Frames being written at once, each in its own worker thread (PNG sequences)
+EXPORT_WORKERS = 4
+# zlib level of the PNGs: 1 writes several times faster than the default 6
+# for files about a third bigger
+PNG_COMPRESS_LEVEL = 1
+# How long to wait on a readback fence per try, in nanoseconds
+FENCE_WAIT_NS = 1000000
+
+# --------------------------
+# Render frames offscreen and stream them to disk or an encoder
+# --------------------------
+class FrameExporter:
+    # Everything between begin() and end() draws into a framebuffer of the
+    # export size, whatever the window's. end() starts an asynchronous
+    # readback of the frame into the next pixel pack buffer of a ring and
+    # collects the one issued READBACK_RING frames earlier, so the pipeline
+    # never waits for the GPU; the pixels go to worker threads that write a
+    # PNG sequence or pipe raw frames (RGBA, top row first) into an encoder's
+    # standard input, in order. The window only gets a scaled-down preview.
+    def __init__(self, width, height, directory=None, pipe_command=None, workers=EXPORT_WORKERS,
+                 ring=READBACK_RING):
+        if not (bool(glGenFramebuffers) and bool(glFenceSync)):
+            raise RuntimeError("Exporting needs framebuffer objects and fence syncs (OpenGL 3.2)")
+        self.width, self.height = width, height
+        self.frame_bytes = width * height * 4
+
+        self.fbo = glGenFramebuffers(1)
+        self.renderbuffers = glGenRenderbuffers(2)
+        glBindFramebuffer(GL_FRAMEBUFFER, self.fbo)
+        for renderbuffer, storage, attachment in zip(
+                self.renderbuffers, (GL_RGBA8, GL_DEPTH_COMPONENT24), (GL_COLOR_ATTACHMENT0, GL_DEPTH_ATTACHMENT)):
+            glBindRenderbuffer(GL_RENDERBUFFER, renderbuffer)
+            glRenderbufferStorage(GL_RENDERBUFFER, storage, width, height)
+            glFramebufferRenderbuffer(GL_FRAMEBUFFER, attachment, GL_RENDERBUFFER, renderbuffer)
+        glBindRenderbuffer(GL_RENDERBUFFER, 0)
+        complete = glCheckFramebufferStatus(GL_FRAMEBUFFER) == GL_FRAMEBUFFER_COMPLETE
+        glBindFramebuffer(GL_FRAMEBUFFER, 0)
+        if not complete:
+            self.release()
+            raise RuntimeError(f"Cannot render {width}x{height} offscreen")
+
+        self.pbos = list(np.atleast_1d(glGenBuffers(ring)))
+        for pbo in self.pbos:
+            glBindBuffer(GL_PIXEL_PACK_BUFFER, pbo)
+            glBufferData(GL_PIXEL_PACK_BUFFER, self.frame_bytes, None, GL_STREAM_READ)
+        glBindBuffer(GL_PIXEL_PACK_BUFFER, 0)
+        # (pbo, fence, frame number) of each readback in flight, oldest first
+        self.in_flight = []
+
+        if pipe_command is not None:
+            # One writer keeps the frames in order
+            self.process = subprocess.Popen(shlex.split(pipe_command), stdin=subprocess.PIPE)
+            self.directory = None
+            workers = 1
+        else:
+            self.process = None
+            self.directory = directory
+            os.makedirs(directory, exist_ok=True)
+        self.pool = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="export")
+        # Frame buffers shared with the workers: when all are taken the
+        # render loop waits for one, which bounds the memory in use
+        self.free = queue.Queue()
+        for _ in range(workers + 2):
+            self.free.put(np.empty((height, width, 4), dtype=np.uint8))
+        self.error = None
+
+        self.frames = 0
+        self.readback_wait = 0.0 # Seconds waited on fences and mapping
+        self.worker_wait = 0.0   # Seconds waited for a free frame buffer
+        self.start = time.perf_counter()
+
+    def begin(self):
+        glBindFramebuffer(GL_FRAMEBUFFER, self.fbo)
+        glViewport(0, 0, self.width, self.height)
+
+    def end(self, window_width, window_height):
+        if self.error is not None:
+            raise RuntimeError(f"Frame export failed: {self.error}")
+        pbo = self.pbos[self.frames % len(self.pbos)]
+        if len(self.in_flight) == len(self.pbos):
+            self._collect()
+        glBindFramebuffer(GL_READ_FRAMEBUFFER, self.fbo)
+        glBindBuffer(GL_PIXEL_PACK_BUFFER, pbo)
+        glReadPixels(0, 0, self.width, self.height, GL_RGBA, GL_UNSIGNED_BYTE, ctypes.c_void_p(0))
+        glBindBuffer(GL_PIXEL_PACK_BUFFER, 0)
+        self.in_flight.append((pbo, glFenceSync(GL_SYNC_GPU_COMMANDS_COMPLETE, 0), self.frames))
+        self.frames += 1
+
+        # Preview, fitted into the window
+        fit = min(window_width / self.width, window_height / self.height)
+        w, h = int(self.width * fit), int(self.height * fit)
+        x, y = (window_width - w) // 2, (window_height - h) // 2
+        glBindFramebuffer(GL_DRAW_FRAMEBUFFER, 0)
+        glClear(GL_COLOR_BUFFER_BIT)
+        glBlitFramebuffer(0, 0, self.width, self.height, x, y, x + w, y + h, GL_COLOR_BUFFER_BIT, GL_LINEAR)
+        glBindFramebuffer(GL_FRAMEBUFFER, 0)
+        glViewport(0, 0, window_width, window_height)
+
+    def _collect(self):
+        # The oldest readback, into a free frame buffer and off to a worker
+        pbo, fence, number = self.in_flight.pop(0)
+        start = time.perf_counter()
+        frame = self.free.get()
+        waited = time.perf_counter()
+        self.worker_wait += waited - start
+        while glClientWaitSync(fence, GL_SYNC_FLUSH_COMMANDS_BIT, FENCE_WAIT_NS) == GL_TIMEOUT_EXPIRED:
+            pass
+        glDeleteSync(fence)
+        glBindBuffer(GL_PIXEL_PACK_BUFFER, pbo)
+        pointer = glMapBufferRange(GL_PIXEL_PACK_BUFFER, 0, self.frame_bytes, GL_MAP_READ_BIT)
+        ctypes.memmove(frame.ctypes.data, pointer, self.frame_bytes)
+        glUnmapBuffer(GL_PIXEL_PACK_BUFFER)
+        glBindBuffer(GL_PIXEL_PACK_BUFFER, 0)
+        self.readback_wait += time.perf_counter() - waited
+        future = self.pool.submit(self._write, number, frame)
+        future.add_done_callback(lambda done, frame=frame: self._written(done, frame))
+
+    def _write(self, number, frame):
+        # GL's rows run bottom to top
+        if self.process is not None:
+            self.process.stdin.write(np.ascontiguousarray(frame[::-1]).data)
+        else:
+            path = os.path.join(self.directory, f"frame_{number:06d}.png")
+            Image.fromarray(frame[::-1, :, :3]).save(path, compress_level=PNG_COMPRESS_LEVEL)
+
+    def _written(self, future, frame):
+        if future.exception() is not None and self.error is None:
+            self.error = future.exception()
+        self.free.put(frame)
+
+    def finish(self):
+        # Collect the frames still in flight, wait for every write and the
+        # encoder, and report where the time went
+        while self.in_flight:
+            self._collect()
+        self.pool.shutdown(wait=True)
+        if self.process is not None:
+            try:
+                self.process.stdin.close()
+            except OSError:
+                pass
+            self.process.wait()
+        elapsed = time.perf_counter() - self.start
+        print(f"Export: {self.frames} frames of {self.width}x{self.height} in {elapsed:.1f}s "
+              f"({self.frames / max(elapsed, 1e-9):.1f} fps); waited {self.readback_wait:.2f}s on readback, "
+              f"{self.worker_wait:.2f}s on {'the encoder' if self.process else 'writers'}")
+        if self.error is not None:
+            print(f"Warning: Frame export failed: {self.error}")
+
+    def release(self):
+        if self.fbo is not None:
+            glDeleteFramebuffers(1, [self.fbo])
+            glDeleteRenderbuffers(2, list(self.renderbuffers))
+            self.fbo = None
+        if getattr(self, "pbos", None):
+            glDeleteBuffers(len(self.pbos), self.pbos)
+            self.pbos = []
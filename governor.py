@@ -0,0 +1,145 @@
+from collections import deque
+
+# Like simulation.py, nothing here may import pygame or OpenGL.
+
+# The quality settings the governor can turn, and the steps of each, lowest
+# quality first. Fractions are of the full setting (window resolution,
+# projected size for the LOD tables, asteroids in the belt, the world's smoke
+# cap); glow layers are counted from the core line outwards, and stars are the
+# faintest magnitude drawn from a star catalog (see starfield.py).
+QUALITY_STEPS = {
+    "stars": [6.0, 7.0, 8.0, 9.0],
+    "render_scale": [0.5, 0.625, 0.75, 0.875, 1.0],
+    "detail": [0.25, 0.5, 0.75, 1.0],
+    "asteroids": [0.25, 0.5, 0.75, 1.0],
+    "glow_layers": [1, 2, 3],
+    "smoke": [0.25, 0.5, 0.75, 1.0],
+}
+# Over budget, the first setting above its floor is lowered; with headroom,
+# the last one below its ceiling is raised. What is hardest to notice goes first.
+QUALITY_ORDER = ("stars", "smoke", "glow_layers", "asteroids", "detail", "render_scale")
+
+# Floor and ceiling of every setting, as values from QUALITY_STEPS
+QUALITY_PRESETS = {
+    # Never gives up more than a little
+    "high": {
+        "stars": (8.0, 9.0),
+        "render_scale": (0.875, 1.0),
+        "detail": (0.75, 1.0),
+        "asteroids": (0.75, 1.0),
+        "glow_layers": (2, 3),
+        "smoke": (0.5, 1.0),
+    },
+    "balanced": {
+        "stars": (7.0, 9.0),
+        "render_scale": (0.75, 1.0),
+        "detail": (0.5, 1.0),
+        "asteroids": (0.5, 1.0),
+        "glow_layers": (1, 3),
+        "smoke": (0.25, 1.0),
+    },
+    # Anything goes to keep the frame rate
+    "low": {name: (steps[0], steps[-1]) for name, steps in QUALITY_STEPS.items()},
+}
+
+# Mean busy time per frame, as a share of the budget, above which quality
+# goes down and below which it may come back up
+OVER_BUDGET = 0.95
+UNDER_BUDGET = 0.6
+# Frames measured before lowering and before raising a setting; raising
+# waits longer, so one quiet moment doesn't start it see-sawing
+DOWN_FRAMES = 20
+UP_FRAMES = 120
+# Each time a raise has to be taken back, the next one waits this much longer
+BACKOFF = 2
+MAX_UP_FRAMES = 1920
+
+# --------------------------
+# Hold a frame rate by trading quality for time
+# --------------------------
+class QualityDecision:
+    def __init__(self, frame, frame_ms, budget_ms, threshold_ms, setting, old, new):
+        self.frame = frame         # Frames measured so far when it was made
+        self.frame_ms = frame_ms   # Mean busy time per frame it was made on
+        self.budget_ms = budget_ms
+        self.threshold_ms = threshold_ms # What frame_ms was compared with
+        self.setting = setting
+        self.old = old
+        self.new = new
+
+    def as_dict(self):
+        return dict(vars(self))
+
+    def __str__(self):
+        direction = "over" if self.frame_ms > self.threshold_ms else "under"
+        share = self.threshold_ms / self.budget_ms
+        return (f"Quality: {self.frame_ms:.1f} ms per frame, {direction} {self.threshold_ms:.1f} ms "
+                f"({share:.0%} of the {self.budget_ms:.1f} ms budget): {self.setting} {self.old:g} -> {self.new:g}")
+
+class QualityGovernor:
+    # Fed the busy time of each frame (without the wait for the frame cap,
+    # or there would never be headroom to measure). Steps one setting at a
+    # time, by one step, then measures afresh. Every decision is printed and
+    # kept in `decisions`, so presets can be tuned from a session's log.
+    def __init__(self, target_fps=60, limits=None, log=print):
+        self.budget = 1.0 / target_fps
+        limits = QUALITY_PRESETS["balanced"] if limits is None else limits
+        self.log = log
+        # Index into QUALITY_STEPS of each setting, and the range it may move in
+        self.floor, self.ceiling, self.level = {}, {}, {}
+        for name, steps in QUALITY_STEPS.items():
+            low, high = limits.get(name, (steps[0], steps[-1]))
+            self.floor[name] = steps.index(low)
+            self.ceiling[name] = steps.index(high)
+            # Start at full quality and only give up what the machine can't afford
+            self.level[name] = self.ceiling[name]
+        self.samples = deque(maxlen=max(DOWN_FRAMES, MAX_UP_FRAMES))
+        self.up_frames = UP_FRAMES
+        self.last_raise = None
+        self.frames = 0
+        self.decisions = []
+
+    def __getitem__(self, name):
+        return QUALITY_STEPS[name][self.level[name]]
+
+    def settings(self):
+        return {name: self[name] for name in QUALITY_STEPS}
+
+    def update(self, busy_seconds):
+        # Returns the decision taken on this frame, if any
+        self.frames += 1
+        self.samples.append(busy_seconds)
+        count = len(self.samples)
+        if count < DOWN_FRAMES:
+            return None
+        recent = sum(list(self.samples)[-DOWN_FRAMES:]) / DOWN_FRAMES
+        if recent > self.budget * OVER_BUDGET:
+            if self.last_raise is not None and self.frames - self.last_raise <= self.up_frames:
+                # The last raise didn't fit: wait longer before trying again
+                self.up_frames = min(self.up_frames * BACKOFF, MAX_UP_FRAMES)
+            self.last_raise = None
+            return self._step(recent, OVER_BUDGET, QUALITY_ORDER, -1)
+        if count >= self.up_frames and sum(self.samples) / count < self.budget * UNDER_BUDGET:
+            decision = self._step(sum(self.samples) / count, UNDER_BUDGET, reversed(QUALITY_ORDER), 1)
+            if decision is not None:
+                self.last_raise = self.frames
+            return decision
+        return None
+
+    def _step(self, mean, share, order, direction):
+        # share: the part of the budget mean was compared with
+        for name in order:
+            level = self.level[name] + direction
+            if self.floor[name] <= level <= self.ceiling[name]:
+                decision = QualityDecision(self.frames, mean * 1000.0, self.budget * 1000.0,
+                                           self.budget * share * 1000.0, name, self[name],
+                                           QUALITY_STEPS[name][level])
+                self.level[name] = level
+                self.decisions.append(decision)
+                self.samples.clear()
+                if self.log:
+                    self.log(decision)
+                return decision
+        # Nothing left to turn: keep measuring
+        self.samples.clear()
+        return None
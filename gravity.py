@@ -0,0 +1,384 @@
+from concurrent.futures import ProcessPoolExecutor
+from multiprocessing import shared_memory
+
+import numpy as np
+
+# Like simulation.py, nothing here may import pygame or OpenGL.
+
+# Gravitational parameters (G * mass) in world units: distance^3 / s^2.
+# The Sun's gives the belt (r ~ 310) about the angular speed the circular
+# orbits of AsteroidField had.
+SUN_GM = 8.0e4
+# Beats full thrust at the event horizon, yet barely disturbs the belt
+BLACK_HOLE_GM = 2.5e5
+# Catalog bodies without a "mass" get one from their volume
+PLANET_GM_PER_VOLUME = 0.002
+# Asteroids are far lighter; their pull on each other is what the tree is for
+ASTEROID_GM_PER_VOLUME = 0.001
+
+# Barnes-Hut opening angle: a cell is used whole when size / distance is
+# below it. Must stay under 1/sqrt(3), or a cell could be used whole by a
+# body inside it.
+THETA = 0.5
+# Levels of the octree (1024^3 cells at the bottom) and the most bodies a
+# cell holds before it is split; leaf cells are summed body by body
+TREE_DEPTH = 10
+LEAF_SIZE = 8
+# Most bodies in a group: neighbouring bodies that walk the tree together
+GROUP_SIZE = 16
+# Plummer softening between free bodies, so close passes don't blow up
+SOFTENING = 1.0
+# Bodies evaluated together in one traversal; bounds the pair arrays
+CHUNK_SIZE = 4096
+
+# --------------------------
+# Linear octree over Morton-sorted bodies
+# --------------------------
+def _spread_bits(v):
+    # 10-bit integers -> every third bit of a 30-bit one
+    v = v & 0x3ff
+    v = (v | v << 16) & 0x30000ff
+    v = (v | v << 8) & 0x300f00f
+    v = (v | v << 4) & 0x30c30c3
+    v = (v | v << 2) & 0x9249249
+    return v
+
+class Octree:
+    # Sorting the bodies by Morton code puts every cell's bodies in one
+    # contiguous run, so each level is found with one diff over the sorted
+    # keys and its masses and centers of mass with np.add.reduceat; no
+    # per-node Python. Level l holds the non-empty cells of edge size / 2^l.
+    def __init__(self, positions, masses, depth=TREE_DEPTH, leaf_size=LEAF_SIZE, group_size=GROUP_SIZE):
+        n = len(positions)
+        low = positions.min(axis=0)
+        self.size = float((positions.max(axis=0) - low).max()) * (1 + 1e-9) or 1.0
+        cells = 1 << depth
+        grid = np.minimum(((positions - low) * (cells / self.size)).astype(np.int64), cells - 1)
+        keys = _spread_bits(grid[:, 0]) << 2 | _spread_bits(grid[:, 1]) << 1 | _spread_bits(grid[:, 2])
+        self.order = np.argsort(keys, kind="stable")
+        keys = keys[self.order]
+        self.positions = positions[self.order]
+        self.masses = masses[self.order]
+        weighted = self.positions * self.masses[:, None]
+
+        # Per level: first body, body count, mass, center of mass, whether
+        # it is a leaf, and the range of its children on the next level
+        self.levels = []
+        prefixes = []
+        for level in range(depth + 1):
+            prefix = keys >> (3 * (depth - level))
+            start = np.flatnonzero(np.r_[True, prefix[1:] != prefix[:-1]])
+            count = np.diff(np.r_[start, n])
+            mass = np.add.reduceat(self.masses, start)
+            center = np.add.reduceat(weighted, start)
+            # Massless cells (UFOs only, say) pull nothing; any center will do
+            center /= np.where(mass > 0, mass, 1.0)[:, None]
+            self.levels.append({"start": start, "count": count, "mass": mass, "center": center,
+                                "leaf": (count <= leaf_size) | (level == depth),
+                                "edge": self.size / (1 << level)})
+            prefixes.append(prefix[start])
+        for level in range(depth):
+            parents = prefixes[level + 1] >> 3
+            self.levels[level]["children"] = (np.searchsorted(parents, prefixes[level], "left"),
+                                              np.searchsorted(parents, prefixes[level], "right"))
+
+        # Groups: the largest cells of at most group_size bodies. They split
+        # the sorted bodies into compact runs that walk the tree together.
+        starts, counts = [], []
+        big_parent = np.ones(1, dtype=bool)
+        for index, level in enumerate(self.levels):
+            small = level["count"] <= group_size
+            starts.append(level["start"][small & big_parent])
+            counts.append(level["count"][small & big_parent])
+            if "children" in level:
+                lo, hi = level["children"]
+                big_parent = np.repeat(~small, hi - lo)
+        order = np.argsort(np.concatenate(starts))
+        self.group_start = np.concatenate(starts)[order]
+        self.group_count = np.concatenate(counts)[order]
+
+    def chunks(self, size=CHUNK_SIZE):
+        # Ranges of groups with about size bodies each
+        bounds = np.searchsorted(self.group_start, np.arange(size, len(self.positions), size))
+        bounds = np.unique(np.r_[0, bounds, len(self.group_start)])
+        return list(zip(bounds[:-1].tolist(), bounds[1:].tolist()))
+
+    def bodies(self, first, last):
+        # Original indices of the bodies of groups first:last, in sorted order
+        return self.order[self.group_start[first]:self.group_start[last - 1] + self.group_count[last - 1]]
+
+    def accelerations(self, first, last, theta=THETA, softening=SOFTENING):
+        # Acceleration on the bodies of groups first:last, in sorted order.
+        # Every (group, cell) pair of a level is tested at once: a cell far
+        # from the whole group is applied to it as a field with a gradient
+        # about the group's center, a near cell much larger than the group
+        # is replaced by its children on the next level, and any other near
+        # cell is handed to the group's bodies one by one. Their (body, cell)
+        # pairs go the same way: far cells whole, near leaves body by body,
+        # other near cells split.
+        group_count = self.group_count[first:last]
+        base = self.group_start[first]
+        group_start = self.group_start[first:last] - base
+        targets = self.positions[base:base + int(group_count.sum())]
+        owner = np.repeat(np.arange(len(group_start)), group_count)
+        centers = np.add.reduceat(targets, group_start) / group_count[:, None]
+        offsets = targets - centers[owner]
+        radius = np.sqrt(np.maximum.reduceat(np.einsum("ij,ij->i", offsets, offsets), group_start))
+
+        field = np.zeros((len(group_start), 3))
+        gradient = np.zeros((len(group_start), 3, 3))
+        acc = np.zeros((len(targets), 3))
+        group = np.arange(len(group_start))
+        cell = np.zeros(len(group), dtype=np.intp)
+        body = body_cell = np.zeros(0, dtype=np.intp)
+        theta2, eps2 = theta * theta, softening * softening
+        for level in self.levels:
+            leaves = level["leaf"]
+            if len(group):
+                d = level["center"][cell] - centers[group]
+                r = np.sqrt(np.einsum("ij,ij->i", d, d))
+                far = level["edge"] < theta * (r - radius[group])
+                _expansion(field, gradient, group[far], d[far], r[far], level["mass"][cell[far]])
+                split = ~far & ~leaves[cell] & (level["edge"] > 2 * radius[group])
+                handed = ~far & ~split
+                cells, bodies = _expand(cell[handed], group_start[group[handed]], group_count[group[handed]])
+                body, body_cell = np.r_[body, bodies], np.r_[body_cell, cells]
+                group, cell = group[split], cell[split]
+
+            if len(body):
+                d = level["center"][body_cell] - targets[body]
+                r2 = np.einsum("ij,ij->i", d, d)
+                far = level["edge"] ** 2 < theta2 * r2
+                _pull(acc, body[far], d[far], r2[far] + eps2, level["mass"][body_cell[far]])
+                leaf = ~far & leaves[body_cell]
+                if leaf.any():
+                    bodies, sources = _expand(body[leaf], level["start"][body_cell[leaf]],
+                                              level["count"][body_cell[leaf]])
+                    d = self.positions[sources] - targets[bodies]
+                    r2 = np.einsum("ij,ij->i", d, d) + eps2
+                    _pull(acc, bodies, d, r2, self.masses[sources])
+                split = ~far & ~leaves[body_cell]
+                body, body_cell = body[split], body_cell[split]
+
+            if "children" not in level or not (len(group) or len(body)):
+                break
+            lo, hi = level["children"]
+            group, cell = _expand(group, lo[cell], hi[cell] - lo[cell])
+            body, body_cell = _expand(body, lo[body_cell], hi[body_cell] - lo[body_cell])
+        return acc + field[owner] + np.einsum("ijk,ik->ij", gradient[owner], offsets)
+
+def _expand(owners, starts, counts):
+    # Each owner repeated counts times, paired with starts .. starts + counts
+    total = int(counts.sum())
+    offsets = np.arange(total) - np.repeat(np.cumsum(counts) - counts, counts)
+    return np.repeat(owners, counts), np.repeat(starts, counts) + offsets
+
+def _expansion(field, gradient, group, d, r, mass):
+    # Field of point masses at d from the group centers, and its gradient
+    # M (3 d d^T / r^5 - I / r^3), to first order across each group
+    if not len(group):
+        return
+    inv3 = mass / (r * r * r)
+    for axis in range(3):
+        field[:, axis] += np.bincount(group, weights=d[:, axis] * inv3, minlength=len(field))
+    inv5 = 3 * inv3 / (r * r)
+    for i in range(3):
+        for j in range(i, 3):
+            w = d[:, i] * d[:, j] * inv5
+            if i == j:
+                w = w - inv3
+            gradient[:, i, j] += np.bincount(group, weights=w, minlength=len(field))
+            if i != j:
+                gradient[:, j, i] = gradient[:, i, j]
+
+def _pull(acc, body, d, r2, mass):
+    # acc[body] += mass * d / r^3, summed with bincount (much faster than np.add.at)
+    if not len(body):
+        return
+    w = mass / (r2 * np.sqrt(r2))
+    for axis in range(3):
+        acc[:, axis] += np.bincount(body, weights=d[:, axis] * w, minlength=len(acc))
+
+# --------------------------
+# Optional worker processes for the force pass
+# --------------------------
+# Positions and masses go through shared memory; every worker builds the
+# (cheap) tree itself and evaluates its share of the chunks, so no tree is
+# pickled. A pass runs in the background while the caller keeps stepping.
+_shared = {}
+
+def _attach(names, count):
+    for key, shape in (("positions", (count, 3)), ("masses", (count,)), ("acc", (count, 3))):
+        block = shared_memory.SharedMemory(name=names[key])
+        _shared[key] = (block, np.ndarray(shape, dtype=np.float64, buffer=block.buf))
+
+def _work(worker, workers, theta):
+    positions, masses, acc = (_shared[key][1] for key in ("positions", "masses", "acc"))
+    tree = Octree(positions, masses)
+    for first, last in tree.chunks()[worker::workers]:
+        acc[tree.bodies(first, last)] = tree.accelerations(first, last, theta)
+
+class ForcePool:
+    def __init__(self, count, workers, theta=THETA):
+        self.blocks = {}
+        self.arrays = {}
+        for key, shape in (("positions", (count, 3)), ("masses", (count,)), ("acc", (count, 3))):
+            block = shared_memory.SharedMemory(create=True, size=max(8, int(np.prod(shape)) * 8))
+            self.blocks[key] = block
+            self.arrays[key] = np.ndarray(shape, dtype=np.float64, buffer=block.buf)
+        self.workers = workers
+        self.theta = theta
+        self.futures = []
+        self.executor = ProcessPoolExecutor(workers, initializer=_attach,
+                                            initargs=({k: b.name for k, b in self.blocks.items()}, count))
+
+    def start(self, positions, masses):
+        # The workers only read the snapshot taken here
+        self.arrays["positions"][:] = positions
+        self.arrays["masses"][:] = masses
+        self.futures = [self.executor.submit(_work, i, self.workers, self.theta) for i in range(self.workers)]
+
+    def result(self):
+        for future in self.futures:
+            future.result()
+        self.futures = []
+        return self.arrays["acc"].copy()
+
+    def close(self):
+        self.executor.shutdown(cancel_futures=True)
+        for block in self.blocks.values():
+            block.close()
+            block.unlink()
+
+# --------------------------
+# Free bodies under the pull of each other and of a few massive ones
+# --------------------------
+# Steps over which one full pass of the free bodies' pull on each other is
+# spread, a chunk per step; the attractors' pull is exact every step
+REFRESH_STEPS = 30
+
+class GravitySystem:
+    # Free bodies (asteroids, UFOs) pull on each other through the tree
+    # and feel the massive attractors (Sun, planets, black hole) exactly;
+    # the attractors move on their own (see Scene) and are not pulled back.
+    # Integrated with kick-drift-kick leapfrog, which is symplectic: orbits
+    # keep their energy over long runs instead of spiralling in or out.
+    # The free bodies' pull on each other is a small, slowly changing part
+    # of the whole, so it is refreshed a few chunks per step (or by worker
+    # processes in the background) rather than in full every step.
+    def __init__(self, positions, velocities, masses, attractor_gm, attractor_radius,
+                 theta=THETA, workers=0, refresh_steps=REFRESH_STEPS):
+        self.positions = np.array(positions, dtype=np.float64)
+        self.velocities = np.array(velocities, dtype=np.float64)
+        self.masses = np.array(masses, dtype=np.float64)
+        self.attractor_gm = np.asarray(attractor_gm, dtype=np.float64)
+        # Attractors pull as solid spheres: exactly outside their radius,
+        # falling off linearly inside, so flying through a planet is no
+        # singularity
+        self.attractor_radius = np.asarray(attractor_radius, dtype=np.float64)
+        self.theta = theta
+        self.refresh_steps = max(1, refresh_steps)
+        self.mutual = np.zeros_like(self.positions)
+        self.tree = None
+        self.pending = [] # Chunks of the current pass still to evaluate
+        self.refreshes = 0 # Calls to _refresh_mutual so far
+        self.pool = None
+        if workers >= 1 and self.masses.any():
+            self.pool = ForcePool(len(self.positions), workers, theta)
+            # The first pass is waited for, so the first steps aren't without it
+            self.pool.start(self.positions, self.masses)
+            self.mutual = self.pool.result()
+        self.acc = None
+
+    def attraction(self, points, attractors):
+        # Exact pull of the attractors on any points, e.g. the rocket. The
+        # sun stays put at the origin, so what pulls on it is taken off
+        # everything else (the indirect term of heliocentric coordinates);
+        # otherwise a far black hole would drag the whole belt away.
+        points = np.concatenate([np.zeros((1, 3)), points])
+        d = attractors[None, :, :] - points[:, None, :]
+        r = np.maximum(np.sqrt(np.einsum("ijk,ijk->ij", d, d)), self.attractor_radius)
+        acc = np.einsum("ijk,ij->ik", d, self.attractor_gm / (r * r * r))
+        return acc[1:] - acc[0]
+
+    def _refresh_mutual(self):
+        if not len(self.positions) or not self.masses.any():
+            return
+        if self.pool is not None:
+            # A pass is collected every refresh_steps steps, waiting for it
+            # if need be, never when it happens to be done: the steps it
+            # lands on don't depend on the machine, so a recording under
+            # worker processes replays the same (see replay.py)
+            if self.refreshes % self.refresh_steps == 0:
+                self.mutual = self.pool.result()
+                self.pool.start(self.positions, self.masses)
+            self.refreshes += 1
+            return
+        if not self.pending:
+            self._start_pass(self.positions)
+        first, last = self.pending.pop(0)
+        self.mutual[self.tree.bodies(first, last)] = self.tree.accelerations(first, last, self.theta)
+
+    def _start_pass(self, positions):
+        # A new tree, evaluated a chunk per step over about refresh_steps steps
+        self.tree = Octree(positions, self.masses)
+        size = -(-len(positions) // self.refresh_steps)
+        self.pending = self.tree.chunks(min(size, CHUNK_SIZE))
+
+    def accelerations(self, attractors):
+        self._refresh_mutual()
+        return self.attraction(self.positions, attractors) + self.mutual
+
+    def step(self, dt, attractors):
+        # attractors: their positions at the end of the step. The closing
+        # kick's accelerations are kept for the next step's opening kick,
+        # so each step costs one force evaluation.
+        if self.acc is None:
+            self.acc = self.accelerations(attractors)
+        self.velocities += self.acc * (0.5 * dt)
+        self.positions += self.velocities * dt
+        self.acc = self.accelerations(attractors)
+        self.velocities += self.acc * (0.5 * dt)
+
+    def state(self):
+        # Everything the next steps depend on, copied (see World.state): the
+        # bodies, the forces in use and the pass under way, kept as the
+        # positions it started from
+        state = {"positions": self.positions.copy(), "velocities": self.velocities.copy(),
+                 "mutual": self.mutual.copy(), "acc": None if self.acc is None else self.acc.copy(),
+                 "refreshes": self.refreshes, "pass": None, "pending": len(self.pending)}
+        if self.pool is not None:
+            if self.pool.futures:
+                state["pass"] = self.pool.arrays["positions"].copy()
+        elif self.pending:
+            # The tree keeps them sorted
+            state["pass"] = np.empty_like(self.tree.positions)
+            state["pass"][self.tree.order] = self.tree.positions
+        return state
+
+    def restore(self, state):
+        self.positions[:] = state["positions"]
+        self.velocities[:] = state["velocities"]
+        self.mutual = state["mutual"].copy()
+        self.acc = None if state["acc"] is None else state["acc"].copy()
+        self.refreshes = state["refreshes"]
+        self.tree = None
+        self.pending = []
+        if self.pool is not None:
+            # The pass under way is dropped for the saved one
+            self.pool.result()
+            if state["pass"] is not None:
+                self.pool.start(state["pass"], self.masses)
+        elif state["pass"] is not None:
+            self._start_pass(state["pass"])
+            self.pending = self.pending[len(self.pending) - state["pending"]:]
+
+    def place(self, index, position, velocity):
+        # Move one body by hand (a UFO starting a new pass, say)
+        self.positions[index] = position
+        self.velocities[index] = velocity
+
+    def close(self):
+        if self.pool is not None:
+            self.pool.close()
+            self.pool = None
@@ -0,0 +1,91 @@
+import math
+
+import numpy as np
+
+# --------------------------
+# Tessellation tables, coarsest level first
+# --------------------------
+# Each level pairs a (slices, stacks) tessellation with the projected radius
+# in pixels from which it is used
+SPHERE_LEVELS = [(8, 6), (12, 8), (20, 14), (32, 24), (50, 50)]
+SPHERE_THRESHOLDS = [0, 4, 12, 40, 120]
+
+# Asteroids never get close enough to need a planet-sized mesh
+ASTEROID_LEVELS = [(6, 4), (10, 6), (16, 12), (24, 16)]
+ASTEROID_THRESHOLDS = [0, 3, 10, 30]
+
+# Texcoords are linear across a ring, so a single loop is exact
+RING_LEVELS = [(12, 1), (20, 1), (32, 1), (50, 1), (72, 1)]
+RING_THRESHOLDS = [0, 6, 20, 60, 160]
+
+# The UFO saucer was never finer than 30x10
+UFO_LEVELS = [(10, 4), (16, 6), (30, 10)]
+UFO_THRESHOLDS = [0, 8, 30]
+
+# --------------------------
+# Projection parameters and per-frame triangle counts
+# --------------------------
+class LevelOfDetail:
+    def __init__(self, fov_y, viewport_height, hysteresis=0.2):
+        self.hysteresis = hysteresis
+        # Scales every projected radius: below 1, objects drop to coarser
+        # levels sooner (see governor.py)
+        self.detail = 1.0
+        self.set_projection(fov_y, viewport_height)
+        self.triangles = 0
+        self.full_triangles = 0
+        # Totals of the last finished frame
+        self.frame_triangles = 0
+        self.frame_full_triangles = 0
+
+    def set_projection(self, fov_y, viewport_height):
+        # Pixels covered by one unit of radius at a distance of one unit
+        self.pixel_scale = viewport_height / 2.0 / math.tan(math.radians(fov_y) / 2.0)
+
+    def screen_radius(self, radius, distance):
+        # Works on scalars and arrays; anything around the eye covers the screen
+        return radius * (self.pixel_scale * self.detail) / np.maximum(distance, 1e-3)
+
+    def selector(self, levels, thresholds):
+        return LODSelector(self, levels, thresholds)
+
+    def count(self, triangles, full_triangles):
+        # full_triangles is what the fixed 50x50 tessellation would have cost
+        self.triangles += triangles
+        self.full_triangles += full_triangles
+
+    def end_frame(self):
+        self.frame_triangles, self.frame_full_triangles = self.triangles, self.full_triangles
+        self.triangles = self.full_triangles = 0
+
+# --------------------------
+# Pick a level from the projected radius, with hysteresis against popping
+# --------------------------
+class LODSelector:
+    def __init__(self, lod, levels, thresholds):
+        self.lod = lod
+        self.levels = levels
+        thresholds = np.asarray(thresholds, dtype=np.float64)
+        # A level is entered above its threshold widened by the hysteresis
+        # band and only left again once below the narrowed threshold
+        self.up = thresholds * (1 + lod.hysteresis)
+        self.down = thresholds * (1 - lod.hysteresis)
+        self.current = {}
+
+    def select(self, key, radius, distance):
+        screen_radius = self.lod.screen_radius(radius, distance)
+        level = self.current.get(key)
+        up = int(np.searchsorted(self.up, screen_radius, side="right")) - 1
+        down = int(np.searchsorted(self.down, screen_radius, side="right")) - 1
+        level = up if level is None else min(max(level, up), down)
+        self.current[key] = level
+        return self.levels[level]
+
+    def select_many(self, current, radii, distances):
+        # Vectorized variant; `current` holds the previous level per object
+        # and is updated in place
+        screen_radii = self.lod.screen_radius(radii, distances)
+        up = np.searchsorted(self.up, screen_radii, side="right") - 1
+        down = np.searchsorted(self.down, screen_radii, side="right") - 1
+        np.clip(current, up, down, out=current)
+        return current
@@ -1,469 +1,496 @@
+import argparse
 import pygame
 from pygame.locals import *
 from OpenGL.GL import *
-from OpenGL.GLU import *
+from OpenGL.GLU import GLU_INSIDE, GLU_OUTSIDE
 import math
-import time
+import os
 import sys
-from PIL import Image
+import time
 import random
-
+import numpy as np
+
+from culling import Frustum
+from export import FrameExporter
+from governor import QUALITY_PRESETS, QUALITY_STEPS, QualityGovernor
+from lod import *
+from meshes import MeshCache
+from models import Model, bake_rocket, bake_ufo, baked_parts, load_model_parts
+from orbits import OrbitRenderer
+from overlay import OverlayBatch
+from profiler import FrameProfiler, ProfilerPanel
+from rendertarget import RenderTarget
+from replay import Recorder, Replay
+from renderer import WHITE, FixedFunctionRenderer, ShaderRenderer
+from renderqueue import RenderQueue
+from scenarios import BENCHMARK_DT, SCENARIOS
+from scene import Scene, load_catalog
+from simthread import SimulationThread
+from starfield import StarCatalog, StarField, build_synthetic_catalog
+from swarm import swarm_matrices
+from simulation import CURSOR_H, CURSOR_W, Inputs, World
+from textures import TextureManager
+from transforms import look_at, ortho_2d, perspective, rotate, scale, translate
+
+parser = argparse.ArgumentParser(description="Interactive 3D solar system")
+parser.add_argument("--renderer", choices=("shader", "fixed"), default="shader",
+                    help="shader: core profile with VAOs and GLSL (default); "
+                         "fixed: the legacy fixed-function pipeline")
+parser.add_argument("--profile", metavar="PATH",
+                    help="on exit, write per-section frame timings to PATH (.json or .csv)")
+parser.add_argument("--scenario", choices=sorted(SCENARIOS),
+                    help="run a scripted, seeded benchmark scenario with a fixed time step "
+                         "instead of live input, then exit (see benchmark.py)")
+parser.add_argument("--scene", default="scene.json", metavar="PATH",
+                    help="catalog of planets, moons and rings to load (.json, or .toml on Python 3.11+)")
+parser.add_argument("--size", metavar="WxH",
+                    help="open a window of this size instead of going fullscreen")
+parser.add_argument("--epoch", type=float, default=0.0, metavar="SECONDS",
+                    help="start the planets at this point of their orbits, in seconds of world time")
+parser.add_argument("--gravity", action="store_true",
+                    help="real N-body gravity: asteroids and UFOs are pulled by the sun, planets, "
+                         "black hole and each other, and so is the rocket")
+parser.add_argument("--gravity-workers", type=int, default=0, metavar="N",
+                    help="with --gravity, compute the asteroids' pull on each other in N worker "
+                         "processes, off the main loop")
+parser.add_argument("--asteroids", type=int, default=None, metavar="N",
+                    help="number of asteroids in the belt (default: 200)")
+parser.add_argument("--swarm", type=int, default=0, metavar="N",
+                    help="add a swarm of N small UFOs that steer towards the sun, around each other "
+                         "and clear of the sun and the black hole (see swarm.py)")
+parser.add_argument("--quality", choices=("off",) + tuple(QUALITY_PRESETS),
+                    help="how far the quality governor may lower resolution, tessellation, asteroids, "
+                         "orbit glow and smoke to hold --target-fps (default: balanced; off for --scenario, and always off for exports)")
+parser.add_argument("--target-fps", type=float, default=60.0, metavar="FPS",
+                    help="frame rate the quality governor aims for (default: 60)")
+parser.add_argument("--record", metavar="PATH",
+                    help="write the world's seed and every simulation step's input to PATH, to be "
+                         "played back with --replay or python replay.py")
+parser.add_argument("--snapshots", action="store_true",
+                    help="with --record, also save the rocket and UFOs after every step, so a "
+                         "replay can be checked against the original step by step")
+parser.add_argument("--replay", metavar="PATH",
+                    help="play back a session recorded with --record instead of taking input")
+parser.add_argument("--replay-from", type=int, default=0, metavar="STEP",
+                    help="with --replay, start at this simulation step")
+parser.add_argument("--export", metavar="DIR",
+                    help="render every frame offscreen at a fixed time step and write it to DIR "
+                         "as a PNG sequence (frame_000000.png, ...)")
+parser.add_argument("--export-pipe", metavar="COMMAND",
+                    help="like --export, but pipe raw RGBA frames, top row first, into COMMAND's standard "
+                         "input; {width}, {height} and {fps} are filled in, e.g. \"ffmpeg -f rawvideo "
+                         "-pix_fmt rgba -s {width}x{height} -r {fps} -i - out.mp4\"")
+parser.add_argument("--export-size", default="1920x1080", metavar="WxH",
+                    help="resolution of exported frames (default: 1920x1080); the window shows a preview")
+parser.add_argument("--export-fps", type=int, default=60, metavar="FPS",
+                    help="frame rate of the export: each frame steps the world by 1/FPS seconds "
+                         "(scenarios and replays keep their own step)")
+parser.add_argument("--export-frames", type=int, metavar="N",
+                    help="stop after exporting N frames (default: at the end of the scenario or "
+                         "replay, or on Escape)")
+parser.add_argument("--stars", metavar="PATH",
+                    help="draw the sky from a binary star catalog (see starfield.py; a synthetic one "
+                         "is built at PATH if there is none) instead of the textured sky sphere")
+parser.add_argument("--rocket-model", metavar="PATH",
+                    help="draw the rocket from an OBJ or glTF file (or a model file from models.py) in units "
+                         "of its size, pointing along +z with its nozzle at z = -0.1")
+parser.add_argument("--ufo-model", metavar="PATH",
+                    help="draw the UFOs from an OBJ or glTF file (or a model file from models.py) in units "
+                         "of their size")
+args = parser.parse_args()
+if args.scenario and (args.record or args.replay):
+    parser.error("scenarios are already repeatable; --record and --replay are for live sessions")
+if args.export and args.export_pipe:
+    parser.error("--export and --export-pipe are alternatives")
+if (args.export or args.export_pipe) and args.quality not in (None, "off"):
+    # Exports run at full quality: the governor's frame times mean nothing
+    # offline, and its lower-resolution pass would draw around the export's framebuffer
+    parser.error("--export and --export-pipe render at full quality; --quality must be off")
+scenario = SCENARIOS[args.scenario] if args.scenario else None
+exporting = bool(args.export or args.export_pipe)
 
 pygame.init()
 
-# Get screen dimensions for fullscreen
-info = pygame.display.Info()
-width, height = info.current_w, info.current_h
-pygame.display.set_mode((width, height), DOUBLEBUF | OPENGL | FULLSCREEN)
+# A window for previewing exports when no size is given
+EXPORT_PREVIEW_SIZE = (1280, 720)
+
+if args.size:
+    width, height = map(int, args.size.lower().split("x"))
+    window_flags = DOUBLEBUF | OPENGL
+elif exporting:
+    width, height = EXPORT_PREVIEW_SIZE
+    window_flags = DOUBLEBUF | OPENGL
+else:
+    # Get screen dimensions for fullscreen
+    info = pygame.display.Info()
+    width, height = info.current_w, info.current_h
+    window_flags = DOUBLEBUF | OPENGL | FULLSCREEN
+# Exports draw everything at the export size; the window only previews them
+window_width, window_height = width, height
+if exporting:
+    width, height = map(int, args.export_size.lower().split("x"))
+
+# --------------------------
+# Open the window with the chosen renderer
+# --------------------------
+def open_window(core):
+    # pygame's names, not the same-named GL enums pulled in by OpenGL.GL
+    if core:
+        pygame.display.gl_set_attribute(pygame.GL_CONTEXT_MAJOR_VERSION, 3)
+        pygame.display.gl_set_attribute(pygame.GL_CONTEXT_MINOR_VERSION, 3)
+        pygame.display.gl_set_attribute(pygame.GL_CONTEXT_PROFILE_MASK, pygame.GL_CONTEXT_PROFILE_CORE)
+    else:
+        # Back to whatever legacy context the driver hands out
+        pygame.display.gl_set_attribute(pygame.GL_CONTEXT_MAJOR_VERSION, 0)
+        pygame.display.gl_set_attribute(pygame.GL_CONTEXT_MINOR_VERSION, 0)
+        pygame.display.gl_set_attribute(pygame.GL_CONTEXT_PROFILE_MASK, 0)
+    pygame.display.set_mode((window_width, window_height), window_flags)
+
+renderer = None
+if args.renderer == "shader":
+    try:
+        open_window(core=True)
+        renderer = ShaderRenderer()
+    except (pygame.error, RuntimeError) as e:
+        print(f"Warning: Core profile renderer unavailable ({e}). Falling back to fixed-function rendering.")
+        # Start over so the next window gets a fresh (compatibility) context
+        pygame.display.quit()
+        pygame.display.init()
+if renderer is None:
+    open_window(core=False)
+    renderer = FixedFunctionRenderer()
 
 # Hide the default mouse cursor
 pygame.mouse.set_visible(False)
 
 glEnable(GL_DEPTH_TEST)
-glEnable(GL_TEXTURE_2D)
 glEnable(GL_BLEND)
 glBlendFunc(GL_SRC_ALPHA, GL_ONE_MINUS_SRC_ALPHA)
 
-glMatrixMode(GL_PROJECTION)
-gluPerspective(45, width / height, 0.1, 2000)
-glMatrixMode(GL_MODELVIEW)
+FOV_Y = 45
+projection = perspective(FOV_Y, width / height, 0.1, 2000)
+# Camera of the current frame, set in the main loop
+view = np.eye(4)
+
+# --------------------------
+# Planets, moons and rings
+# --------------------------
+# Loaded from the catalog into flat arrays; every world matrix of the
+# hierarchy is computed in one vectorized pass per frame
+# A replay brings its own world, planets included
+replay = Replay(args.replay) if args.replay else None
+if replay is not None and replay.scene_path:
+    args.scene = replay.scene_path
+catalog = load_catalog(args.scene)
+# The planets as drawn; the world steps its own copy on the simulation thread
+scene = Scene(catalog)
 
 # --------------------------
-# Load a texture from image
+# Rocket and UFO models
 # --------------------------
-def load_texture(filename):
+# Baked once from the procedural builders (or converted once from a model
+# file) and cached as binary models under .model_cache, which later runs
+# map and upload without parsing; the UFO has one model per LOD level
+def load_ship(path, kind):
     try:
-        img = Image.open(filename)
-    except FileNotFoundError:
-        print(f"Error: Texture file not found at '{filename}'. Creating a placeholder.")
-        # Create a white placeholder texture
-        img = Image.new('RGBA', (256, 256), (255, 255, 255, 255))
-    img = img.transpose(Image.FLIP_TOP_BOTTOM)
-    img_data = img.convert("RGBA").tobytes()
-
-    texture_id = glGenTextures(1)
-    glBindTexture(GL_TEXTURE_2D, texture_id)
-
-    glTexParameteri(GL_TEXTURE_2D, GL_TEXTURE_MIN_FILTER, GL_LINEAR)
-    glTexParameteri(GL_TEXTURE_2D, GL_TEXTURE_MAG_FILTER, GL_LINEAR)
-    
-    glTexImage2D(GL_TEXTURE_2D, 0, GL_RGBA, img.width, img.height,
-                 0, GL_RGBA, GL_UNSIGNED_BYTE, img_data)
+        return load_model_parts(path)
+    except (OSError, ValueError, KeyError, IndexError) as e:
+        print(f"Warning: Could not load the {kind} model '{path}': {e}. Using the built-in one.")
+        return None
+
+rocket_parts = load_ship(args.rocket_model, "rocket") if args.rocket_model else None
+if rocket_parts is None:
+    rocket_parts = baked_parts("rocket", bake_rocket)
+ufo_part_levels = [load_ship(args.ufo_model, "UFO")] if args.ufo_model else [None]
+if ufo_part_levels[0] is None:
+    ufo_part_levels = [baked_parts("ufo", bake_ufo, slices, stacks) for slices, stacks in UFO_LEVELS]
+# Textures the model files bring are known by their paths; the baked ships
+# name built-in ones ("Metal"), which the table below maps to their files
+model_textures = {part.texture: part.texture for parts in [rocket_parts] + ufo_part_levels for part in parts
+                  if part.texture}
 
-    return texture_id
 # --------------------------
 # Load textures
 # --------------------------
-textures = {
-    "Sun": load_texture("2k_sun.jpg"),
-    "Mercury": load_texture("2k_mercury.jpg"),
-    "Venus": load_texture("2k_venus_surface.jpg"),
-    "Earth": load_texture("2k_earth_daymap.jpg"),
-    "Mars": load_texture("2k_mars.jpg"),
-    "Jupiter": load_texture("2k_jupiter.jpg"),
-    "Saturn": load_texture("2k_saturn.jpg"),
-    "Uranus": load_texture("2k_uranus.jpg"),
-    "Neptune": load_texture("2k_neptune.jpg"),
-    "Stars": load_texture("2k_stars_milky_way.jpg"),
-    "Saturn_Ring": load_texture("2k_saturn_ring.png"),
-    "Moon": load_texture("2k_moon.jpg"),
-    "Phobos": load_texture("phobos.jpg"),
-    "Deimos": load_texture("deimos.jpg"),
-    "Rocket": load_texture("rocket.png"),
-    "Metal": load_texture("metal_texture.jpg"), # Using phobos texture as a metallic-looking fallback
-    "BlackHole": load_texture("black_hole.png"),
-}
+# Resident texture memory allowed before rarely used textures (the black
+# hole, rocket metal and cursor sprite) are evicted and reloaded on demand
+TEXTURE_BUDGET_MB = 256
+
+# Images are decoded on worker threads (or mapped from the decoded-pixel
+# cache on warm starts); only the GL upload happens on this thread
+textures = TextureManager({
+    **model_textures, # First, so the built-in names keep their files
+    "Sun": "2k_sun.jpg",
+    "Stars": "2k_stars_milky_way.jpg",
+    "Phobos": "phobos.jpg", # Also used for every asteroid
+    "Rocket": "rocket.png",
+    "Metal": "metal_texture.jpg", # Using phobos texture as a metallic-looking fallback
+    "BlackHole": "black_hole.png",
+    **scene.textures,
+}, budget=TEXTURE_BUDGET_MB * 1024 * 1024)
+textures.preload()
+
+# Unit spheres, disks and cylinders are tessellated once and shared by every draw call
+mesh_cache = MeshCache()
+# Meshes are queued as they are found visible and drawn sorted by texture,
+# mesh and depth at the end of the 3D pass
+render_queue = RenderQueue(renderer)
+rocket_model = Model(rocket_parts)
+ufo_models = [Model(parts) for parts in ufo_part_levels]
+# Streams the whole 2D UI pass out in a handful of draw calls
+overlay = OverlayBatch(renderer.core)
+orbit_renderer = OrbitRenderer(renderer.core)
+
+# Point sprites at infinity from a memory-mapped star catalog, brightest
+# first; how faint they go follows the quality governor
+star_field = None
+if args.stars:
+    if not os.path.exists(args.stars):
+        print(f"Building a synthetic star catalog at '{args.stars}'")
+        build_synthetic_catalog(args.stars)
+    try:
+        star_field = StarField(StarCatalog(args.stars), renderer.core, QUALITY_STEPS["stars"][-1])
+    except RuntimeError as e:
+        print(f"Warning: {e}. Drawing the textured sky sphere instead.")
+
+# Tessellation follows the projected size of each object
+lod = LevelOfDetail(FOV_Y, height)
+sphere_lod = lod.selector(SPHERE_LEVELS, SPHERE_THRESHOLDS)
+ring_lod = lod.selector(RING_LEVELS, RING_THRESHOLDS)
+# Picks among the UFO models directly; a model file has a single level
+ufo_lod = lod.selector(ufo_models, UFO_THRESHOLDS[:len(ufo_models)])
+asteroid_lod = lod.selector(ASTEROID_LEVELS, ASTEROID_THRESHOLDS)
+
+# Bodies whose bounding sphere is outside the view are not submitted at all
+frustum = Frustum()
+
+# CPU and GPU time, draw calls and vertices of each stage of the main loop
+profiler = FrameProfiler([renderer, renderer.state, renderer.instanced, orbit_renderer, overlay] +
+                         ([star_field] if star_field is not None else []))
+profiler_panel = None # Created the first time P is pressed
+
+# Watches frame times and gives up quality, within the preset's floors and
+# ceilings, to hold the target frame rate. Off by default in benchmarks, so
+# every run draws the same frames, and always off in exports.
+quality = args.quality or ("off" if scenario or exporting else "balanced")
+governor = None
+if quality != "off":
+    limits = dict(QUALITY_PRESETS[quality])
+    if star_field is None:
+        # Nothing to gain from the star catalog's magnitude limit
+        limits["stars"] = (QUALITY_STEPS["stars"][-1],) * 2
+    governor = QualityGovernor(args.target_fps, limits)
+# The 3D pass goes through this; below full resolution it is drawn offscreen and upscaled
+render_target = RenderTarget(width, height)
+
+# Offscreen frames read back asynchronously and written by worker threads
+exporter = None
+if exporting:
+    pipe_command = None
+    if args.export_pipe:
+        pipe_command = args.export_pipe.format(width=width, height=height, fps=args.export_fps)
+    exporter = FrameExporter(width, height, args.export, pipe_command)
+export_dt = 1.0 / args.export_fps
 
 # --------------------------
-# Draw textured sphere
+# Distance from the eye to the origin of a model matrix
 # --------------------------
-def draw_sphere(radius, orientation=GLU_OUTSIDE):
-    quad = gluNewQuadric()
-    gluQuadricTexture(quad, True)
-    gluQuadricOrientation(quad, orientation)
-    gluSphere(quad, radius, 50, 50)
+def eye_distance(model):
+    modelview = view @ model
+    # Largest axis scale of the transform, so scaled objects still get the
+    # right level
+    axis_scale = np.linalg.norm(modelview[:3, :3], axis=0).max()
+    return float(np.linalg.norm(modelview[:3, 3])), float(axis_scale)
 
 # --------------------------
-# Draw textured ring
+# Draw textured sphere
 # --------------------------
-def draw_ring(inner_radius, outer_radius):
-    quad = gluNewQuadric()
-    gluQuadricTexture(quad, True)
-    gluDisk(quad, inner_radius, outer_radius, 50, 50)
+def draw_sphere(model, radius, texture, color=WHITE, orientation=GLU_OUTSIDE, lod_key=None, queued=True):
+    distance, axis_scale = eye_distance(model)
+    slices, stacks = sphere_lod.select(lod_key, radius * axis_scale, distance)
+    mesh = mesh_cache.sphere(slices, stacks, orientation)
+    lod.count(mesh.triangle_count, 50 * 50 * 2)
+    draw = render_queue.submit if queued else renderer.draw
+    draw(mesh, model @ scale(radius), texture, color)
 
 # --------------------------
-# Draw an orbit line
+# Release GL resources and exit
 # --------------------------
-def draw_orbit(radius):
-    glBegin(GL_LINE_LOOP)
-    num_segments = 100
-    for i in range(num_segments + 1):
-        angle = 2 * math.pi * i / num_segments
-        x = radius * math.cos(angle)
-        z = radius * math.sin(angle)
-        glVertex3f(x, 0, z)
-    glEnd()
+def shutdown():
+    # The frame in progress is left out
+    if exporter is not None:
+        exporter.finish()
+        exporter.release()
+    if args.profile:
+        profiler.export(args.profile, {
+            "scenario": args.scenario,
+            "renderer": renderer.name,
+            "gl_renderer": glGetString(GL_RENDERER).decode(),
+            "gl_version": glGetString(GL_VERSION).decode(),
+            "size": [width, height],
+            "quality": quality,
+            "quality_decisions": [decision.as_dict() for decision in governor.decisions] if governor else [],
+        })
+    profiler.release()
+    render_target.release()
+    if profiler_panel is not None:
+        profiler_panel.release()
+    renderer.release()
+    overlay.release()
+    orbit_renderer.release()
+    if star_field is not None:
+        star_field.release()
+    mesh_cache.release()
+    rocket_model.release()
+    for model in ufo_models:
+        model.release()
+    textures.release()
+    simulation.stop()
+    world.close()
+    if replay is not None:
+        replay.close()
+    pygame.quit()
+    sys.exit()
 
 # --------------------------
 # Draw a 3D rocket model
 # --------------------------
-def draw_3d_rocket(size, thrust_level):
-    quad = gluNewQuadric()
-    gluQuadricTexture(quad, True)
-
-    # --- Draw the main body with back-face culling temporarily disabled ---
-    glCullFace(GL_FRONT) # Tell OpenGL to cull front-facing polygons
-
-    # --- Main Body (First Stage) ---
-    glBindTexture(GL_TEXTURE_2D, textures["Metal"])
-    glColor3f(1.0, 1.0, 1.0)
-    body_height = size * 0.7
-    body_radius = size / 5.0
-    gluCylinder(quad, body_radius, body_radius, body_height, 20, 5)
-
-    # --- Restore normal culling for the rest of the model ---
-    glCullFace(GL_BACK)
-
-    # Bottom cap
-    gluDisk(quad, 0, body_radius, 20, 1) # This will now be visible at the base
-
-    # --- Second Stage ---
-    glPushMatrix()
-    # Use the generic metal texture for other parts
-    glBindTexture(GL_TEXTURE_2D, textures["Metal"])
-    glTranslatef(0, 0, body_height)
-    stage2_height = size * 0.5
-    stage2_radius = body_radius * 0.7
-    gluCylinder(quad, body_radius, stage2_radius, stage2_height * 0.2, 20, 5) # Tapered connector
-    glTranslatef(0, 0, stage2_height * 0.2)
-    gluCylinder(quad, stage2_radius, stage2_radius, stage2_height, 20, 5) # Main second stage
-    glPopMatrix()
-
-    # --- Nose Cone ---
-    glPushMatrix()
-    glTranslatef(0, 0, body_height + stage2_height * 1.2)
-    cone_height = size / 2.0
-    gluCylinder(quad, stage2_radius, 0.0, cone_height, 20, 5)
-    glPopMatrix()
-
-    # --- Fins (3 fins, 120 degrees apart) ---
-    glBindTexture(GL_TEXTURE_2D, textures["Metal"])
-    fin_height = size / 2.0
-    fin_width = size / 3.0
-    for i in range(3):
-        glPushMatrix()
-        glRotatef(i * 120, 0, 0, 1)
-        glBegin(GL_QUADS)
-        glTexCoord2f(0, 0); glVertex3f(body_radius, 0, 0)
-        glTexCoord2f(1, 0); glVertex3f(body_radius + fin_width, 0, fin_height * 0.2)
-        glTexCoord2f(1, 1); glVertex3f(body_radius + fin_width, 0, fin_height)
-        glTexCoord2f(0, 1); glVertex3f(body_radius, 0, fin_height)
-        glEnd()
-        glPopMatrix()
-
-    # --- Engine Bell ---
-    glPushMatrix()
-    glColor3f(0.4, 0.4, 0.4)
-    glTranslatef(0, 0, -size * 0.1)
-    gluCylinder(quad, body_radius * 0.8, body_radius * 0.5, size * 0.2, 20, 5)
-    glPopMatrix()
+def draw_3d_rocket(model, size, thrust_level):
+    # Static parts from the cached model, one draw per color and texture
+    ship = model @ scale(size)
+    for mesh, color, texture in rocket_model.parts:
+        render_queue.submit(mesh, ship, textures[texture] if texture else None, color)
 
     # --- Dynamic Flame Effect ---
+    # The one part that changes every frame: a cached cone, stretched and
+    # jittered by the transform alone
     if thrust_level > 0:
-        glDisable(GL_TEXTURE_2D)
-        glPushMatrix()
-        glTranslatef(0, 0, -size * 0.1) # Position at the engine nozzle
-        glRotatef(180, 0, 1, 0) # Rotate to point the flame backwards
+        body_radius = size / 5.0
         flame_length = thrust_level * size * 0.02 + random.uniform(-0.1, 0.1) * size
         flame_radius = body_radius * 0.6 * (1.0 + random.uniform(-0.1, 0.1))
-        glColor3f(1.0, 0.8, 0.2) # Fiery orange-yellow
-        gluCylinder(quad, flame_radius, 0, flame_length, 12, 1)
-        glEnable(GL_TEXTURE_2D)
-        glPopMatrix()
+        flame = (model @ translate(0, 0, -size * 0.1) # Position at the engine nozzle
+                 @ rotate(180, 0, 1, 0)               # Rotate to point the flame backwards
+                 @ scale(flame_radius, flame_radius, flame_length))
+        render_queue.submit(mesh_cache.cylinder(0.0, 12, 1), flame, None, (1.0, 0.8, 0.2, 1.0), # Fiery orange-yellow
+                            transparent=True)
 
 # --------------------------
 # Draw a 3D UFO model
 # --------------------------
-def draw_ufo(size):
-    quad = gluNewQuadric()
-
-    # Main saucer body
-    glPushMatrix()
-    glColor3f(0.6, 0.6, 0.7) # Metallic grey
-    glScalef(1.0, 0.3, 1.0) # Flatten the sphere into a saucer
-    gluSphere(quad, size, 30, 10)
-    glPopMatrix()
-
-    # Cockpit dome
-    glPushMatrix()
-    glColor3f(0.5, 0.8, 0.9) # Glowing light blue
-    glTranslatef(0, size * 0.2, 0)
-    glScalef(0.5, 0.5, 0.5)
-    gluSphere(quad, size, 20, 10)
-    glPopMatrix()
-
-    # Underside light
-    glColor3f(0.8, 1.0, 0.8) # Glowing green
-    gluDisk(quad, 0, size * 0.3, 20, 1)
-
-# --------------------------
-# Particle class for smoke
-# --------------------------
-class Particle:
-    def __init__(self, x, y):
-        self.x = x + random.uniform(-3, 3) # Start with slight horizontal spread
-        self.y = y + random.uniform(-3, 3)
-        self.vx = random.uniform(-0.3, 0.3)
-        self.vy = random.uniform(2, 4) # Move upwards faster
-        self.lifetime = random.uniform(30, 50)
-        self.initial_lifetime = self.lifetime
-        self.size = random.uniform(8, 18)
-        # Start with a fiery color
-        self.r, self.g, self.b = 1.0, random.uniform(0.3, 0.6), 0.1
-
-    def update(self):
-        self.x += self.vx
-        self.y += self.vy
-        self.lifetime -= 1
-        # Shrink particle over time
-        self.size *= 0.97
-        # Fade to grey
-        self.g = max(0.5, self.g * 0.98)
-        self.b = max(0.5, self.b * 1.02)
-
-# --------------------------
-# Shooting Star class
-# --------------------------
-class ShootingStar:
-    def __init__(self, screen_width, screen_height):
-        self.w, self.h = screen_width, screen_height
-        # Start from a random edge
-        edge = random.choice(['top', 'bottom', 'left', 'right'])
-        if edge == 'top':
-            self.x, self.y = random.uniform(0, self.w), -10
-            self.vx, self.vy = random.uniform(-4, 4), random.uniform(5, 15)
-        elif edge == 'bottom':
-            self.x, self.y = random.uniform(0, self.w), self.h + 10
-            self.vx, self.vy = random.uniform(-4, 4), random.uniform(-15, -5)
-        elif edge == 'left':
-            self.x, self.y = -10, random.uniform(0, self.h)
-            self.vx, self.vy = random.uniform(5, 15), random.uniform(-4, 4)
-        else: # right
-            self.x, self.y = self.w + 10, random.uniform(0, self.h)
-            self.vx, self.vy = random.uniform(-15, -5), random.uniform(-4, 4)
-
-        self.lifetime = 1.0 # Represents alpha, from 1.0 down to 0.0
-        self.length = random.uniform(50, 150)
-
-    def update(self):
-        self.x += self.vx
-        self.y += self.vy
-        self.lifetime -= 0.01 # Fade out
-
-    def is_dead(self):
-        return self.lifetime <= 0 or \
-               self.x < -self.length or self.x > self.w + self.length or \
-               self.y < -self.length or self.y > self.h + self.length
-
-# --------------------------
-# Asteroid class
-# --------------------------
-class Asteroid:
-    def __init__(self):
-        # Position in polar coordinates, then convert to cartesian
-        angle = random.uniform(0, 2 * math.pi)
-        # Place them in a belt between Mars and Jupiter
-        radius = random.uniform(280, 340)
-        
-        self.x = radius * math.cos(angle)
-        self.y = random.uniform(-15, 15) # Give them some vertical displacement
-        self.z = radius * math.sin(angle)
-
-        # Size
-        self.size = random.uniform(0.5, 3.5)
-
-        # Orbital speed - slower for farther asteroids to simulate Kepler's laws
-        self.speed = random.uniform(0.2, 0.35) * (340 / radius)
-
-        # Random rotation axis and speed for tumbling effect
-        self.rot_speed = random.uniform(-40, 40)
-        self.rot_axis = (random.uniform(-1, 1), random.uniform(-1, 1), random.uniform(-1, 1))
-        # Normalize rotation axis vector
-        norm = math.sqrt(sum(i*i for i in self.rot_axis))
-        self.rot_axis = tuple(i/norm for i in self.rot_axis)
-
-# --------------------------
-# UFO class
-# --------------------------
-class UFO:
-    def __init__(self):
-        self.size = 15.0
-        self.rot_speed = random.uniform(20, 50)
-        self.reset()
-
-    def update(self, dt):
-        for i in range(3):
-            self.pos[i] += self.vel[i] * dt
-        
-        # If UFO goes too far, reset it
-        if abs(self.pos[0]) > 1000 or abs(self.pos[1]) > 1000 or abs(self.pos[2]) > 1000:
-            self.reset()
-
-    def reset(self):
-        # Start at a random edge of a large box
-        self.pos = [random.uniform(-800, 800), random.uniform(-300, 300), random.uniform(-800, 800)]
-        # Aim towards the center of the box
-        target = [random.uniform(-200, 200), 0, random.uniform(-200, 200)]
-        direction = [target[i] - self.pos[i] for i in range(3)]
-        norm = math.sqrt(sum(d*d for d in direction))
-        speed = random.uniform(40, 80)
-        self.vel = [d / norm * speed for d in direction]
-
-# --------------------------
-# Rocket class for 3D flight
-# --------------------------
-class Rocket:
-    def __init__(self):
-        self.pos = [0.0, 0.0, 300.0] # Start in front of the sun
-        self.vel = [0.0, 0.0, 0.0]
-        # Forward vector (where the rocket is pointing)
-        self.forward = [0.0, 0.0, -1.0]
-        self.size = 20.0
-        self.is_collapsing = False
-        self.collapse_timer = 0.0
-        self.initial_pos = [0.0, 0.0, 300.0]
-        self.thrust = 0.0
-
-    def update(self, dt, keys):
-        # --- Handle Controls ---
-        self.thrust = 0.0
-        if keys[K_w]:
-            self.thrust = 150.0
-        if keys[K_s]:
-            self.thrust = -100.0
-
-        if self.is_collapsing:
-            self.size *= 0.90 # Shrink rapidly
-            self.collapse_timer -= dt
-            if self.collapse_timer <= 0:
-                self.reset()
-            return # No other physics when collapsing
-
-        # --- Update Physics ---
-        # Apply thrust
-        for i in range(3):
-            self.vel[i] += self.forward[i] * self.thrust * dt
-
-        # Apply drag/friction
-        for i in range(3):
-            self.vel[i] *= 0.98
-
-        # Update position
-        for i in range(3):
-            self.pos[i] += self.vel[i] * dt
-
-    def start_collapse(self, black_hole_pos):
-        if self.is_collapsing: return
-        self.is_collapsing = True
-        self.collapse_timer = 2.0 # Time until reset
-        # Set velocity to pull towards black hole
-        direction = [black_hole_pos[i] - self.pos[i] for i in range(3)]
-        self.vel = [d * 3 for d in direction] # Strong pull
-
-    def reset(self):
-        self.pos = list(self.initial_pos)
-        self.vel = [0.0, 0.0, 0.0]
-        self.forward = [0.0, 0.0, -1.0]
-        self.size = 20.0
-        self.is_collapsing = False
-
-    def update_orientation(self, mouse_dx, mouse_dy):
-        # Simple yaw and pitch based on mouse movement
-        yaw_angle = -mouse_dx * 0.005
-        pitch_angle = -mouse_dy * 0.005
-
-        # Rotate forward vector around Y-axis (yaw)
-        x, z = self.forward[0], self.forward[2]
-        self.forward[0] = x * math.cos(yaw_angle) - z * math.sin(yaw_angle)
-        self.forward[2] = x * math.sin(yaw_angle) + z * math.cos(yaw_angle)
-
-        # Rudimentary pitch (clamped to avoid flipping over)
-        self.forward[1] += pitch_angle
-        self.forward[1] = max(-0.8, min(0.8, self.forward[1]))
-
-# --------------------------
-# Planet data (bigger sizes)
-# --------------------------
-planets = [
-    # Name, Distance, Size, Orbital Speed, Axial Tilt, Moons
-    ("Mercury", 115,  8.0, 1.0, 2, []),
-    ("Venus",   150, 15.0, 0.6, 177, []),
-    ("Earth",   200, 17.0, 0.5, 23.5, [
-        # Moon Name, Distance from planet, Size, Orbital Speed around planet
-        ("Moon", 24, 4.5, 4.0)
-    ]),
-    ("Mars",    260, 14.0, 0.4, 25, [
-        ("Phobos", 20, 4.0, 8.0),
-        ("Deimos", 20, 3.0, 4.0)
-    ]),
-    ("Jupiter", 360, 40.0, 0.3, 3, []),
-    ("Saturn",  490, 35.0, 0.25, 27, []),
-    ("Uranus",  580, 20.0, 0.15, 98, []),
-    ("Neptune", 640, 19.0, 0.1, 28, []),
+# Triangles of the three 30x10, 20x10 and 20-slice parts it was once drawn
+# with, which the finest baked UFO (see models.bake_ufo) matches
+UFO_FULL_TRIANGLES = 30 * 10 * 2 + 20 * 10 * 2 + 20 * 2
+
+def draw_ufo(model, size, lod_key=None):
+    distance, axis_scale = eye_distance(model)
+    ship_model = ufo_lod.select(lod_key, size * axis_scale, distance)
+    lod.count(ship_model.triangle_count, UFO_FULL_TRIANGLES)
+    # Saucer, cockpit dome and underside light, in their own colors
+    ship = model @ scale(size)
+    for mesh, color, texture in ship_model.parts:
+        render_queue.submit(mesh, ship, textures[texture] if texture else None, color)
+
+# To create a glow effect, each orbit is drawn with several layers of
+# different thickness and alpha values
+GLOW_LAYERS = [
+    (4.0, 0.15),  # Thinner, brighter outer glow
+    (2.0, 0.3),   # Thinner, brighter mid glow
+    (1.0, 0.8)    # A strong, bright core line
 ]
+# A dim, semi-transparent grey for the orbits
+ORBIT_COLOR = (0.3, 0.3, 0.3)
 
 clock = pygame.time.Clock()
-start_time = time.time()
-
-# List to hold smoke particles
-smoke_particles = []
-
-# List to hold asteroids
-asteroids = []
-for _ in range(200): # Create 200 asteroids
-    asteroids.append(Asteroid())
-
-# List to hold shooting stars
-shooting_stars = []
 
-# Create UFOs and Monsters
-ufos = [UFO() for _ in range(2)]
-
-# Black Hole properties
-black_hole = {
-    "pos": [2000, 500, 0], # Positioned far away from the solar system
-    "radius": 40.0, # The black sphere itself (event horizon)
-    "influence_radius": 100.0 # Where gravity starts to affect the rocket
+# All simulation state (rocket, UFOs, asteroids, particles, black hole)
+ASTEROID_COUNT = 200
+world_options = {
+    "asteroid_count": args.asteroids if args.asteroids is not None else ASTEROID_COUNT,
+    "scene": Scene(catalog),
+    "gravity": args.gravity,
+    "gravity_workers": args.gravity_workers,
+    "swarm_count": args.swarm,
 }
-
-# Create the 3D rocket object
-rocket_3d = Rocket()
-
-# Variables for interactive rocket cursor
-last_mouse_x = 0
-last_mouse_y = 0
-rocket_tilt = 0.0
-camera_mode = 'default' # Can be 'default' or 'follow_rocket'
+if scenario:
+    # Same world, same flame flicker, every run
+    random.seed(0)
+    world = World(width, height, seed=0, **{**world_options, **scenario.world_options})
+    scenario.setup(world)
+elif replay is not None:
+    world = replay.make_world(world_options["scene"])
+    replay.seek(world, args.replay_from)
+else:
+    world = World(width, height, **world_options)
+    world.set_epoch(args.epoch)
+black_hole = world.black_hole
+asteroid_field = world.asteroids
+# The world steps at a fixed tick on its own thread; each frame draws a
+# blend of its last two snapshots. Benchmarks step it in this thread
+# instead, once per frame, so every run is the same.
+recorder = None
+if args.record:
+    recorder = Recorder(args.record, world, BENCHMARK_DT, args.scene, args.gravity_workers, args.snapshots)
+simulation = SimulationThread(world, BENCHMARK_DT, recorder, replay)
+if not scenario and not exporting:
+    simulation.start()
+# Full-quality settings, lowered by the governor as needed
+glow_layers = GLOW_LAYERS
+star_magnitude = QUALITY_STEPS["stars"][-1]
+asteroid_draw_count = asteroid_field.count
+full_smoke_limit = world.smoke_limit
+# Current LOD level of every asteroid
+asteroid_levels = np.zeros(asteroid_field.count, dtype=np.intp)
+# Current LOD level of every body and ring in the scene
+body_levels = np.zeros(scene.count, dtype=np.intp)
+ring_levels = np.zeros(len(scene.ring_body), dtype=np.intp)
+# Current LOD level of every swarm ship
+swarm_levels = np.zeros(world.swarm.count if world.swarm is not None else 0, dtype=np.intp)
+
+camera_mode = scenario.camera_mode if scenario else 'default' # Can be 'default' or 'follow_rocket'
 is_mouse_focused = False # To handle mouse wrapping
+show_lod_stats = False # Press L to print triangle counts once a second
+last_lod_report = 0.0
+show_profiler = False # Press P to show the frame profiler
+frame = 0
 
 # --------------------------
 # Main loop
 # --------------------------
 while True:
+    if scenario:
+        if frame == scenario.warmup:
+            profiler.reset()
+        if frame == scenario.warmup + scenario.frames:
+            shutdown()
+    if exporter is not None and args.export_frames is not None and exporter.frames >= args.export_frames:
+        shutdown()
+    frame_start = time.perf_counter()
+    profiler.begin_frame()
+    profiler.section("events")
     for event in pygame.event.get():
         if event.type == QUIT:
-            pygame.quit()
-            sys.exit()
+            shutdown()
         if event.type == KEYDOWN:
             if event.key == K_ESCAPE:
-                pygame.quit()
-                sys.exit()
+                shutdown()
             elif event.key == K_x:
                 if camera_mode != 'follow_rocket':
                     camera_mode = 'follow_rocket'
                     is_mouse_focused = True
                     pygame.event.set_grab(True) # Confine mouse to window
                     pygame.mouse.set_visible(False)
+            elif event.key == K_l:
+                show_lod_stats = not show_lod_stats
+            elif event.key == K_p:
+                show_profiler = not show_profiler
+                if profiler_panel is None:
+                    profiler_panel = ProfilerPanel(profiler)
+            elif event.key in (K_PERIOD, K_COMMA, K_SLASH):
+                # Time warp: . faster, , slower, / back to real time
+                warp = {K_PERIOD: world.time_warp * 10, K_COMMA: world.time_warp / 10, K_SLASH: 1}[event.key]
+                with simulation.lock:
+                    world.set_time_warp(warp)
+                print(f"Time warp: {world.time_warp:,.0f}x")
             elif event.key == K_z:
                 if camera_mode != 'default':
                     camera_mode = 'default'
@@ -473,38 +500,65 @@ while True:
                     # This fixes the custom cursor not appearing after grab is released.
                     pygame.mouse.set_visible(True)
                     pygame.mouse.set_visible(False)
-                    # Immediately update last_mouse_x to current mouse position
-                    # to prevent a jump in rocket tilt calculation
-                    last_mouse_x, last_mouse_y = pygame.mouse.get_pos()
 
+    profiler.section("update")
+    render_target.begin()
+    if exporter is not None:
+        exporter.begin()
     glClear(GL_COLOR_BUFFER_BIT | GL_DEPTH_BUFFER_BIT)
-    glLoadIdentity()
+    textures.begin_frame()
     
-    # Get time delta for physics calculations
-    dt = clock.get_time() / 1000.0 # Delta time in seconds
-    t = time.time() - start_time
+    # --------------------------
+    # Step the simulation
+    # --------------------------
+    if scenario:
+        # Scripted input and one fixed step per frame
+        inputs = scenario.inputs(frame, world)
+        simulation.step(BENCHMARK_DT, inputs)
+    elif replay is not None:
+        if exporter is not None:
+            # One recorded step per exported frame
+            inputs = replay.next(world)
+            if inputs is None:
+                shutdown()
+            simulation.step(replay.tick, inputs)
+        else:
+            # The recorded step now on screen decides the camera and cursor
+            if simulation.finished():
+                shutdown()
+            inputs = replay.inputs(max(replay.position - 1, 0)) if len(replay) else Inputs()
+        camera_mode = 'follow_rocket' if inputs.follow_rocket else 'default'
+    else:
+        keys = pygame.key.get_pressed()
+        mouse_dx, mouse_dy = 0, 0
+        if camera_mode == 'follow_rocket' and is_mouse_focused:
+            mouse_dx, mouse_dy = pygame.mouse.get_rel()
+        cursor = pygame.mouse.get_pos()
+        if exporter is not None:
+            # From the preview window to the exported frame
+            cursor = (cursor[0] * width / window_width, cursor[1] * height / window_height)
+        inputs = Inputs(follow_rocket=camera_mode == 'follow_rocket',
+                        forward=keys[K_w], backward=keys[K_s],
+                        mouse_dx=mouse_dx, mouse_dy=mouse_dy,
+                        cursor=cursor)
+        if exporter is not None:
+            # Exports step at a fixed rate, however long a frame takes
+            simulation.step(export_dt, inputs)
+        else:
+            simulation.set_inputs(inputs)
+    mouse_x, mouse_y = inputs.cursor
+    # Everything below draws from this, never from the world itself
+    state = simulation.state()
+    rocket_3d = state.rocket
+    t = state.time
 
     # --------------------------
     # Camera Setup
     # --------------------------
     if camera_mode == 'default':
         # Default static camera view
-        glTranslatef(0, 0, -1200)
-        glRotatef(25, 1, 0, 0)
+        view = translate(0, 0, -1200) @ rotate(25, 1, 0, 0)
     elif camera_mode == 'follow_rocket':
-        # --- Update Rocket ---
-        if is_mouse_focused:
-            mouse_dx, mouse_dy = pygame.mouse.get_rel()
-            rocket_3d.update_orientation(mouse_dx, mouse_dy)
-        keys = pygame.key.get_pressed()
-        rocket_3d.update(dt, keys)
-
-        # --- Black Hole Collision Check ---
-        dist_vec = [rocket_3d.pos[i] - black_hole['pos'][i] for i in range(3)]
-        dist_sq = sum(d*d for d in dist_vec)
-        if dist_sq < black_hole['radius']**2:
-            rocket_3d.start_collapse(black_hole['pos'])
-
         # --- Update Camera to follow rocket ---
         # Camera is positioned behind the rocket
         cam_dist = 50.0
@@ -514,334 +568,266 @@ while True:
             rocket_3d.pos[2] - rocket_3d.forward[2] * cam_dist
         ]
         # Look at a point slightly in front of the rocket
-        look_at = [
+        look_target = [
             rocket_3d.pos[0] + rocket_3d.forward[0] * 20,
             rocket_3d.pos[1] + rocket_3d.forward[1] * 20,
             rocket_3d.pos[2] + rocket_3d.forward[2] * 20
         ]
 
-        gluLookAt(cam_pos[0], cam_pos[1], cam_pos[2],  # Camera position
-                  look_at[0], look_at[1], look_at[2],  # Point to look at
-                  0, 1, 0)                             # Up vector
+        view = look_at(cam_pos,      # Camera position
+                       look_target,  # Point to look at
+                       (0, 1, 0))    # Up vector
 
         # Center mouse to prevent it from hitting screen edges
         if is_mouse_focused:
-            pygame.mouse.set_pos([width / 2, height / 2])
+            pygame.mouse.set_pos([window_width / 2, window_height / 2])
             # Clear relative motion after recentering to avoid jump
             pygame.mouse.get_rel()
 
+    renderer.set_camera(projection, view)
+    render_queue.begin(view)
+    # World-space frustum of this frame's camera (GL layout, hence transposed)
+    frustum.update(projection.T, view.T)
+
     # --------------------------
     # Draw Starfield Background
     # --------------------------
-    glPushMatrix()
-    # Disable depth writing so the background is always behind everything
-    glDepthMask(GL_FALSE)
-
-    # Use GL_REPLACE to ensure the texture is drawn as-is, without color or lighting affecting it.
-    # This is the standard way to draw a skybox.
-    glTexEnvi(GL_TEXTURE_ENV, GL_TEXTURE_ENV_MODE, GL_REPLACE)
-    glBindTexture(GL_TEXTURE_2D, textures["Stars"])
-    glColor3f(1, 1, 1)
-    # The sphere should be large enough to contain the entire solar system
-    draw_sphere(800, orientation=GLU_INSIDE)
+    profiler.section("starfield")
+    if star_field is not None:
+        star_field.draw(star_magnitude)
+    else:
+        # Disable depth writing so the background is always behind everything
+        glDepthMask(GL_FALSE)
 
-    # Re-enable depth writing for the rest of the scene. This is crucial!
-    glDepthMask(GL_TRUE) 
-    # Reset texture environment to default for the rest of the objects
-    glTexEnvi(GL_TEXTURE_ENV, GL_TEXTURE_ENV_MODE, GL_MODULATE)
+        # Drawn in plain white so the texture comes out as-is, without color
+        # affecting it. This is the standard way to draw a skybox.
+        # The sphere should be large enough to contain the entire solar system
+        draw_sphere(np.eye(4), 800, textures["Stars"], orientation=GLU_INSIDE, lod_key="Stars", queued=False)
 
-    glPopMatrix()
+        # Re-enable depth writing for the rest of the scene. This is crucial!
+        glDepthMask(GL_TRUE)
 
 
     # --------------------------
     # Glowing Animated Sun
     # --------------------------
-    glPushMatrix()
-
-    glRotatef(t * 10, 0, 1, 0)  # Rotate the sun on its own axis
-
-    glBindTexture(GL_TEXTURE_2D, textures["Sun"])
-
-    glow = 1.0 + (math.sin(t * 2) * 0.2)  # subtle shimmering glow
-    glColor3f(1.0 * glow, 0.8 * glow, 0.6 * glow)
-
-    draw_sphere(100)  # Sun
-
-    glPopMatrix()
+    profiler.section("sun")
+    if frustum.test((0, 0, 0), 100):
+        glow = 1.0 + (math.sin(t * 2) * 0.2)  # subtle shimmering glow
+        draw_sphere(rotate(t * 10, 0, 1, 0),  # Rotate the sun on its own axis
+                    100, textures["Sun"], (1.0 * glow, 0.8 * glow, 0.6 * glow, 1.0), lod_key="Sun")
 
     # --------------------------
-    # Draw Orbits
+    # Draw Asteroids
     # --------------------------
-    # Orbits are not textured, so disable texturing
-    glDisable(GL_TEXTURE_2D)
-
-    # To create a glow effect, we draw each orbit multiple times
-    # with different thickness and alpha values.
-    glow_layers = [
-        (4.0, 0.15),  # Thinner, brighter outer glow
-        (2.0, 0.3),   # Thinner, brighter mid glow
-        (1.0, 0.8)    # A strong, bright core line
-    ]
-
-    for line_width, alpha in glow_layers:
-        glLineWidth(line_width)
-        # Set a dim, semi-transparent grey color for the orbits
-        glColor4f(0.3, 0.3, 0.3, alpha)
-        for name, dist, size, speed, tilt, moons in planets:
-            draw_orbit(dist)
-
-    # Reset line width to default for any other line drawing
-    glLineWidth(1.0)
-
-    # Re-enable texturing for the planets
-    glEnable(GL_TEXTURE_2D)
+    profiler.section("asteroids")
+    # Every orbit angle and model matrix was computed in one vectorized step
+    # by the world; the belt goes out in one instanced draw call per LOD level.
+    # The belt is random, so drawing only the first asteroids thins it evenly.
+    n = asteroid_draw_count
+    eye_positions = state.asteroid_positions[:n] @ view[:3, :3].T + view[:3, 3]
+    asteroid_lod.select_many(asteroid_levels[:n], asteroid_field.size[:n], np.linalg.norm(eye_positions, axis=1))
+    asteroids_visible = frustum.test_many(state.asteroid_positions[:n], asteroid_field.size[:n])
+    for level, (slices, stacks) in enumerate(asteroid_lod.levels):
+        matrices = state.asteroid_matrices[:n][(asteroid_levels[:n] == level) & asteroids_visible]
+        if len(matrices):
+            mesh = mesh_cache.sphere(slices, stacks)
+            renderer.draw_instanced(mesh, matrices, textures["Phobos"]) # Use Phobos texture for all asteroids
+            lod.count(mesh.triangle_count * len(matrices), 50 * 50 * 2 * len(matrices))
 
     # --------------------------
-    # Draw Asteroids
+    # Draw UFOs
     # --------------------------
-    glBindTexture(GL_TEXTURE_2D, textures["Phobos"]) # Use Phobos texture for all asteroids
-    for asteroid in asteroids:
-        glPushMatrix()
-
-        # Asteroids revolve around the sun at their own speed
-        # We use the asteroid's initial (x,z) as a starting point in the orbit circle
-        orbit_angle = t * asteroid.speed * 10
-        cos_a = math.cos(math.radians(orbit_angle))
-        sin_a = math.sin(math.radians(orbit_angle))
-        
-        # Manual rotation calculation
-        current_x = asteroid.x * cos_a - asteroid.z * sin_a
-        current_z = asteroid.x * sin_a + asteroid.z * cos_a
-
-        glTranslatef(current_x, asteroid.y, current_z)
-        glRotatef(t * asteroid.rot_speed, asteroid.rot_axis[0], asteroid.rot_axis[1], asteroid.rot_axis[2])
-        
-        draw_sphere(asteroid.size)
-        glPopMatrix()
+    profiler.section("ufos")
+    for i, ufo in enumerate(state.ufos):
+        if not frustum.test(ufo.pos, ufo.size):
+            continue
+        model = translate(*ufo.pos) @ rotate(t * ufo.rot_speed, 0, 1, 0) # Spin the UFO
+        draw_ufo(model, ufo.size, lod_key=i)
 
     # --------------------------
-    # Draw UFOs
+    # Draw the UFO swarm
     # --------------------------
-    glDisable(GL_TEXTURE_2D)
-    for ufo in ufos:
-        ufo.update(dt)
-        glPushMatrix()
-        glTranslatef(ufo.pos[0], ufo.pos[1], ufo.pos[2])
-        glRotatef(t * ufo.rot_speed, 0, 1, 0) # Spin the UFO
-        draw_ufo(ufo.size)
-        glPopMatrix()
-    glEnable(GL_TEXTURE_2D)
+    profiler.section("swarm")
+    # Like the belt: every visible ship's matrix is built in one vectorized
+    # step and each part of each LOD level goes out in one instanced draw
+    if state.swarm_positions is not None:
+        swarm_size = world.swarm.size
+        swarm_positions = state.swarm_positions.T
+        swarm_visible = np.flatnonzero(frustum.test_many(swarm_positions, swarm_size))
+        visible_positions = swarm_positions[swarm_visible]
+        eye_distances = np.linalg.norm(visible_positions @ view[:3, :3].T + view[:3, 3], axis=1)
+        visible_levels = swarm_levels[swarm_visible]
+        ufo_lod.select_many(visible_levels, swarm_size, eye_distances)
+        swarm_levels[swarm_visible] = visible_levels
+        for level, ship_model in enumerate(ufo_lod.levels):
+            ships = visible_levels == level
+            if not ships.any():
+                continue
+            matrices = swarm_matrices(visible_positions[ships], state.swarm_angles[swarm_visible[ships]],
+                                      swarm_size)
+            for mesh, color, texture in ship_model.parts:
+                renderer.draw_instanced(mesh, matrices, textures[texture] if texture else None, color)
+            lod.count(ship_model.triangle_count * len(matrices), UFO_FULL_TRIANGLES * len(matrices))
 
     # --------------------------
     # Draw Black Hole (only in follow mode)
     # --------------------------
-    if camera_mode == 'follow_rocket':
-        glPushMatrix()
-        glTranslatef(black_hole['pos'][0], black_hole['pos'][1], black_hole['pos'][2])
-
+    profiler.section("black hole")
+    # The billboard's corners reach out to its half-size times sqrt(2)
+    if camera_mode == 'follow_rocket' and \
+            frustum.test(black_hole['pos'], black_hole['radius'] * 2 * math.sqrt(2)):
         # --- Billboard the black hole image to always face the camera ---
-        # Get the current modelview matrix to extract camera orientation
-        modelview = glGetFloatv(GL_MODELVIEW_MATRIX)
-        
-        # The first three columns of the matrix are the camera's right, up, and forward vectors.
-        # By applying their transpose, we undo the camera's rotation for this object.
-        camera_x = [modelview[0][0], modelview[1][0], modelview[2][0]]
-        camera_y = [modelview[0][1], modelview[1][1], modelview[2][1]]
-        
-        # Draw the textured quad
-        glEnable(GL_TEXTURE_2D)
-        glBindTexture(GL_TEXTURE_2D, textures["BlackHole"])
-        glColor4f(1, 1, 1, 1) # Use full color and opacity from texture
-        
+        # The rows of the view rotation are the camera's right, up and back
+        # vectors in world space. Spanning the quad with them undoes the
+        # camera's rotation for this object.
         s = black_hole['radius'] * 2 # Make the image size relative to the black hole radius
-        glBegin(GL_QUADS)
-        glTexCoord2f(0, 0); glVertex3f(-s * camera_x[0] - s * camera_y[0], -s * camera_x[1] - s * camera_y[1], -s * camera_x[2] - s * camera_y[2])
-        glTexCoord2f(1, 0); glVertex3f( s * camera_x[0] - s * camera_y[0],  s * camera_x[1] - s * camera_y[1],  s * camera_x[2] - s * camera_y[2])
-        glTexCoord2f(1, 1); glVertex3f( s * camera_x[0] + s * camera_y[0],  s * camera_x[1] + s * camera_y[1],  s * camera_x[2] + s * camera_y[2])
-        glTexCoord2f(0, 1); glVertex3f(-s * camera_x[0] + s * camera_y[0], -s * camera_x[1] + s * camera_y[1], -s * camera_x[2] + s * camera_y[2])
-        glEnd()
-
-        glPopMatrix()
+        model = np.eye(4)
+        model[:3, 0] = view[0, :3] * s
+        model[:3, 1] = view[1, :3] * s
+        model[:3, 2] = view[2, :3]
+        model[:3, 3] = black_hole['pos']
+        billboard = mesh_cache.quad(((-1, -1, 0), (1, -1, 0), (1, 1, 0), (-1, 1, 0)))
+        render_queue.submit(billboard, model, textures["BlackHole"], transparent=True) # Use full color and opacity from texture
 
     # --------------------------
     # Draw 3D Rocket in follow mode
     # --------------------------
-    if camera_mode == 'follow_rocket':
-        glPushMatrix()
-        # Move to the rocket's position
-        glTranslatef(rocket_3d.pos[0], rocket_3d.pos[1], rocket_3d.pos[2])
-
+    profiler.section("rocket")
+    # Nose cone and full-thrust flame are both within four sizes of the base
+    if camera_mode == 'follow_rocket' and frustum.test(rocket_3d.pos, rocket_3d.size * 4):
         # --- Orient the rocket to match its forward vector ---
         yaw = math.degrees(math.atan2(rocket_3d.forward[0], rocket_3d.forward[2]))
         pitch = math.degrees(math.asin(-rocket_3d.forward[1]))
-        glRotatef(yaw, 0, 1, 0)
-        glRotatef(pitch, 1, 0, 0)
-
-        draw_3d_rocket(rocket_3d.size, rocket_3d.thrust)
-        glEnable(GL_TEXTURE_2D)
-        glPopMatrix()
+        # Move to the rocket's position
+        model = translate(*rocket_3d.pos) @ rotate(yaw, 0, 1, 0) @ rotate(pitch, 1, 0, 0)
+        draw_3d_rocket(model, rocket_3d.size, rocket_3d.thrust)
 
     # --------------------------
     # Draw planets with textures
     # --------------------------
-    for name, dist, size, speed, tilt, moons in planets:
-        glPushMatrix()
-
-        # revolve around the Sun
-        glRotatef(t * speed * 10, 0, 1, 0)
-
-        # move away from Sun
-        glTranslatef(dist, 0, 0)
-
-        # The following push/pop ensures that the planet's axial rotation
-        # does not affect other objects, like Saturn's rings.
-        glPushMatrix()
-        # rotate the planet itself (axial spin)
-        glRotatef(t * 50, 0, 1, 0)
-
-        # Rotate the sphere so the texture maps correctly (poles on Y-axis)
-        glRotatef(-90, 1, 0, 0)
-
-        glBindTexture(GL_TEXTURE_2D, textures[name])
-        glColor3f(1, 1, 1)
-        draw_sphere(size)
-        glPopMatrix()
-
-        if name == "Saturn":
-            glBindTexture(GL_TEXTURE_2D, textures["Saturn_Ring"])
-            glColor3f(1, 1, 1)
-            draw_ring(size + 10, size + 25)
-
-        # --------------------------
-        # Draw Moons
-        # --------------------------
-        for moon_name, moon_dist, moon_size, moon_speed in moons:
-            glPushMatrix()
-
-            # Revolve around the parent planet
-            glRotatef(t * moon_speed * 20, 0, 1, 0)
-            glTranslatef(moon_dist, 0, 0)
-
-            # rotate the moon itself and fix texture
-            glPushMatrix()
-            glRotatef(t * 30, 0, 1, 0)
-            glRotatef(-90, 1, 0, 0)
-            glBindTexture(GL_TEXTURE_2D, textures[moon_name])
-            glColor3f(1, 1, 1)
-            draw_sphere(moon_size)
-            glPopMatrix()
-
-            glPopMatrix()
-
-
-        glPopMatrix()
+    profiler.section("planets")
+    # Orbit frames and model matrices of the whole hierarchy in one
+    # vectorized pass, at the epoch being drawn
+    scene.update(state.epoch)
+    distances = np.linalg.norm(scene.centers @ view[:3, :3].T + view[:3, 3], axis=1)
+    sphere_lod.select_many(body_levels, scene.size, distances)
+    for i in np.flatnonzero(frustum.test_many(scene.centers, scene.size)):
+        mesh = mesh_cache.sphere(*sphere_lod.levels[body_levels[i]])
+        lod.count(mesh.triangle_count, 50 * 50 * 2)
+        # The model matrix already holds the body's axial spin; the extra
+        # rotation in it makes the texture map correctly (poles on Y-axis)
+        render_queue.submit(mesh, scene.models[i], textures[scene.texture_names[scene.texture[i]]])
+
+    # Rings are queued as transparent, so they go after every body: their
+    # transparent texels still write depth
+    ring_distances = distances[scene.ring_body]
+    ring_lod.select_many(ring_levels, scene.ring_outer, ring_distances)
+    for j in np.flatnonzero(frustum.test_many(scene.centers[scene.ring_body], scene.ring_outer)):
+        slices, loops = ring_lod.levels[ring_levels[j]]
+        mesh = mesh_cache.disk(scene.ring_inner[j] / scene.ring_outer[j], slices, loops)
+        lod.count(mesh.triangle_count, 50 * 50 * 2)
+        # Rings sit in the body's orbit frame, so they don't spin with it
+        render_queue.submit(mesh, scene.orbits[scene.ring_body[j]] @ scale(scene.ring_outer[j]),
+                            textures[scene.texture_names[scene.ring_texture[j]]], transparent=True)
+
+    # Every opaque mesh queued, sorted
+    profiler.section("opaque queue")
+    render_queue.flush_opaque()
 
+    # --------------------------
+    # Draw Orbits
+    # --------------------------
+    profiler.section("orbits")
+    # After everything opaque: the glow writes depth, so anything opaque
+    # drawn behind it later would come out with dark bands across it.
+    # Ring geometry lives on the GPU and is only rebuilt when the planets
+    # table changes; all glow layers go out in a single draw
+    roots = scene.roots()
+    orbit_renderer.update(list(zip(scene.distance[roots], scene.eccentricity[roots], scene.inclination[roots],
+                                   scene.node[roots], scene.periapsis[roots])), glow_layers)
+    orbit_renderer.draw(ORBIT_COLOR, glow_layers)
+
+    # Then the transparent ones, over the orbits' glow
+    profiler.section("transparent queue")
+    render_queue.flush_transparent()
 
     # ----------------------------------
     # Switch to 2D Orthographic mode for UI
     # ----------------------------------
-    glMatrixMode(GL_PROJECTION)
-    glPushMatrix()
-    glLoadIdentity()
-    gluOrtho2D(0, width, height, 0) # Flipped Y-axis (0 at top)
-    glMatrixMode(GL_MODELVIEW)
-    glPushMatrix()
-    glLoadIdentity()
+    profiler.section("overlay")
+    # Upscale the 3D pass; the UI is always drawn at full resolution
+    render_target.end()
+    # In the world's screen coordinates, which a replay brings with it
+    renderer.set_camera(ortho_2d(0, world.width, world.height, 0), np.eye(4)) # Flipped Y-axis (0 at top)
 
     # Disable depth testing for 2D elements
     glDisable(GL_DEPTH_TEST)
 
+    overlay.begin()
+
     # --------------------------
     # Draw Shooting Stars
     # --------------------------
-    # Randomly add a new shooting star
-    if random.random() < 0.015: # Adjust probability for more/fewer stars
-        if len(shooting_stars) < 5: # Limit concurrent stars
-            shooting_stars.append(ShootingStar(width, height))
-
-    glDisable(GL_TEXTURE_2D)
-    glLineWidth(2.0)
-    glBegin(GL_LINES)
-    for star in reversed(shooting_stars):
-        star.update()
-        if star.is_dead():
-            shooting_stars.remove(star)
-        else:
-            # Draw a line representing the star's trail
-            glColor4f(1.0, 1.0, 0.8, star.lifetime * 0.8) # Bright, fading yellow-white
-            glVertex2f(star.x, star.y)
-            glVertex2f(star.x - star.vx * (star.length / 20), star.y - star.vy * (star.length / 20))
-    glEnd()
+    if len(state.shooting_stars):
+        stars = state.shooting_stars
+        # Draw a line representing the star's trail
+        heads = stars[:, 0:2]
+        tails = heads - stars[:, 2:4] * (stars[:, 4:5] / 20)
+        colors = np.empty((len(stars), 4), dtype=np.float32)
+        colors[:, :3] = (1.0, 1.0, 0.8) # Bright, fading yellow-white
+        colors[:, 3] = stars[:, 5] * 0.8
+        overlay.lines(heads, tails, colors, width=2.0)
 
     # --------------------------
-    # Draw Rocket and Smoke
+    # Draw Smoke
     # --------------------------
-    mouse_x, mouse_y = pygame.mouse.get_pos()
-
-    # Only update tilt and smoke when in default mode
-    if camera_mode == 'default':
-        # Calculate 2D rocket tilt based on mouse velocity
-        mouse_dx = mouse_x - last_mouse_x
-        last_mouse_x = mouse_x
-        last_mouse_y = mouse_y
-        
-        target_tilt = mouse_dx * 1.5
-        target_tilt = max(-25.0, min(25.0, target_tilt)) # Clamp between -25 and 25 degrees
-        # Smoothly interpolate to the target tilt for a nice easing effect
-        rocket_tilt += (target_tilt - rocket_tilt) * 0.1
-    rocket_w, rocket_h = 64, 64 # Rocket sprite size
-
-    # Add new particles at the rocket's tail
-    if camera_mode == 'default':
-        if len(smoke_particles) < 100: # Limit total particles
-            for _ in range(3): # Emit 3 particles per frame
-                smoke_particles.append(Particle(mouse_x + rocket_w / 2, mouse_y + rocket_h))
-
-    # Update and draw particles
-    glBegin(GL_QUADS)
-    for particle in reversed(smoke_particles):
-        particle.update()
-        if particle.lifetime <= 0:
-            smoke_particles.remove(particle)
-        else:
-            # Fade out over time
-            alpha = (particle.lifetime / particle.initial_lifetime) * 0.5
-            glColor4f(particle.r, particle.g, particle.b, alpha)
-            
-            x, y, size = particle.x, particle.y, particle.size
-            glVertex2f(x - size / 2, y - size / 2)
-            glVertex2f(x + size / 2, y - size / 2)
-            glVertex2f(x + size / 2, y + size / 2)
-            glVertex2f(x - size / 2, y + size / 2)
-    glEnd()
-    glEnable(GL_TEXTURE_2D)
+    overlay.colored(state.smoke_quads)
 
     # --------------------------
     # Draw Rocket Cursor
     # --------------------------
     if camera_mode == 'default':
-        glPushMatrix()
-
-        # Move to the center of where the rocket will be
-        glTranslatef(mouse_x + rocket_w / 2, mouse_y + rocket_h / 2, 0)
-        # Apply the tilt rotation
-        glRotatef(rocket_tilt, 0, 0, 1)
-
-        glBindTexture(GL_TEXTURE_2D, textures["Rocket"])
-        glColor4f(1, 1, 1, 1) # Ensure full opacity
-        glBegin(GL_QUADS)
-        # Flip texture coordinates vertically to correct the rocket's orientation
-        glTexCoord2f(0, 1); glVertex2f(-rocket_w / 2, -rocket_h / 2)
-        glTexCoord2f(1, 1); glVertex2f( rocket_w / 2, -rocket_h / 2)
-        glTexCoord2f(1, 0); glVertex2f( rocket_w / 2,  rocket_h / 2)
-        glTexCoord2f(0, 0); glVertex2f(-rocket_w / 2,  rocket_h / 2)
-        glEnd()
-        glPopMatrix()
-
-    # Restore 3D perspective projection
+        # Centered where the rocket is, tilted with the mouse movement; the
+        # texture is flipped vertically to correct the rocket's orientation
+        overlay.sprite(textures["Rocket"], mouse_x + CURSOR_W / 2, mouse_y + CURSOR_H / 2,
+                       CURSOR_W, CURSOR_H, state.cursor_tilt, uv=(0, 1, 1, 0), layer=1)
+
+    if show_profiler:
+        profiler_panel.draw(overlay, 10, 10, pygame.time.get_ticks() / 1000.0)
+
+    overlay.flush()
+
     glEnable(GL_DEPTH_TEST)
-    glMatrixMode(GL_PROJECTION); glPopMatrix()
-    glMatrixMode(GL_MODELVIEW); glPopMatrix()
 
+    lod.end_frame()
+    frustum.end_frame()
+    if show_lod_stats and t - last_lod_report >= 1.0:
+        last_lod_report = t
+        saved = 1.0 - lod.frame_triangles / max(lod.frame_full_triangles, 1)
+        print(f"LOD: {lod.frame_triangles:,} triangles "
+              f"({lod.frame_full_triangles:,} at full detail, {saved:.0%} saved)")
+        print(f"Culling: {frustum.frame_visible:,} visible, {frustum.frame_culled:,} culled")
+
+    if exporter is not None:
+        profiler.section("export")
+        exporter.end(window_width, window_height)
+
+    profiler.section("flip")
     pygame.display.flip()
-    clock.tick(60)
+    if governor is not None and governor.update(time.perf_counter() - frame_start):
+        render_target.set_scale(governor["render_scale"])
+        lod.set_projection(FOV_Y, render_target.height)
+        lod.detail = governor["detail"]
+        asteroid_draw_count = int(asteroid_field.count * governor["asteroids"])
+        glow_layers = GLOW_LAYERS[-governor["glow_layers"]:]
+        star_magnitude = governor["stars"]
+        with simulation.lock:
+            world.smoke_limit = int(full_smoke_limit * governor["smoke"])
+    # Time spent waiting for the 60 fps cap, so the sections add up to the frame
+    profiler.section("frame cap")
+    if not scenario and exporter is None:
+        # Benchmarks and exports run flat out
+        clock.tick(60)
+    profiler.end_frame()
+    frame += 1
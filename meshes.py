@@ -0,0 +1,327 @@
+import ctypes
+
+import numpy as np
+from OpenGL.GL import *
+from OpenGL.GLU import *
+
+from shaders import compile_program
+
+# Interleaved vertex layout shared by every cached mesh:
+# position (3 floats), normal (3 floats), texcoord (2 floats)
+VERTEX_FLOATS = 8
+VERTEX_STRIDE = VERTEX_FLOATS * 4
+NORMAL_OFFSET = 3 * 4
+TEXCOORD_OFFSET = 6 * 4
+
+# --------------------------
+# Tessellate a unit sphere (same layout and texcoords as gluSphere)
+# --------------------------
+def build_sphere(slices, stacks, inside=False):
+    rho = np.pi * np.arange(stacks + 1) / stacks
+    theta = 2 * np.pi * np.arange(slices + 1) / slices
+    theta[-1] = 0.0 # gluSphere closes the seam exactly
+
+    sin_rho, cos_rho = np.sin(rho)[:, None], np.cos(rho)[:, None]
+    sin_rho[0] = sin_rho[-1] = 0.0 # Make sure it comes to a point
+
+    # Seen from inside, GLU walks the slices the other way round: each point
+    # keeps its texcoords and z, but the triangles wind the other way. Going
+    # through x mirrored with s reversed does that with the same indices
+    x = (-1.0 if inside else 1.0) * sin_rho * np.sin(theta)[None, :]
+    y = sin_rho * np.cos(theta)[None, :]
+    z = np.broadcast_to(cos_rho, x.shape)
+    nsign = -1.0 if inside else 1.0
+    s = np.arange(slices + 1) / slices
+
+    vertices = np.empty((stacks + 1, slices + 1, VERTEX_FLOATS), dtype=np.float32)
+    vertices[..., 0], vertices[..., 1], vertices[..., 2] = x, y, z
+    vertices[..., 3], vertices[..., 4], vertices[..., 5] = x * nsign, y * nsign, z * nsign
+    vertices[..., 6] = (s if inside else 1.0 - s)[None, :]
+    vertices[..., 7] = (1.0 - np.arange(stacks + 1) / stacks)[:, None]
+
+    return vertices.reshape(-1, VERTEX_FLOATS), _grid_indices(stacks, slices, True)
+
+# --------------------------
+# Tessellate a unit disk with a hole (same layout and texcoords as gluDisk)
+# --------------------------
+def build_disk(inner_ratio, slices, loops, inside=False):
+    # gluDisk emits each loop from the outer edge inwards
+    radii = np.linspace(1.0, inner_ratio, loops + 1)[:, None]
+    angle = 2 * np.pi * np.arange(slices + 1) / slices
+    angle[-1] = 0.0
+    sin_a, cos_a = np.sin(angle)[None, :], np.cos(angle)[None, :]
+
+    vertices = np.zeros((loops + 1, slices + 1, VERTEX_FLOATS), dtype=np.float32)
+    vertices[..., 0] = radii * sin_a
+    vertices[..., 1] = radii * cos_a
+    vertices[..., 5] = -1.0 if inside else 1.0
+    vertices[..., 6] = 0.5 + radii * sin_a / 2.0
+    vertices[..., 7] = 0.5 + radii * cos_a / 2.0
+
+    return vertices.reshape(-1, VERTEX_FLOATS), _grid_indices(loops, slices, inside)
+
+# --------------------------
+# Tessellate a unit cylinder or cone (same layout and texcoords as gluCylinder)
+# --------------------------
+def build_cylinder(top_ratio, slices, stacks):
+    # Base radius 1 at z = 0, top radius top_ratio at z = 1; scale by
+    # (base radius, base radius, height) to get any gluCylinder
+    angle = 2 * np.pi * np.arange(slices + 1) / slices
+    angle[-1] = 0.0
+    sin_a, cos_a = np.sin(angle)[None, :], np.cos(angle)[None, :]
+    level = (np.arange(stacks + 1) / stacks)[:, None]
+    radii = 1.0 - (1.0 - top_ratio) * level
+
+    # Normals lean along z as the radius shrinks
+    length = np.hypot(1.0 - top_ratio, 1.0)
+    xy_normal, z_normal = 1.0 / length, (1.0 - top_ratio) / length
+
+    vertices = np.empty((stacks + 1, slices + 1, VERTEX_FLOATS), dtype=np.float32)
+    vertices[..., 0] = radii * sin_a
+    vertices[..., 1] = radii * cos_a
+    vertices[..., 2] = level
+    vertices[..., 3] = xy_normal * sin_a
+    vertices[..., 4] = xy_normal * cos_a
+    vertices[..., 5] = z_normal
+    vertices[..., 6] = (1.0 - np.arange(slices + 1) / slices)[None, :]
+    vertices[..., 7] = level
+
+    return vertices.reshape(-1, VERTEX_FLOATS), _grid_indices(stacks, slices)
+
+# --------------------------
+# A single flat quad, as glBegin(GL_QUADS) would draw it
+# --------------------------
+def build_quad(corners, texcoords):
+    corners = np.asarray(corners, dtype=np.float32)
+    normal = np.cross(corners[1] - corners[0], corners[2] - corners[0])
+    vertices = np.empty((4, VERTEX_FLOATS), dtype=np.float32)
+    vertices[:, 0:3] = corners
+    vertices[:, 3:6] = normal / np.linalg.norm(normal)
+    vertices[:, 6:8] = texcoords
+    return vertices, np.array([0, 1, 2, 0, 2, 3], dtype=np.uint32)
+
+def _grid_indices(rows, columns, flip=False):
+    # Two triangles per quad of a (rows + 1) x (columns + 1) vertex grid,
+    # wound the same way as the GL_QUAD_STRIPs GLU emits
+    row = np.arange(rows)[:, None] * (columns + 1)
+    col = np.arange(columns)[None, :]
+    a0 = (row + col).reshape(-1)
+    a1 = a0 + 1
+    b0 = a0 + columns + 1
+    b1 = b0 + 1
+    if flip:
+        a0, a1, b0, b1 = b0, b1, a0, a1
+    return np.stack([a0, b0, a1, a1, b0, b1], axis=1).astype(np.uint32).reshape(-1)
+
+# --------------------------
+# Static mesh living in GPU buffers
+# --------------------------
+class Mesh:
+    def __init__(self, vertices, indices):
+        self.vertex_count = len(vertices)
+        self.index_count = len(indices)
+        self.vbo, self.ibo = glGenBuffers(2)
+
+        glBindBuffer(GL_ARRAY_BUFFER, self.vbo)
+        glBufferData(GL_ARRAY_BUFFER, vertices.nbytes, vertices, GL_STATIC_DRAW)
+        glBindBuffer(GL_ELEMENT_ARRAY_BUFFER, self.ibo)
+        glBufferData(GL_ELEMENT_ARRAY_BUFFER, indices.nbytes, indices, GL_STATIC_DRAW)
+        glBindBuffer(GL_ARRAY_BUFFER, 0)
+        glBindBuffer(GL_ELEMENT_ARRAY_BUFFER, 0)
+
+    @property
+    def triangle_count(self):
+        return self.index_count // 3
+
+    def bind(self):
+        glBindBuffer(GL_ARRAY_BUFFER, self.vbo)
+        glBindBuffer(GL_ELEMENT_ARRAY_BUFFER, self.ibo)
+        glEnableClientState(GL_VERTEX_ARRAY)
+        glEnableClientState(GL_NORMAL_ARRAY)
+        glEnableClientState(GL_TEXTURE_COORD_ARRAY)
+        glVertexPointer(3, GL_FLOAT, VERTEX_STRIDE, ctypes.c_void_p(0))
+        glNormalPointer(GL_FLOAT, VERTEX_STRIDE, ctypes.c_void_p(NORMAL_OFFSET))
+        glTexCoordPointer(2, GL_FLOAT, VERTEX_STRIDE, ctypes.c_void_p(TEXCOORD_OFFSET))
+
+    def unbind(self):
+        glDisableClientState(GL_VERTEX_ARRAY)
+        glDisableClientState(GL_NORMAL_ARRAY)
+        glDisableClientState(GL_TEXTURE_COORD_ARRAY)
+        glBindBuffer(GL_ARRAY_BUFFER, 0)
+        glBindBuffer(GL_ELEMENT_ARRAY_BUFFER, 0)
+
+    def draw(self):
+        self.bind()
+        glDrawElements(GL_TRIANGLES, self.index_count, GL_UNSIGNED_INT, None)
+        self.unbind()
+
+    def release(self):
+        if self.vbo is not None:
+            glDeleteBuffers(2, [self.vbo, self.ibo])
+            self.vbo = self.ibo = None
+
+# --------------------------
+# Cache of unit meshes, tessellated once and scaled at draw time
+# --------------------------
+class MeshCache:
+    def __init__(self):
+        self.meshes = {}
+
+    def sphere(self, slices, stacks, orientation=GLU_OUTSIDE):
+        key = ("sphere", slices, stacks, orientation)
+        mesh = self.meshes.get(key)
+        if mesh is None:
+            mesh = Mesh(*build_sphere(slices, stacks, orientation == GLU_INSIDE))
+            self.meshes[key] = mesh
+        return mesh
+
+    def disk(self, inner_ratio, slices, loops, orientation=GLU_OUTSIDE):
+        # The hole is part of the key: texcoords depend on the inner/outer ratio
+        key = ("disk", slices, loops, orientation, round(inner_ratio, 4))
+        mesh = self.meshes.get(key)
+        if mesh is None:
+            mesh = Mesh(*build_disk(inner_ratio, slices, loops, orientation == GLU_INSIDE))
+            self.meshes[key] = mesh
+        return mesh
+
+    def cylinder(self, top_ratio, slices, stacks):
+        key = ("cylinder", slices, stacks, round(top_ratio, 4))
+        mesh = self.meshes.get(key)
+        if mesh is None:
+            mesh = Mesh(*build_cylinder(top_ratio, slices, stacks))
+            self.meshes[key] = mesh
+        return mesh
+
+    def quad(self, corners, texcoords=((0, 0), (1, 0), (1, 1), (0, 1))):
+        key = ("quad", tuple(map(tuple, corners)), tuple(map(tuple, texcoords)))
+        mesh = self.meshes.get(key)
+        if mesh is None:
+            mesh = Mesh(*build_quad(corners, texcoords))
+            self.meshes[key] = mesh
+        return mesh
+
+    def release(self):
+        for mesh in self.meshes.values():
+            mesh.release()
+        self.meshes.clear()
+
+# --------------------------
+# Draw many copies of one mesh with per-instance model matrices
+# --------------------------
+INSTANCED_VERTEX_SHADER = """
+attribute vec3 position;
+attribute vec2 texcoord;
+attribute mat4 model;
+uniform vec4 color;
+varying vec2 uv;
+varying vec4 tint;
+void main() {
+    uv = texcoord;
+    tint = clamp(color, 0.0, 1.0);
+    gl_Position = view_projection * model * vec4(position, 1.0);
+}
+"""
+
+INSTANCED_FRAGMENT_SHADER = """
+uniform sampler2D texture0;
+uniform float textured;
+varying vec2 uv;
+varying vec4 tint;
+void main() {
+    frag_color = mix(vec4(1.0), texture(texture0, uv), textured) * tint;
+}
+"""
+
+POSITION_ATTRIB = 0
+TEXCOORD_ATTRIB = 1
+MODEL_ATTRIB = 2 # A mat4 attribute takes four consecutive locations
+
+class InstancedRenderer:
+    def __init__(self, core=False):
+        # A core profile has no fixed-function fallback and needs a vertex
+        # array object bound for every draw
+        self.program = None
+        if bool(glDrawElementsInstanced) and bool(glVertexAttribDivisor):
+            self.program = compile_program(INSTANCED_VERTEX_SHADER, INSTANCED_FRAGMENT_SHADER, {
+                "position": POSITION_ATTRIB,
+                "texcoord": TEXCOORD_ATTRIB,
+                "model": MODEL_ATTRIB,
+            }, core)
+        if core and self.program is None:
+            raise RuntimeError("Instanced rendering is unavailable")
+        self.instance_vbo = glGenBuffers(1) if self.program is not None else None
+        self.vao = glGenVertexArrays(1) if core else None
+        # Running totals for the profiler
+        self.draw_calls = 0
+        self.vertices = 0
+
+    def draw(self, mesh, matrices, color=(1.0, 1.0, 1.0, 1.0), textured=True):
+        # matrices: (n, 4, 4) float32 array of column-major model matrices;
+        # textured: whether to sample the bound texture
+        if len(matrices) == 0:
+            return
+        self.vertices += mesh.index_count * len(matrices)
+        if self.program is None:
+            glColor4f(*color)
+            self._draw_fixed_function(mesh, matrices)
+            return
+
+        glUseProgram(self.program)
+        glUniform1i(glGetUniformLocation(self.program, "texture0"), 0)
+        glUniform4f(glGetUniformLocation(self.program, "color"), *color)
+        glUniform1f(glGetUniformLocation(self.program, "textured"), 1.0 if textured else 0.0)
+
+        if self.vao is not None:
+            glBindVertexArray(self.vao)
+        glBindBuffer(GL_ARRAY_BUFFER, mesh.vbo)
+        glEnableVertexAttribArray(POSITION_ATTRIB)
+        glEnableVertexAttribArray(TEXCOORD_ATTRIB)
+        glVertexAttribPointer(POSITION_ATTRIB, 3, GL_FLOAT, GL_FALSE, VERTEX_STRIDE, ctypes.c_void_p(0))
+        glVertexAttribPointer(TEXCOORD_ATTRIB, 2, GL_FLOAT, GL_FALSE, VERTEX_STRIDE, ctypes.c_void_p(TEXCOORD_OFFSET))
+
+        # Orphan the instance buffer each frame so the driver never stalls on it
+        matrices = np.ascontiguousarray(matrices, dtype=np.float32)
+        glBindBuffer(GL_ARRAY_BUFFER, self.instance_vbo)
+        glBufferData(GL_ARRAY_BUFFER, matrices.nbytes, None, GL_STREAM_DRAW)
+        glBufferSubData(GL_ARRAY_BUFFER, 0, matrices.nbytes, matrices)
+        for column in range(4):
+            location = MODEL_ATTRIB + column
+            glEnableVertexAttribArray(location)
+            glVertexAttribPointer(location, 4, GL_FLOAT, GL_FALSE, 64, ctypes.c_void_p(column * 16))
+            glVertexAttribDivisor(location, 1)
+
+        glBindBuffer(GL_ELEMENT_ARRAY_BUFFER, mesh.ibo)
+        glDrawElementsInstanced(GL_TRIANGLES, mesh.index_count, GL_UNSIGNED_INT, None, len(matrices))
+        self.draw_calls += 1
+
+        for column in range(4):
+            glVertexAttribDivisor(MODEL_ATTRIB + column, 0)
+            glDisableVertexAttribArray(MODEL_ATTRIB + column)
+        glDisableVertexAttribArray(POSITION_ATTRIB)
+        glDisableVertexAttribArray(TEXCOORD_ATTRIB)
+        if self.vao is not None:
+            glBindVertexArray(0)
+        glBindBuffer(GL_ARRAY_BUFFER, 0)
+        glBindBuffer(GL_ELEMENT_ARRAY_BUFFER, 0)
+        glUseProgram(0)
+
+    def _draw_fixed_function(self, mesh, matrices):
+        mesh.bind()
+        for matrix in matrices:
+            glPushMatrix()
+            glMultMatrixf(matrix)
+            glDrawElements(GL_TRIANGLES, mesh.index_count, GL_UNSIGNED_INT, None)
+            glPopMatrix()
+        mesh.unbind()
+        self.draw_calls += len(matrices)
+
+    def release(self):
+        if self.vao is not None:
+            glDeleteVertexArrays(1, [self.vao])
+            self.vao = None
+        if self.instance_vbo is not None:
+            glDeleteBuffers(1, [self.instance_vbo])
+            self.instance_vbo = None
+        if self.program is not None:
+            glDeleteProgram(self.program)
+            self.program = None
@@ -0,0 +1,460 @@
+import base64
+import hashlib
+import json
+import os
+import sys
+import threading
+
+import numpy as np
+
+from meshes import VERTEX_FLOATS, Mesh, build_cylinder, build_disk, build_quad, build_sphere
+from renderer import WHITE
+from transforms import rotate, scale, translate
+
+# Models are cached here, keyed by a hash of the source file or of what was baked
+MODEL_CACHE_DIR = ".model_cache"
+# Bump when the baked ships change so stale entries are ignored
+BAKE_VERSION = 2
+
+# --------------------------
+# Binary model file
+# --------------------------
+# A 64-byte header, a table of parts, then each part's vertices (the
+# interleaved layout of meshes.py) and uint32 indices, 16-byte aligned. A
+# part is one draw: a mesh with its color and texture. The arrays are
+# memory-mapped and go to the GPU as they are, without any parsing.
+MODEL_MAGIC = b"SSMODELS"
+MODEL_VERSION = 1
+MODEL_HEADER_SIZE = 64
+MODEL_HEADER = np.dtype([("magic", "S8"), ("version", "<u4"), ("part_count", "<u4")])
+MODEL_PART = np.dtype([
+    ("name", "S32"),
+    ("texture", "S256"), # Texture name or image path, empty for untextured
+    ("color", "<f4", 4),
+    ("vertex_offset", "<u8"),
+    ("vertex_count", "<u4"),
+    ("index_offset", "<u8"),
+    ("index_count", "<u4"),
+])
+
+class ModelPart:
+    def __init__(self, name, vertices, indices, color=WHITE, texture=None):
+        self.name = name
+        self.vertices = vertices # (n, VERTEX_FLOATS) float32
+        self.indices = indices   # uint32 triangle list
+        self.color = tuple(float(c) for c in color)
+        self.texture = texture or None
+
+def _aligned(offset):
+    return (offset + 15) // 16 * 16
+
+def _encoded_name(name, size):
+    # UTF-8, cut to size bytes on a character boundary
+    return name.encode()[:size].decode(errors="ignore").encode()
+
+def write_model(path, parts):
+    table = np.zeros(len(parts), dtype=MODEL_PART)
+    offset = _aligned(MODEL_HEADER_SIZE + table.nbytes)
+    for entry, part in zip(table, parts):
+        entry["name"] = _encoded_name(part.name, MODEL_PART["name"].itemsize)
+        texture = (part.texture or "").encode()
+        if len(texture) > MODEL_PART["texture"].itemsize:
+            # A cut path would name another file, or none
+            raise ValueError(f"texture path '{part.texture}' of part '{part.name}' is longer than "
+                             f"{MODEL_PART['texture'].itemsize} bytes")
+        entry["texture"] = texture
+        entry["color"] = part.color
+        entry["vertex_offset"], entry["vertex_count"] = offset, len(part.vertices)
+        offset = _aligned(offset + len(part.vertices) * VERTEX_FLOATS * 4)
+        entry["index_offset"], entry["index_count"] = offset, len(part.indices)
+        offset = _aligned(offset + len(part.indices) * 4)
+    header = np.zeros(1, dtype=MODEL_HEADER)
+    header["magic"], header["version"], header["part_count"] = MODEL_MAGIC, MODEL_VERSION, len(parts)
+
+    # Write to a temporary name first so a crash never leaves a torn file
+    # Unique per thread too, so two writers of one entry never share a file
+    tmp_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+    with open(tmp_path, "wb") as f:
+        f.write(header.tobytes().ljust(MODEL_HEADER_SIZE, b"\0"))
+        f.write(table.tobytes())
+        for entry, part in zip(table, parts):
+            for start, array in ((entry["vertex_offset"], part.vertices), (entry["index_offset"], part.indices)):
+                f.write(b"\0" * (int(start) - f.tell()))
+                f.write(np.ascontiguousarray(array, dtype=array.dtype).tobytes())
+    os.replace(tmp_path, path)
+
+def read_model(path):
+    data = np.memmap(path, dtype=np.uint8, mode="r")
+    header = np.frombuffer(data, dtype=MODEL_HEADER, count=1) if len(data) >= MODEL_HEADER_SIZE else []
+    if len(header) == 0 or header["magic"][0] != MODEL_MAGIC or header["version"][0] != MODEL_VERSION:
+        raise ValueError(f"'{path}' is not a version {MODEL_VERSION} model")
+    table = np.frombuffer(data, dtype=MODEL_PART, count=int(header["part_count"][0]), offset=MODEL_HEADER_SIZE)
+    parts = []
+    for entry in table:
+        # Views into the mapping: nothing is read until the upload touches it
+        vertices = np.frombuffer(data, dtype=np.float32, count=int(entry["vertex_count"]) * VERTEX_FLOATS,
+                                 offset=int(entry["vertex_offset"])).reshape(-1, VERTEX_FLOATS)
+        indices = np.frombuffer(data, dtype=np.uint32, count=int(entry["index_count"]),
+                                offset=int(entry["index_offset"]))
+        # Names are only for show; one cut mid-character by an older build still reads
+        parts.append(ModelPart(entry["name"].decode(errors="replace"), vertices, indices, entry["color"],
+                               entry["texture"].decode()))
+    return parts
+
+# --------------------------
+# Transform and merge parts
+# --------------------------
+def transformed(vertices, matrix):
+    # Positions by the matrix, normals by its inverse transpose
+    out = np.array(vertices, dtype=np.float32)
+    linear = matrix[:3, :3]
+    out[:, 0:3] = vertices[:, 0:3] @ linear.T + matrix[:3, 3]
+    normals = vertices[:, 3:6] @ np.linalg.inv(linear)
+    lengths = np.linalg.norm(normals, axis=1, keepdims=True)
+    out[:, 3:6] = normals / np.where(lengths > 0, lengths, 1.0)
+    return out
+
+def merge_parts(parts):
+    # Parts of the same color and texture become one, so each takes one draw
+    groups = {}
+    for part in parts:
+        groups.setdefault((part.color, part.texture), []).append(part)
+    merged = []
+    for (color, texture), group in groups.items():
+        offsets = np.cumsum([0] + [len(part.vertices) for part in group[:-1]])
+        merged.append(ModelPart(
+            group[0].name if len(group) == 1 else "+".join(part.name for part in group),
+            np.concatenate([part.vertices for part in group]).astype(np.float32),
+            np.concatenate([part.indices + offset for part, offset in zip(group, offsets)]).astype(np.uint32),
+            color, texture))
+    return merged
+
+# --------------------------
+# Ships baked from the procedural builders
+# --------------------------
+# In units of the ship's size; the rocket points along +z with its nozzle
+# at z = -0.1, where the flame is attached (see main.py)
+
+# One fin of a rocket of size 1, in the x-z plane
+FIN_CORNERS = ((0.2, 0, 0), (0.2 + 1 / 3, 0, 0.1), (0.2 + 1 / 3, 0, 0.5), (0.2, 0, 0.5))
+ENGINE_BELL_COLOR = (0.4, 0.4, 0.4, 1.0)
+
+def bake_rocket(texture="Metal"):
+    body_height = 0.7
+    body_radius = 1.0 / 5.0
+    stage2_height = 0.5
+    stage2_radius = body_radius * 0.7
+    cone_height = 0.5
+    stage2 = translate(0, 0, body_height)
+    pieces = [
+        ("body", build_cylinder(1.0, 20, 5), scale(body_radius, body_radius, body_height), WHITE),
+        ("base", build_disk(0.0, 20, 1), scale(body_radius), WHITE),
+        ("connector", build_cylinder(stage2_radius / body_radius, 20, 5),
+         stage2 @ scale(body_radius, body_radius, stage2_height * 0.2), WHITE),
+        ("stage2", build_cylinder(1.0, 20, 5),
+         stage2 @ translate(0, 0, stage2_height * 0.2) @ scale(stage2_radius, stage2_radius, stage2_height), WHITE),
+        ("nose", build_cylinder(0.0, 20, 5),
+         translate(0, 0, body_height + stage2_height * 1.2) @ scale(stage2_radius, stage2_radius, cone_height), WHITE),
+    ]
+    fin = build_quad(FIN_CORNERS, ((0, 0), (1, 0), (1, 1), (0, 1)))
+    pieces += [(f"fin{i}", fin, rotate(i * 120, 0, 0, 1), WHITE) for i in range(3)]
+    pieces.append(("engine bell", build_cylinder(0.5 / 0.8, 20, 5),
+                   translate(0, 0, -0.1) @ scale(body_radius * 0.8, body_radius * 0.8, 0.2), ENGINE_BELL_COLOR))
+    return merge_parts([ModelPart(name, transformed(vertices, matrix), indices, color, texture)
+                        for name, (vertices, indices), matrix, color in pieces])
+
+def bake_ufo(slices, stacks):
+    # The dome and the light get 2/3 of the saucer's slices, as when the
+    # UFO was drawn with a 30x10 saucer, a 20x10 dome and a 20-slice light
+    saucer = build_sphere(slices, stacks)
+    dome = build_sphere(slices * 2 // 3, stacks)
+    light = build_disk(0.0, slices * 2 // 3, 1)
+    return merge_parts([
+        # Main saucer body, flattened into a saucer
+        ModelPart("saucer", transformed(saucer[0], scale(1.0, 0.3, 1.0)), saucer[1], (0.6, 0.6, 0.7, 1.0)),
+        # Cockpit dome
+        ModelPart("dome", transformed(dome[0], translate(0, 0.2, 0) @ scale(0.5)), dome[1], (0.5, 0.8, 0.9, 1.0)),
+        # Underside light
+        ModelPart("light", transformed(light[0], scale(0.3)), light[1], (0.8, 1.0, 0.8, 1.0)),
+    ])
+
+# --------------------------
+# Wavefront OBJ (with its MTL colors and diffuse maps)
+# --------------------------
+def _obj_index(text, count):
+    # 1-based, or negative from the end of the list so far
+    index = int(text)
+    return index - 1 if index > 0 else count + index
+
+def _read_mtl(path):
+    materials, current = {}, None
+    with open(path) as f:
+        for line in f:
+            words = line.split()
+            if not words:
+                continue
+            if words[0] == "newmtl":
+                current = materials.setdefault(" ".join(words[1:]), {"color": [1.0, 1.0, 1.0, 1.0], "texture": None})
+            elif current is None:
+                continue
+            elif words[0] == "Kd":
+                current["color"][:3] = map(float, words[1:4])
+            elif words[0] == "d":
+                current["color"][3] = float(words[1])
+            elif words[0] == "Tr":
+                current["color"][3] = 1.0 - float(words[1])
+            elif words[0] == "map_Kd":
+                current["texture"] = os.path.join(os.path.dirname(path), words[-1])
+    return materials
+
+def load_obj(path):
+    positions, texcoords, normals = [], [], []
+    materials = {}
+    # Per material: vertex index of each (v, vt, vn) triple, vertices, indices
+    groups = {}
+    group = None
+    with open(path) as f:
+        for line in f:
+            words = line.split()
+            if not words or words[0].startswith("#"):
+                continue
+            if words[0] == "v":
+                positions.append([float(w) for w in words[1:4]])
+            elif words[0] == "vt":
+                texcoords.append([float(w) for w in words[1:3]])
+            elif words[0] == "vn":
+                normals.append([float(w) for w in words[1:4]])
+            elif words[0] == "mtllib":
+                mtl_path = os.path.join(os.path.dirname(path), " ".join(words[1:]))
+                if os.path.exists(mtl_path):
+                    materials.update(_read_mtl(mtl_path))
+            elif words[0] == "usemtl":
+                material = " ".join(words[1:])
+                group = groups.setdefault(material, ({}, [], []))
+            elif words[0] == "f":
+                if group is None:
+                    group = groups.setdefault(None, ({}, [], []))
+                lookup, vertices, indices = group
+                corners = []
+                for word in words[1:]:
+                    refs = (word.split("/") + ["", ""])[:3]
+                    key = (_obj_index(refs[0], len(positions)),
+                           _obj_index(refs[1], len(texcoords)) if refs[1] else None,
+                           _obj_index(refs[2], len(normals)) if refs[2] else None)
+                    if key not in lookup:
+                        lookup[key] = len(vertices)
+                        vertices.append(positions[key[0]] + [0.0, 0.0, 0.0] +
+                                        (texcoords[key[1]] if key[1] is not None else [0.0, 0.0]))
+                        if key[2] is not None:
+                            vertices[-1][3:6] = normals[key[2]]
+                    corners.append(lookup[key])
+                # Polygons as triangle fans
+                for i in range(1, len(corners) - 1):
+                    indices += [corners[0], corners[i], corners[i + 1]]
+
+    parts = []
+    for material, (lookup, vertices, indices) in groups.items():
+        if not indices:
+            continue
+        vertices = np.array(vertices, dtype=np.float32)
+        indices = np.array(indices, dtype=np.uint32)
+        missing = ~np.array([key[2] is not None for key in lookup], dtype=bool)
+        if missing.any():
+            # Smooth normals from the faces around each vertex
+            triangles = vertices[indices.reshape(-1, 3), 0:3]
+            face = np.cross(triangles[:, 1] - triangles[:, 0], triangles[:, 2] - triangles[:, 0])
+            smooth = np.zeros((len(vertices), 3))
+            for corner in range(3):
+                np.add.at(smooth, indices.reshape(-1, 3)[:, corner], face)
+            lengths = np.linalg.norm(smooth, axis=1, keepdims=True)
+            vertices[missing, 3:6] = (smooth / np.where(lengths > 0, lengths, 1.0))[missing]
+        info = materials.get(material, {"color": WHITE, "texture": None})
+        parts.append(ModelPart(material or "default", vertices, indices, info["color"], info["texture"]))
+    return merge_parts(parts)
+
+# --------------------------
+# glTF 2.0 (.gltf with external or embedded buffers, or .glb)
+# --------------------------
+GLB_MAGIC = b"glTF"
+GLB_JSON_CHUNK = 0x4E4F534A
+GLB_BIN_CHUNK = 0x004E4942
+GLTF_COMPONENTS = {5120: np.int8, 5121: np.uint8, 5122: np.int16, 5123: np.uint16, 5125: np.uint32, 5126: np.float32}
+GLTF_TYPE_SIZES = {"SCALAR": 1, "VEC2": 2, "VEC3": 3, "VEC4": 4, "MAT4": 16}
+GLTF_TRIANGLES = 4
+
+def _gltf_buffers(path, gltf, glb_chunk):
+    buffers = []
+    for buffer in gltf.get("buffers", []):
+        uri = buffer.get("uri")
+        if uri is None:
+            buffers.append(glb_chunk)
+        elif uri.startswith("data:"):
+            buffers.append(base64.b64decode(uri.split(",", 1)[1]))
+        else:
+            with open(os.path.join(os.path.dirname(path), uri), "rb") as f:
+                buffers.append(f.read())
+    return buffers
+
+def _gltf_accessor(gltf, buffers, index):
+    accessor = gltf["accessors"][index]
+    if "sparse" in accessor or "bufferView" not in accessor:
+        raise ValueError("sparse and empty glTF accessors are not supported")
+    view = gltf["bufferViews"][accessor["bufferView"]]
+    dtype = np.dtype(GLTF_COMPONENTS[accessor["componentType"]])
+    size = GLTF_TYPE_SIZES[accessor["type"]]
+    stride = view.get("byteStride") or dtype.itemsize * size
+    offset = view.get("byteOffset", 0) + accessor.get("byteOffset", 0)
+    values = np.ndarray((accessor["count"], size), dtype=dtype, buffer=buffers[view["buffer"]],
+                        offset=offset, strides=(stride, dtype.itemsize))
+    if accessor.get("normalized") and dtype.kind in "iu":
+        return np.maximum(values / np.iinfo(dtype).max, -1.0)
+    return values.astype(np.float64) if dtype.kind == "f" else values
+
+def _gltf_node_matrix(node):
+    if "matrix" in node:
+        return np.array(node["matrix"], dtype=np.float64).reshape(4, 4).T
+    x, y, z, w = node.get("rotation", (0.0, 0.0, 0.0, 1.0))
+    rotation = np.array([
+        [1 - 2 * (y * y + z * z), 2 * (x * y - z * w), 2 * (x * z + y * w), 0],
+        [2 * (x * y + z * w), 1 - 2 * (x * x + z * z), 2 * (y * z - x * w), 0],
+        [2 * (x * z - y * w), 2 * (y * z + x * w), 1 - 2 * (x * x + y * y), 0],
+        [0, 0, 0, 1]])
+    return translate(*node.get("translation", (0, 0, 0))) @ rotation @ scale(*node.get("scale", (1, 1, 1)))
+
+def load_gltf(path):
+    with open(path, "rb") as f:
+        data = f.read()
+    glb_chunk = None
+    if data[:4] == GLB_MAGIC:
+        # 12-byte header, then chunks of (length, type, data)
+        offset, gltf = 12, None
+        while offset < len(data):
+            length, kind = np.frombuffer(data, dtype="<u4", count=2, offset=offset)
+            chunk = data[offset + 8:offset + 8 + int(length)]
+            if kind == GLB_JSON_CHUNK:
+                gltf = json.loads(chunk)
+            elif kind == GLB_BIN_CHUNK:
+                glb_chunk = chunk
+            offset += 8 + int(length)
+    else:
+        gltf = json.loads(data)
+    buffers = _gltf_buffers(path, gltf, glb_chunk)
+
+    def material(index):
+        if index is None:
+            return WHITE, None
+        pbr = gltf["materials"][index].get("pbrMetallicRoughness", {})
+        texture = None
+        if "baseColorTexture" in pbr:
+            image = gltf["images"][gltf["textures"][pbr["baseColorTexture"]["index"]]["source"]]
+            if "uri" in image and not image["uri"].startswith("data:"):
+                texture = os.path.join(os.path.dirname(path), image["uri"])
+            else:
+                print(f"Warning: '{path}' embeds its images; drawing them untextured")
+        return pbr.get("baseColorFactor", WHITE), texture
+
+    parts = []
+    def visit(node_index, parent):
+        node = gltf["nodes"][node_index]
+        matrix = parent @ _gltf_node_matrix(node)
+        if "mesh" in node:
+            mesh = gltf["meshes"][node["mesh"]]
+            for primitive in mesh["primitives"]:
+                if primitive.get("mode", GLTF_TRIANGLES) != GLTF_TRIANGLES:
+                    print(f"Warning: Skipping a non-triangle primitive of '{path}'")
+                    continue
+                attributes = primitive["attributes"]
+                positions = _gltf_accessor(gltf, buffers, attributes["POSITION"])
+                vertices = np.zeros((len(positions), VERTEX_FLOATS), dtype=np.float32)
+                vertices[:, 0:3] = positions
+                if "NORMAL" in attributes:
+                    vertices[:, 3:6] = _gltf_accessor(gltf, buffers, attributes["NORMAL"])
+                if "TEXCOORD_0" in attributes:
+                    # glTF puts v = 0 at the top of the image, GL at the bottom
+                    uv = _gltf_accessor(gltf, buffers, attributes["TEXCOORD_0"])
+                    vertices[:, 6], vertices[:, 7] = uv[:, 0], 1.0 - uv[:, 1]
+                if "indices" in primitive:
+                    indices = _gltf_accessor(gltf, buffers, primitive["indices"]).reshape(-1).astype(np.uint32)
+                else:
+                    indices = np.arange(len(vertices), dtype=np.uint32)
+                color, texture = material(primitive.get("material"))
+                parts.append(ModelPart(mesh.get("name", "mesh"), transformed(vertices, matrix), indices,
+                                       color, texture))
+        for child in node.get("children", []):
+            visit(child, matrix)
+
+    scenes = gltf.get("scenes", [])
+    roots = scenes[gltf.get("scene", 0)]["nodes"] if scenes else range(len(gltf.get("nodes", [])))
+    for root in roots:
+        visit(root, np.eye(4))
+    if not parts:
+        raise ValueError(f"'{path}' has no triangles")
+    return merge_parts(parts)
+
+# --------------------------
+# Load through the cache
+# --------------------------
+MODEL_LOADERS = {".obj": load_obj, ".gltf": load_gltf, ".glb": load_gltf}
+
+def cached_parts(key, build, cache_dir=MODEL_CACHE_DIR):
+    # The parts cached under key, or build() them and cache them; a cached
+    # model is memory-mapped, not parsed
+    if not cache_dir:
+        return build()
+    path = os.path.join(cache_dir, f"{key}.v{MODEL_VERSION}.model")
+    try:
+        return read_model(path)
+    except (OSError, ValueError):
+        pass
+    parts = build()
+    try:
+        os.makedirs(cache_dir, exist_ok=True)
+        write_model(path, parts)
+        return read_model(path)
+    except (OSError, ValueError) as e:
+        # The parts as built still draw; they are just parsed again next time
+        print(f"Warning: Could not write model cache entry '{path}': {e}")
+        return parts
+
+def load_model_parts(path, cache_dir=MODEL_CACHE_DIR):
+    # An OBJ or glTF file, or a model file written by write_model()
+    extension = os.path.splitext(path)[1].lower()
+    if extension not in MODEL_LOADERS:
+        return read_model(path)
+    with open(path, "rb") as f:
+        key = hashlib.sha1(f.read()).hexdigest()
+    return cached_parts(key, lambda: MODEL_LOADERS[extension](path), cache_dir)
+
+def baked_parts(name, build, *params, cache_dir=MODEL_CACHE_DIR):
+    key = f"{name}-{'x'.join(map(str, params)) or 'default'}-b{BAKE_VERSION}"
+    return cached_parts(key, lambda: build(*params), cache_dir)
+
+# --------------------------
+# A model on the GPU: one mesh per part
+# --------------------------
+class Model:
+    def __init__(self, parts):
+        # (mesh, color, texture) per part
+        self.parts = [(Mesh(part.vertices, part.indices), part.color, part.texture) for part in parts]
+        self.triangle_count = sum(mesh.triangle_count for mesh, _, _ in self.parts)
+
+    def release(self):
+        for mesh, _, _ in self.parts:
+            mesh.release()
+        self.parts = []
+
+# --------------------------
+# Convert a model: python models.py SOURCE [OUT]
+# --------------------------
+# Reads an OBJ or glTF file and writes it as a model file (by default
+# next to it, with a .model extension) that main.py maps without parsing
+if __name__ == "__main__":
+    source = sys.argv[1]
+    out = sys.argv[2] if len(sys.argv) > 2 else os.path.splitext(source)[0] + ".model"
+    parts = MODEL_LOADERS[os.path.splitext(source)[1].lower()](source)
+    write_model(out, parts)
+    for part in read_model(out):
+        color = ", ".join(f"{c:.3g}" for c in part.color)
+        print(f"{part.name}: {len(part.indices) // 3:,} triangles, color ({color}), "
+              f"texture {part.texture or '-'}")
+    print(f"Wrote '{out}' ({os.path.getsize(out) / 1e3:.1f} kB)")
@@ -0,0 +1,205 @@
+import ctypes
+import math
+
+import numpy as np
+from OpenGL.GL import *
+
+from shaders import compile_program
+
+# Points per orbit ring
+ORBIT_SEGMENTS = 100
+
+# --------------------------
+# Sample one orbit (around the Sun at the origin, in the x-z plane)
+# --------------------------
+def build_orbit(semi_major, eccentricity=0.0, inclination=0.0, node=0.0, periapsis=0.0,
+                segments=ORBIT_SEGMENTS):
+    # Angles in degrees. The ellipse is sampled evenly in eccentric anomaly,
+    # which puts more points where it curves most; the Sun sits at a focus
+    anomaly = 2 * np.pi * np.arange(segments) / segments
+    semi_minor = semi_major * math.sqrt(1.0 - eccentricity * eccentricity)
+    x = semi_major * (np.cos(anomaly) - eccentricity)
+    z = semi_minor * np.sin(anomaly)
+
+    # Turn the ellipse within its plane, tilt the plane about the line of
+    # nodes, then turn the line of nodes about the Sun's axis
+    w, i, n = math.radians(periapsis), math.radians(inclination), math.radians(node)
+    x, z = x * math.cos(w) - z * math.sin(w), x * math.sin(w) + z * math.cos(w)
+    y = z * math.sin(i)
+    z = z * math.cos(i)
+    x, z = x * math.cos(n) - z * math.sin(n), x * math.sin(n) + z * math.cos(n)
+    return np.stack([x, y, z], axis=1).astype(np.float32)
+
+# --------------------------
+# Draw every orbit ring, with all its glow layers, from static buffers
+# --------------------------
+# Each segment of each ring becomes a screen-aligned ribbon (two triangles)
+# per glow layer; the vertex shader widens it to the layer's width in
+# pixels, so the whole glow goes out in one draw call
+ORBIT_VERTEX_SHADER = """
+attribute vec3 position;
+attribute vec3 other;  // The other end of this vertex's segment
+attribute vec2 corner; // x: which side of the ribbon, y: glow layer
+uniform vec2 layers[4]; // Width in pixels and alpha per glow layer
+uniform vec3 orbit_color;
+varying vec4 color;
+void main() {
+    vec2 layer = layers[int(corner.y)];
+    color = vec4(orbit_color, layer.y);
+
+    vec4 here = view_projection * vec4(position, 1.0);
+    vec4 there = view_projection * vec4(other, 1.0);
+    // Clip the segment against the near plane so it can't flip behind the eye
+    float near = 1e-3;
+    if (here.w < near) {
+        if (there.w < near) {
+            gl_Position = vec4(0.0, 0.0, 0.0, 0.0);
+            return;
+        }
+        here = mix(here, there, (near - here.w) / (there.w - here.w));
+    } else if (there.w < near) {
+        there = mix(there, here, (near - there.w) / (here.w - there.w));
+    }
+
+    vec2 direction = (there.xy / there.w - here.xy / here.w) * viewport;
+    direction = length(direction) > 0.0 ? normalize(direction) : vec2(1.0, 0.0);
+    vec2 offset = vec2(-direction.y, direction.x) * corner.x * layer.x / viewport;
+    gl_Position = here + vec4(offset * here.w, 0.0, 0.0);
+}
+"""
+
+ORBIT_FRAGMENT_SHADER = """
+varying vec4 color;
+void main() {
+    frag_color = color;
+}
+"""
+
+POSITION_ATTRIB = 0
+OTHER_ATTRIB = 1
+CORNER_ATTRIB = 2
+
+# position, other end, corner
+RIBBON_FLOATS = 8
+RIBBON_STRIDE = RIBBON_FLOATS * 4
+
+# Layers are drawn in order, so the faint wide glow goes first
+MAX_GLOW_LAYERS = 4
+
+class OrbitRenderer:
+    def __init__(self, core=False):
+        self.program = compile_program(ORBIT_VERTEX_SHADER, ORBIT_FRAGMENT_SHADER, {
+            "position": POSITION_ATTRIB,
+            "other": OTHER_ATTRIB,
+            "corner": CORNER_ATTRIB,
+        }, core)
+        if core and self.program is None:
+            raise RuntimeError("Orbit shader is unavailable")
+        self.core = core
+        self.vbo = glGenBuffers(1)
+        self.vao = glGenVertexArrays(1) if core else None
+        self.key = None
+        self.vertex_count = 0
+        # Running totals for the profiler
+        self.draw_calls = 0
+        self.vertices = 0
+        # First point and point count of each ring in the fixed-function buffer
+        self.firsts = self.counts = None
+
+    def update(self, orbits, glow_layers):
+        # orbits: one (semi_major, eccentricity, inclination, node, periapsis)
+        # tuple per ring; glow_layers: (line width, alpha) pairs. Geometry is
+        # only rebuilt when either of them changes.
+        key = (tuple(orbits), tuple(glow_layers))
+        if key == self.key:
+            return
+        self.key = key
+        rings = [build_orbit(*orbit) for orbit in orbits]
+
+        if self.program is None:
+            # Plain line loops, one glMultiDrawArrays per glow layer
+            vertices = np.concatenate(rings)
+            self.counts = np.array([len(ring) for ring in rings], dtype=np.int32)
+            self.firsts = (np.cumsum(self.counts) - self.counts).astype(np.int32)
+        else:
+            vertices = self._build_ribbons(rings, len(glow_layers))
+        self.vertex_count = len(vertices)
+        glBindBuffer(GL_ARRAY_BUFFER, self.vbo)
+        glBufferData(GL_ARRAY_BUFFER, vertices.nbytes, vertices, GL_STATIC_DRAW)
+        glBindBuffer(GL_ARRAY_BUFFER, 0)
+
+    def _build_ribbons(self, rings, layer_count):
+        # Segment a->b becomes the triangles (a-, b-, b+) and (a-, b+, a+)
+        starts = np.concatenate(rings)
+        ends = np.concatenate([np.roll(ring, -1, axis=0) for ring in rings])
+        ends_of, sides = (0, 1, 1, 0, 1, 0), (-1, -1, 1, -1, 1, 1)
+        segment = np.empty((len(starts), 6, RIBBON_FLOATS), dtype=np.float32)
+        for k, (at_end, side) in enumerate(zip(ends_of, sides)):
+            segment[:, k, 0:3] = ends if at_end else starts
+            segment[:, k, 3:6] = starts if at_end else ends
+            # Seen from the far end the segment points the other way, so the
+            # side flips to stay on the same edge of the ribbon
+            segment[:, k, 6] = -side if at_end else side
+        layers = np.repeat(segment[None], layer_count, axis=0)
+        layers[:, :, :, 7] = np.arange(layer_count, dtype=np.float32)[:, None, None]
+        return layers.reshape(-1, RIBBON_FLOATS)
+
+    def draw(self, color, glow_layers):
+        if not self.vertex_count:
+            return
+        glBindBuffer(GL_ARRAY_BUFFER, self.vbo)
+        # Every glow layer covers the same pixels at the same depth
+        glDepthFunc(GL_LEQUAL)
+        if self.program is None:
+            # Orbits are not textured
+            glDisable(GL_TEXTURE_2D)
+            glEnableClientState(GL_VERTEX_ARRAY)
+            glVertexPointer(3, GL_FLOAT, 0, ctypes.c_void_p(0))
+            for line_width, alpha in glow_layers:
+                glLineWidth(line_width)
+                glColor4f(*color, alpha)
+                glMultiDrawArrays(GL_LINE_LOOP, self.firsts, self.counts, len(self.counts))
+                self.draw_calls += 1
+                self.vertices += self.vertex_count
+            glDisableClientState(GL_VERTEX_ARRAY)
+            glLineWidth(1.0)
+            glEnable(GL_TEXTURE_2D)
+        else:
+            glUseProgram(self.program)
+            layers = np.zeros((MAX_GLOW_LAYERS, 2), dtype=np.float32)
+            layers[:len(glow_layers)] = glow_layers
+            glUniform2fv(glGetUniformLocation(self.program, "layers"), MAX_GLOW_LAYERS, layers)
+            if not self.core:
+                # A core profile gets the viewport from the Camera block
+                viewport = glGetIntegerv(GL_VIEWPORT)
+                glUniform2f(glGetUniformLocation(self.program, "viewport"), viewport[2], viewport[3])
+            glUniform3f(glGetUniformLocation(self.program, "orbit_color"), *color)
+
+            if self.vao is not None:
+                glBindVertexArray(self.vao)
+            glEnableVertexAttribArray(POSITION_ATTRIB)
+            glEnableVertexAttribArray(OTHER_ATTRIB)
+            glEnableVertexAttribArray(CORNER_ATTRIB)
+            glVertexAttribPointer(POSITION_ATTRIB, 3, GL_FLOAT, GL_FALSE, RIBBON_STRIDE, ctypes.c_void_p(0))
+            glVertexAttribPointer(OTHER_ATTRIB, 3, GL_FLOAT, GL_FALSE, RIBBON_STRIDE, ctypes.c_void_p(12))
+            glVertexAttribPointer(CORNER_ATTRIB, 2, GL_FLOAT, GL_FALSE, RIBBON_STRIDE, ctypes.c_void_p(24))
+            glDrawArrays(GL_TRIANGLES, 0, self.vertex_count)
+            self.draw_calls += 1
+            self.vertices += self.vertex_count
+            glDisableVertexAttribArray(POSITION_ATTRIB)
+            glDisableVertexAttribArray(OTHER_ATTRIB)
+            glDisableVertexAttribArray(CORNER_ATTRIB)
+            if self.vao is not None:
+                glBindVertexArray(0)
+            glUseProgram(0)
+        glDepthFunc(GL_LESS)
+        glBindBuffer(GL_ARRAY_BUFFER, 0)
+
+    def release(self):
+        if self.vao is not None:
+            glDeleteVertexArrays(1, [self.vao])
+            self.vao = None
+        glDeleteBuffers(1, [self.vbo])
+        if self.program is not None:
+            glDeleteProgram(self.program)
+            self.program = None
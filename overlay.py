@@ -0,0 +1,264 @@
+import ctypes
+
+import numpy as np
+from OpenGL.GL import *
+
+from shaders import compile_program
+
+# Interleaved overlay vertex: position (2 floats), color (4 floats), texcoord (2 floats)
+VERTEX_FLOATS = 8
+VERTEX_STRIDE = VERTEX_FLOATS * 4
+COLOR_OFFSET = 2 * 4
+TEXCOORD_OFFSET = 6 * 4
+
+BLEND_ALPHA = (GL_SRC_ALPHA, GL_ONE_MINUS_SRC_ALPHA)
+BLEND_ADDITIVE = (GL_SRC_ALPHA, GL_ONE)
+
+# Streaming buffer size to start with; it doubles whenever a frame needs more
+INITIAL_VERTICES = 4096
+
+# A core profile has no client arrays, no GL_QUADS, no texture enable and
+# no lines wider than a pixel, so there the overlay goes through this
+# shader, quads are split into triangles by a static index buffer and
+# lines are drawn as quads (see OverlayBatch.lines)
+OVERLAY_VERTEX_SHADER = """
+attribute vec2 position;
+attribute vec4 color;
+attribute vec2 texcoord;
+varying vec4 tint;
+varying vec2 uv;
+void main() {
+    tint = color;
+    uv = texcoord;
+    gl_Position = view_projection * vec4(position, 0.0, 1.0);
+}
+"""
+
+OVERLAY_FRAGMENT_SHADER = """
+uniform sampler2D texture0;
+uniform float textured;
+varying vec4 tint;
+varying vec2 uv;
+void main() {
+    frag_color = mix(vec4(1.0), texture(texture0, uv), textured) * tint;
+}
+"""
+
+POSITION_ATTRIB = 0
+COLOR_ATTRIB = 1
+TEXCOORD_ATTRIB = 2
+
+# --------------------------
+# 2D overlay batcher: collect a frame's lines, quads and sprites, draw them at once
+# --------------------------
+class OverlayBatch:
+    # Everything submitted between begin() and flush() is grouped by
+    # (layer, texture, blend, primitive, line width) and drawn with one
+    # glDrawArrays per group out of a single streamed vertex buffer. Layers
+    # keep the painter's order where overlapping elements need it; within a
+    # layer, groups are sorted so texture and blend changes are minimal.
+    def __init__(self, core=False):
+        self.vbo = glGenBuffers(1)
+        self.capacity = 0
+        self.program = self.vao = self.quad_ibo = None
+        if core:
+            self.program = compile_program(OVERLAY_VERTEX_SHADER, OVERLAY_FRAGMENT_SHADER, {
+                "position": POSITION_ATTRIB,
+                "color": COLOR_ATTRIB,
+                "texcoord": TEXCOORD_ATTRIB,
+            }, core)
+            if self.program is None:
+                raise RuntimeError("Overlay shader is unavailable")
+            self.textured = glGetUniformLocation(self.program, "textured")
+            self.vao = glGenVertexArrays(1)
+            self.quad_ibo = glGenBuffers(1)
+        self.batches = {}
+        # Running totals for the profiler
+        self.draw_calls = 0
+        self.vertices = 0
+
+    def begin(self):
+        self.batches.clear()
+
+    def add(self, vertices, primitive=GL_QUADS, texture=0, blend=BLEND_ALPHA, layer=0, line_width=1.0):
+        # vertices: (n, 8) float32 array in the overlay vertex layout
+        if len(vertices):
+            key = (layer, texture, blend, primitive, line_width)
+            self.batches.setdefault(key, []).append(vertices)
+
+    def colored(self, vertices, primitive=GL_QUADS, blend=BLEND_ALPHA, layer=0, line_width=1.0):
+        # vertices: (n, 6) array of x, y, r, g, b, a, e.g. ParticlePool.quads()
+        batch = np.zeros((len(vertices), VERTEX_FLOATS), dtype=np.float32)
+        batch[:, :6] = vertices
+        self.add(batch, primitive, 0, blend, layer, line_width)
+
+    def lines(self, starts, ends, colors, width=1.0, blend=BLEND_ALPHA, layer=0):
+        # starts, ends: (n, 2) points; colors: (n, 4) RGBA, one per line
+        n = len(starts)
+        colors = np.asarray(colors, dtype=np.float32).reshape(n, 1, 4)
+        if self.program is None:
+            batch = np.zeros((n, 2, VERTEX_FLOATS), dtype=np.float32)
+            batch[:, 0, :2] = starts
+            batch[:, 1, :2] = ends
+            batch[:, :, 2:6] = colors
+            self.add(batch.reshape(-1, VERTEX_FLOATS), GL_LINES, 0, blend, layer, width)
+            return
+        # Core profile: each line becomes a quad width pixels across, as the
+        # orbit ribbons are
+        starts = np.asarray(starts, dtype=np.float32).reshape(n, 2)
+        ends = np.asarray(ends, dtype=np.float32).reshape(n, 2)
+        direction = ends - starts
+        length = np.linalg.norm(direction, axis=1, keepdims=True)
+        direction = np.where(length > 0.0, direction / np.maximum(length, 1e-6), np.float32((1.0, 0.0)))
+        side = np.stack([-direction[:, 1], direction[:, 0]], axis=1) * (width / 2.0)
+        batch = np.zeros((n, 4, VERTEX_FLOATS), dtype=np.float32)
+        batch[:, 0, :2] = starts - side
+        batch[:, 1, :2] = ends - side
+        batch[:, 2, :2] = ends + side
+        batch[:, 3, :2] = starts + side
+        batch[:, :, 2:6] = colors
+        self.add(batch.reshape(-1, VERTEX_FLOATS), GL_QUADS, 0, blend, layer)
+
+    def sprites(self, texture, centers, sizes, angles=None, colors=(1, 1, 1, 1),
+                uv=(0, 0, 1, 1), blend=BLEND_ALPHA, layer=0):
+        # Rotated textured quads. centers, sizes: (n, 2); angles: (n,) in
+        # degrees, counter-clockwise as with glRotatef; uv is the
+        # (u0, v0, u1, v1) rectangle, u0/v0 at the (-x, -y) corner
+        centers = np.asarray(centers, dtype=np.float32).reshape(-1, 2)
+        n = len(centers)
+        half = np.broadcast_to(np.asarray(sizes, dtype=np.float32).reshape(-1, 2) / 2, (n, 2))
+        corners = np.array([(-1, -1), (1, -1), (1, 1), (-1, 1)], dtype=np.float32)
+        offsets = corners[None, :, :] * half[:, None, :]
+        if angles is not None:
+            radians = np.radians(np.asarray(angles, dtype=np.float32)).reshape(-1, 1)
+            c, s = np.cos(radians), np.sin(radians)
+            ox, oy = offsets[:, :, 0].copy(), offsets[:, :, 1].copy()
+            offsets[:, :, 0] = ox * c - oy * s
+            offsets[:, :, 1] = ox * s + oy * c
+
+        u0, v0, u1, v1 = uv
+        batch = np.empty((n, 4, VERTEX_FLOATS), dtype=np.float32)
+        batch[:, :, :2] = centers[:, None, :] + offsets
+        batch[:, :, 2:6] = np.asarray(colors, dtype=np.float32).reshape(-1, 1, 4)
+        batch[:, :, 6:] = [(u0, v0), (u1, v0), (u1, v1), (u0, v1)]
+        self.add(batch.reshape(-1, VERTEX_FLOATS), GL_QUADS, texture, blend, layer)
+
+    def sprite(self, texture, x, y, w, h, angle=0.0, color=(1, 1, 1, 1), uv=(0, 0, 1, 1),
+               blend=BLEND_ALPHA, layer=0):
+        self.sprites(texture, (x, y), (w, h), None if angle == 0.0 else (angle,),
+                     color, uv, blend, layer)
+
+    def flush(self):
+        # Upload every batch into the streaming buffer in one go, then draw
+        # the groups in sorted order
+        keys = sorted(self.batches)
+        groups = [np.concatenate(self.batches[key]) if len(self.batches[key]) > 1 else self.batches[key][0]
+                  for key in keys]
+        self.batches.clear()
+        self.vertices += sum(len(group) for group in groups)
+        self.draw_calls += len(groups)
+        if not groups:
+            return
+        vertices = np.ascontiguousarray(np.concatenate(groups), dtype=np.float32)
+
+        if self.vao is not None:
+            glBindVertexArray(self.vao)
+        glBindBuffer(GL_ARRAY_BUFFER, self.vbo)
+        if len(vertices) > self.capacity:
+            self.capacity = max(INITIAL_VERTICES, 1 << (len(vertices) - 1).bit_length())
+            if self.quad_ibo is not None:
+                self._build_quad_indices()
+        # Orphan last frame's storage so the upload never waits on the GPU
+        glBufferData(GL_ARRAY_BUFFER, self.capacity * VERTEX_STRIDE, None, GL_STREAM_DRAW)
+        glBufferSubData(GL_ARRAY_BUFFER, 0, vertices.nbytes, vertices)
+
+        if self.program is not None:
+            self._draw_core(keys, groups)
+        else:
+            self._draw_fixed_function(keys, groups)
+        glBindBuffer(GL_ARRAY_BUFFER, 0)
+        # Leave the blend state the 3D pass expects
+        glBlendFunc(*BLEND_ALPHA)
+
+    def _build_quad_indices(self):
+        # Two triangles per quad, enough for a buffer full of quads; draws
+        # pick their quads with the base vertex
+        quads = np.arange(self.capacity // 4, dtype=np.uint32)[:, None] * 4
+        indices = (quads + np.array([0, 1, 2, 0, 2, 3], dtype=np.uint32)).reshape(-1)
+        glBindBuffer(GL_ELEMENT_ARRAY_BUFFER, self.quad_ibo)
+        glBufferData(GL_ELEMENT_ARRAY_BUFFER, indices.nbytes, indices, GL_STATIC_DRAW)
+
+    def _draw_core(self, keys, groups):
+        glUseProgram(self.program)
+        glUniform1i(glGetUniformLocation(self.program, "texture0"), 0)
+        glBindBuffer(GL_ELEMENT_ARRAY_BUFFER, self.quad_ibo)
+        glEnableVertexAttribArray(POSITION_ATTRIB)
+        glEnableVertexAttribArray(COLOR_ATTRIB)
+        glEnableVertexAttribArray(TEXCOORD_ATTRIB)
+        glVertexAttribPointer(POSITION_ATTRIB, 2, GL_FLOAT, GL_FALSE, VERTEX_STRIDE, ctypes.c_void_p(0))
+        glVertexAttribPointer(COLOR_ATTRIB, 4, GL_FLOAT, GL_FALSE, VERTEX_STRIDE, ctypes.c_void_p(COLOR_OFFSET))
+        glVertexAttribPointer(TEXCOORD_ATTRIB, 2, GL_FLOAT, GL_FALSE, VERTEX_STRIDE, ctypes.c_void_p(TEXCOORD_OFFSET))
+
+        texture = blend = None
+        first = 0
+        for (_, group_texture, group_blend, primitive, _), group in zip(keys, groups):
+            if group_texture != texture:
+                if group_texture:
+                    glBindTexture(GL_TEXTURE_2D, group_texture)
+                glUniform1f(self.textured, 1.0 if group_texture else 0.0)
+                texture = group_texture
+            if group_blend != blend:
+                glBlendFunc(*group_blend)
+                blend = group_blend
+            if primitive == GL_QUADS:
+                glDrawElementsBaseVertex(GL_TRIANGLES, len(group) // 4 * 6, GL_UNSIGNED_INT, None, first)
+            else:
+                # Lines added directly are a pixel wide, the only width core allows
+                glDrawArrays(primitive, first, len(group))
+            first += len(group)
+
+        glDisableVertexAttribArray(POSITION_ATTRIB)
+        glDisableVertexAttribArray(COLOR_ATTRIB)
+        glDisableVertexAttribArray(TEXCOORD_ATTRIB)
+        glBindVertexArray(0)
+        glUseProgram(0)
+
+    def _draw_fixed_function(self, keys, groups):
+        glEnableClientState(GL_VERTEX_ARRAY)
+        glEnableClientState(GL_COLOR_ARRAY)
+        glEnableClientState(GL_TEXTURE_COORD_ARRAY)
+        glVertexPointer(2, GL_FLOAT, VERTEX_STRIDE, ctypes.c_void_p(0))
+        glColorPointer(4, GL_FLOAT, VERTEX_STRIDE, ctypes.c_void_p(COLOR_OFFSET))
+        glTexCoordPointer(2, GL_FLOAT, VERTEX_STRIDE, ctypes.c_void_p(TEXCOORD_OFFSET))
+
+        texture = blend = line_width = None
+        first = 0
+        for (_, group_texture, group_blend, primitive, group_width), group in zip(keys, groups):
+            if group_texture != texture:
+                if group_texture:
+                    glEnable(GL_TEXTURE_2D)
+                    glBindTexture(GL_TEXTURE_2D, group_texture)
+                else:
+                    glDisable(GL_TEXTURE_2D)
+                texture = group_texture
+            if group_blend != blend:
+                glBlendFunc(*group_blend)
+                blend = group_blend
+            if primitive == GL_LINES and group_width != line_width:
+                glLineWidth(group_width)
+                line_width = group_width
+            glDrawArrays(primitive, first, len(group))
+            first += len(group)
+
+        glDisableClientState(GL_TEXTURE_COORD_ARRAY)
+        glDisableClientState(GL_COLOR_ARRAY)
+        glDisableClientState(GL_VERTEX_ARRAY)
+        glEnable(GL_TEXTURE_2D)
+
+    def release(self):
+        glDeleteBuffers(1, [self.vbo])
+        if self.program is not None:
+            glDeleteBuffers(1, [self.quad_ibo])
+            glDeleteVertexArrays(1, [self.vao])
+            glDeleteProgram(self.program)
+            self.program = None
@@ -0,0 +1,93 @@
+import numpy as np
+
+# --------------------------
+# Fixed-capacity smoke particle pool stored as parallel arrays
+# --------------------------
+class ParticlePool:
+    FIELDS = ("x", "y", "vx", "vy", "lifetime", "initial_lifetime", "size", "r", "g", "b")
+
+    def __init__(self, capacity, rng=None):
+        self.capacity = capacity
+        self.rng = rng if rng is not None else np.random.default_rng()
+        # Live particles always occupy the first `count` slots
+        self.count = 0
+        for field in self.FIELDS:
+            setattr(self, field, np.zeros(capacity, dtype=np.float32))
+
+    def __len__(self):
+        return self.count
+
+    def emit(self, n, x, y):
+        # Spawn up to n particles at (x, y); returns how many fit in the pool
+        n = min(n, self.capacity - self.count)
+        if n <= 0:
+            return 0
+        new = slice(self.count, self.count + n)
+        uniform = self.rng.uniform
+        self.x[new] = x + uniform(-3, 3, n) # Start with slight horizontal spread
+        self.y[new] = y + uniform(-3, 3, n)
+        self.vx[new] = uniform(-0.3, 0.3, n)
+        self.vy[new] = uniform(2, 4, n) # Move upwards faster
+        self.lifetime[new] = uniform(30, 50, n)
+        self.initial_lifetime[new] = self.lifetime[new]
+        self.size[new] = uniform(8, 18, n)
+        # Start with a fiery color
+        self.r[new] = 1.0
+        self.g[new] = uniform(0.3, 0.6, n)
+        self.b[new] = 0.1
+        self.count += n
+        return n
+
+    def update(self):
+        live = slice(0, self.count)
+        self.x[live] += self.vx[live]
+        self.y[live] += self.vy[live]
+        self.lifetime[live] -= 1
+        # Shrink particle over time
+        self.size[live] *= 0.97
+        # Fade to grey
+        np.maximum(self.g[live] * 0.98, 0.5, out=self.g[live])
+        np.maximum(self.b[live] * 1.02, 0.5, out=self.b[live])
+        self._remove_dead()
+
+    def _remove_dead(self):
+        # Swap-remove: every dead slot below the new count is filled by a
+        # live particle from above it, so nothing else has to move
+        n = self.count
+        dead = self.lifetime[:n] <= 0
+        alive_count = n - int(np.count_nonzero(dead))
+        if alive_count == n:
+            return
+        holes = np.flatnonzero(dead[:alive_count])
+        movers = alive_count + np.flatnonzero(~dead[alive_count:])
+        for field in self.FIELDS:
+            values = getattr(self, field)
+            values[holes] = values[movers]
+        self.count = alive_count
+
+    def state(self):
+        # The live particles, copied (see World.state)
+        return {"count": self.count, **{field: getattr(self, field)[:self.count].copy() for field in self.FIELDS}}
+
+    def restore(self, state):
+        self.count = state["count"]
+        for field in self.FIELDS:
+            getattr(self, field)[:self.count] = state[field]
+
+    def quads(self):
+        # One interleaved (x, y, r, g, b, a) vertex array with four corners
+        # per particle, ready for a single GL_QUADS draw
+        n = self.count
+        half = self.size[:n] / 2
+        x, y = self.x[:n], self.y[:n]
+        vertices = np.empty((n, 4, 6), dtype=np.float32)
+        vertices[:, 0, 0] = vertices[:, 3, 0] = x - half
+        vertices[:, 1, 0] = vertices[:, 2, 0] = x + half
+        vertices[:, 0, 1] = vertices[:, 1, 1] = y - half
+        vertices[:, 2, 1] = vertices[:, 3, 1] = y + half
+        vertices[:, :, 2] = self.r[:n, None]
+        vertices[:, :, 3] = self.g[:n, None]
+        vertices[:, :, 4] = self.b[:n, None]
+        # Fade out over time
+        vertices[:, :, 5] = (self.lifetime[:n] / self.initial_lifetime[:n] * 0.5)[:, None]
+        return vertices.reshape(-1, 6)
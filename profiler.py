@@ -0,0 +1,274 @@
+import csv
+import json
+import time
+from collections import deque
+
+import numpy as np
+import pygame
+from OpenGL.GL import *
+# The high-level wrapper has no output type for 64-bit query results, so
+# read them into a preallocated array instead
+from OpenGL.raw.GL.VERSION.GL_3_3 import glGetQueryObjecti64v
+
+# Frames kept for the panel and the exported statistics
+PROFILE_HISTORY = 1200
+# Frames of GPU timestamps allowed in flight; later frames go without GPU
+# times rather than stalling on the oldest
+MAX_PENDING_FRAMES = 8
+PERCENTILES = (50, 95, 99)
+
+# --------------------------
+# Named per-section timings of every frame
+# --------------------------
+class FrameProfiler:
+    # Sections are laps: section(name) ends the running section and starts
+    # the next, so the main loop needs no extra nesting and the sections of
+    # a frame add up to the whole frame. Each section records its CPU time,
+    # its GPU time (between two timestamp queries, read back a few frames
+    # later so nothing waits on the GPU) and the draw calls, vertices and
+    # state changes submitted while it ran, with the redundant state changes
+    # skipped.
+    def __init__(self, counters=(), history=PROFILE_HISTORY, gpu=True):
+        # counters: objects with running draw_calls and vertices totals, or
+        # state_changes and saved_state_changes totals, or both
+        self.counters = list(counters)
+        self.frames = deque(maxlen=history)
+        self.names = [] # Section order, as first seen
+        self.gpu = gpu and bool(glGenQueries) and bool(glQueryCounter)
+        self.free_queries = []
+        self.pending = deque()
+        self.result = np.zeros(1, dtype=np.int64)
+        self.record = self.queries = self.current = None
+
+    def reset(self):
+        # Forget the frames so far, e.g. once a benchmark has warmed up
+        self.frames.clear()
+
+    def _totals(self):
+        return tuple(sum(getattr(counter, name, 0) for counter in self.counters)
+                     for name in ("draw_calls", "vertices", "state_changes", "saved_state_changes"))
+
+    def _timestamp(self):
+        if not self.free_queries:
+            self.free_queries.extend(np.atleast_1d(glGenQueries(16)))
+        query = self.free_queries.pop()
+        glQueryCounter(query, GL_TIMESTAMP)
+        return query
+
+    def begin_frame(self):
+        self._resolve()
+        # name -> [cpu ms, gpu ms, draw calls, vertices, state changes, saved state changes]
+        self.record = {"ms": 0.0, "sections": {}}
+        self.queries = [] if self.gpu and len(self.pending) < MAX_PENDING_FRAMES else None
+        self.current = None
+
+    def section(self, name):
+        now = time.perf_counter()
+        totals = self._totals()
+        if self.current is not None:
+            self._close(now, totals)
+        if name not in self.names:
+            self.names.append(name)
+        if self.queries is not None:
+            self.queries.append((name, self._timestamp()))
+        self.current = (name, now, totals)
+
+    def _close(self, now, totals):
+        name, start, started = self.current
+        entry = self.record["sections"].setdefault(name, [0.0, None, 0, 0, 0, 0])
+        entry[0] += (now - start) * 1000.0
+        for i, (total, before) in enumerate(zip(totals, started)):
+            entry[2 + i] += total - before
+
+    def end_frame(self):
+        if self.current is None:
+            return
+        self._close(time.perf_counter(), self._totals())
+        self.current = None
+        record = self.record
+        record["ms"] = sum(entry[0] for entry in record["sections"].values())
+        self.frames.append(record)
+        if self.queries is not None:
+            self.pending.append((record, self.queries, self._timestamp()))
+
+    def _resolve(self):
+        # Fill in the GPU times of finished frames, oldest first
+        while self.pending:
+            record, queries, end = self.pending[0]
+            if not glGetQueryObjectiv(end, GL_QUERY_RESULT_AVAILABLE):
+                return
+            self.pending.popleft()
+            stamps = []
+            for _, query in queries + [(None, end)]:
+                glGetQueryObjecti64v(query, GL_QUERY_RESULT, self.result)
+                stamps.append(int(self.result[0]))
+                self.free_queries.append(query)
+            for (name, _), start, stop in zip(queries, stamps, stamps[1:]):
+                entry = record["sections"][name]
+                entry[1] = (entry[1] or 0.0) + (stop - start) / 1e6
+
+    # --------------------------
+    # Statistics and export
+    # --------------------------
+    def summary(self, last=None):
+        # Frame time and per-section percentiles over the kept history (or
+        # its last frames)
+        frames = list(self.frames)[-last:] if last else list(self.frames)
+        sections = {}
+        for name in self.names:
+            rows = [frame["sections"].get(name) for frame in frames]
+            rows = [row for row in rows if row is not None]
+            gpu = [row[1] for row in rows if row[1] is not None]
+            sections[name] = {
+                "cpu_ms": _stats([row[0] for row in rows]),
+                "gpu_ms": _stats(gpu) if gpu else None,
+                "draw_calls": float(np.mean([row[2] for row in rows])) if rows else 0.0,
+                "vertices": float(np.mean([row[3] for row in rows])) if rows else 0.0,
+                "state_changes": float(np.mean([row[4] for row in rows])) if rows else 0.0,
+                "saved_state_changes": float(np.mean([row[5] for row in rows])) if rows else 0.0,
+            }
+        return {
+            "frames": len(frames),
+            "frame_ms": _stats([frame["ms"] for frame in frames]),
+            "sections": sections,
+        }
+
+    def export(self, path, info=None):
+        # CSV gets one row of statistics per section (the first row is the
+        # whole frame); JSON gets the same plus every frame's timings and
+        # the info dict (what was run, and on what)
+        summary = self.summary()
+        if path.lower().endswith(".csv"):
+            stat_names = ["mean"] + [f"p{p}" for p in PERCENTILES] + ["max"]
+            with open(path, "w", newline="") as f:
+                writer = csv.writer(f)
+                writer.writerow(["section"] + [f"cpu_{s}_ms" for s in stat_names] +
+                                [f"gpu_{s}_ms" for s in stat_names] +
+                                ["draw_calls", "vertices", "state_changes", "saved_state_changes"])
+                writer.writerow(["frame"] + [summary["frame_ms"][s] for s in stat_names] +
+                                [""] * len(stat_names) + [""] * 4)
+                for name, section in summary["sections"].items():
+                    gpu = section["gpu_ms"]
+                    writer.writerow([name] + [section["cpu_ms"][s] for s in stat_names] +
+                                    [gpu[s] if gpu else "" for s in stat_names] +
+                                    [section["draw_calls"], section["vertices"], section["state_changes"],
+                                     section["saved_state_changes"]])
+            return
+        if info:
+            summary["info"] = info
+        summary["samples"] = [{
+            "frame_ms": frame["ms"],
+            "sections": {name: {"cpu_ms": cpu, "gpu_ms": gpu, "draw_calls": calls, "vertices": vertices,
+                                "state_changes": changes, "saved_state_changes": saved}
+                         for name, (cpu, gpu, calls, vertices, changes, saved) in frame["sections"].items()},
+        } for frame in self.frames]
+        with open(path, "w") as f:
+            json.dump(summary, f, indent=1)
+
+    def release(self):
+        queries = self.free_queries + [query for _, queries, end in self.pending
+                                       for query in [end] + [q for _, q in queries]]
+        if queries:
+            glDeleteQueries(len(queries), queries)
+        self.free_queries, self.pending = [], deque()
+
+def _stats(values):
+    values = np.asarray(values, dtype=np.float64)
+    if not len(values):
+        return dict(mean=0.0, max=0.0, **{f"p{p}": 0.0 for p in PERCENTILES})
+    stats = {"mean": float(values.mean())}
+    for p, value in zip(PERCENTILES, np.percentile(values, PERCENTILES)):
+        stats[f"p{p}"] = float(value)
+    stats["max"] = float(values.max())
+    return stats
+
+# --------------------------
+# On-screen panel: a stacked bar of section times and a table of figures
+# --------------------------
+# Colors the sections take in the bar, in the order they were first seen
+SECTION_COLORS = [
+    (0.9, 0.3, 0.3), (0.9, 0.6, 0.2), (0.9, 0.9, 0.3), (0.4, 0.9, 0.3),
+    (0.3, 0.9, 0.8), (0.3, 0.6, 0.9), (0.5, 0.4, 0.9), (0.9, 0.4, 0.9),
+    (0.7, 0.7, 0.7), (0.6, 0.9, 0.6), (0.9, 0.7, 0.6), (0.5, 0.5, 0.9),
+]
+PANEL_REFRESH = 0.5 # Seconds between text updates
+PANEL_FRAMES = 60 # Frames averaged for the figures
+# Right edges of the figure columns, in pixels
+PANEL_COLUMNS = (170, 250, 330, 410, 470, 530)
+
+class ProfilerPanel:
+    def __init__(self, profiler, font_size=18):
+        self.profiler = profiler
+        pygame.font.init()
+        self.font = pygame.font.Font(None, font_size)
+        self.line_height = self.font.get_linesize()
+        self.texture = None
+        self.size = (0, 0)
+        self.last_refresh = -PANEL_REFRESH
+        self.summary = None
+
+    def _refresh(self):
+        self.summary = self.profiler.summary(PANEL_FRAMES)
+        frame = self.summary["frame_ms"]
+        rows = [("frame", f"{frame['mean']:.2f}", f"p50 {frame['p50']:.2f}",
+                 f"p95 {frame['p95']:.2f}", f"p99 {frame['p99']:.2f}"),
+                ("section", "cpu ms", "gpu ms", "draws", "verts", "states", "saved")]
+        for name, section in self.summary["sections"].items():
+            gpu = section["gpu_ms"]
+            rows.append((name, f"{section['cpu_ms']['mean']:.2f}", f"{gpu['mean']:.2f}" if gpu else "-",
+                         f"{section['draw_calls']:.0f}", f"{section['vertices']:.0f}",
+                         f"{section['state_changes']:.0f}", f"{section['saved_state_changes']:.0f}"))
+
+        # The name column is left-aligned after the color swatch, the
+        # figures are right-aligned on fixed column edges
+        surface = pygame.Surface((PANEL_COLUMNS[-1] + 8, self.line_height * len(rows) + 8), pygame.SRCALPHA)
+        surface.fill((0, 0, 0, 160))
+        for row, cells in enumerate(rows):
+            top = 4 + row * self.line_height
+            surface.blit(self.font.render(cells[0], True, (255, 255, 255)), (16, top))
+            for text, right in zip(cells[1:], PANEL_COLUMNS):
+                glyphs = self.font.render(text, True, (255, 255, 255))
+                surface.blit(glyphs, (right - glyphs.get_width(), top))
+        pixels = pygame.image.tostring(surface, "RGBA", False)
+
+        if self.texture is None:
+            self.texture = glGenTextures(1)
+        glBindTexture(GL_TEXTURE_2D, self.texture)
+        glTexParameteri(GL_TEXTURE_2D, GL_TEXTURE_MIN_FILTER, GL_LINEAR)
+        glTexParameteri(GL_TEXTURE_2D, GL_TEXTURE_MAG_FILTER, GL_LINEAR)
+        glPixelStorei(GL_UNPACK_ALIGNMENT, 1)
+        self.size = surface.get_size()
+        glTexImage2D(GL_TEXTURE_2D, 0, GL_RGBA8, self.size[0], self.size[1], 0, GL_RGBA, GL_UNSIGNED_BYTE, pixels)
+
+    def draw(self, batch, x, y, now, frame_budget_ms=1000.0 / 60):
+        # batch: the OverlayBatch of the 2D pass; (x, y) is the top-left corner
+        if now - self.last_refresh >= PANEL_REFRESH or self.texture is None:
+            self.last_refresh = now
+            self._refresh()
+        w, h = self.size
+        batch.sprite(self.texture, x + w / 2, y + h / 2, w, h, layer=2)
+
+        # Stacked bar of mean CPU time per section; the panel's width is one
+        # frame budget, so a bar past the tick means a missed frame
+        bar_y = y + h + 4
+        scale = w / frame_budget_ms
+        rows, left = [], x
+        for i, (name, section) in enumerate(self.summary["sections"].items()):
+            width = section["cpu_ms"]["mean"] * scale
+            r, g, b = SECTION_COLORS[i % len(SECTION_COLORS)]
+            rows.append([(left, bar_y, r, g, b, 0.9), (left + width, bar_y, r, g, b, 0.9),
+                         (left + width, bar_y + 10, r, g, b, 0.9), (left, bar_y + 10, r, g, b, 0.9)])
+            # A swatch in front of the section's row ties it to its color
+            swatch_y = y + 4 + (i + 2) * self.line_height + 2
+            rows.append([(x + 4, swatch_y, r, g, b, 1.0), (x + 12, swatch_y, r, g, b, 1.0),
+                         (x + 12, swatch_y + 8, r, g, b, 1.0), (x + 4, swatch_y + 8, r, g, b, 1.0)])
+            left += width
+        if rows:
+            batch.colored(np.array(rows, dtype=np.float32).reshape(-1, 6), layer=3)
+        batch.lines(np.array([(x + w, bar_y - 2)]), np.array([(x + w, bar_y + 12)]),
+                    np.array([(1.0, 1.0, 1.0, 1.0)]), layer=3)
+
+    def release(self):
+        if self.texture is not None:
+            glDeleteTextures(1, [self.texture])
+            self.texture = None
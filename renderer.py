@@ -0,0 +1,240 @@
+import ctypes
+
+import numpy as np
+from OpenGL.GL import *
+
+from meshes import POSITION_ATTRIB, TEXCOORD_ATTRIB, TEXCOORD_OFFSET, VERTEX_STRIDE, InstancedRenderer
+from shaders import CAMERA_BINDING, compile_program
+
+WHITE = (1.0, 1.0, 1.0, 1.0)
+
+# Both backends take the same calls: set_camera() once per pass, then one
+# draw() per object with its model matrix (maths convention, see
+# transforms.py), texture (None for untextured) and color. Between
+# begin_batch() and end_batch() (see renderqueue.py) draw() leaves its state
+# bound for the next draw and only sets what changed.
+
+# --------------------------
+# Last value of each piece of draw state, to skip setting it again
+# --------------------------
+class StateCache:
+    def __init__(self):
+        self.values = None # Only while batching
+        # Running totals for the profiler: state set, and set again to the
+        # value it already had and skipped
+        self.state_changes = 0
+        self.saved_state_changes = 0
+
+    def begin(self):
+        self.values = {}
+
+    def end(self):
+        self.values = None
+
+    def changed(self, name, value):
+        # Whether the state has to be set; outside a batch it always does
+        if self.values is not None:
+            if name in self.values and self.values[name] == value:
+                self.saved_state_changes += 1
+                return False
+            self.values[name] = value
+        self.state_changes += 1
+        return True
+
+# --------------------------
+# Fixed-function backend: the GL matrix stack and client arrays
+# --------------------------
+class FixedFunctionRenderer:
+    name = "fixed"
+    core = False
+
+    def __init__(self):
+        self.instanced = InstancedRenderer()
+        self.state = StateCache()
+        # Running totals for the profiler (instanced draws count in self.instanced)
+        self.draw_calls = 0
+        self.vertices = 0
+        self.mesh = None # Mesh left bound by a batch
+
+    def set_camera(self, projection, view):
+        glMatrixMode(GL_PROJECTION)
+        glLoadMatrixd(np.ascontiguousarray(projection.T))
+        glMatrixMode(GL_MODELVIEW)
+        glLoadMatrixd(np.ascontiguousarray(view.T))
+
+    def _bind_texture(self, texture):
+        if self.state.changed("texturing", bool(texture)):
+            if texture:
+                glEnable(GL_TEXTURE_2D)
+            else:
+                glDisable(GL_TEXTURE_2D)
+        if texture and self.state.changed("texture", texture):
+            glBindTexture(GL_TEXTURE_2D, texture)
+
+    def begin_batch(self):
+        self.state.begin()
+
+    def end_batch(self):
+        if self.mesh is not None:
+            self.mesh.unbind()
+            self.mesh = None
+        self.state.end()
+
+    def draw(self, mesh, model, texture=None, color=WHITE):
+        self._bind_texture(texture)
+        if self.state.changed("color", color):
+            glColor4f(*color)
+        glPushMatrix()
+        glMultMatrixd(np.ascontiguousarray(model.T))
+        if self.state.values is None:
+            self.state.state_changes += 1 # The mesh's buffers, bound and unbound around the draw
+            mesh.draw()
+        else:
+            if self.state.changed("mesh", mesh):
+                mesh.bind()
+                self.mesh = mesh
+            glDrawElements(GL_TRIANGLES, mesh.index_count, GL_UNSIGNED_INT, None)
+        glPopMatrix()
+        self.draw_calls += 1
+        self.vertices += mesh.index_count
+
+    def draw_instanced(self, mesh, matrices, texture=None, color=WHITE):
+        # matrices: (n, 4, 4) column-major, as AsteroidField keeps them
+        if texture:
+            glEnable(GL_TEXTURE_2D)
+            glBindTexture(GL_TEXTURE_2D, texture)
+        else:
+            glDisable(GL_TEXTURE_2D)
+        self.instanced.draw(mesh, matrices, color, bool(texture))
+
+    def release(self):
+        self.instanced.release()
+
+# --------------------------
+# Shader backend for core profile contexts: VAOs, GLSL and a camera uniform buffer
+# --------------------------
+MESH_VERTEX_SHADER = """
+attribute vec3 position;
+attribute vec2 texcoord;
+uniform mat4 model;
+uniform vec4 color;
+varying vec2 uv;
+varying vec4 tint;
+void main() {
+    uv = texcoord;
+    // Fixed-function vertex colors are clamped too
+    tint = clamp(color, 0.0, 1.0);
+    gl_Position = view_projection * model * vec4(position, 1.0);
+}
+"""
+
+MESH_FRAGMENT_SHADER = """
+uniform sampler2D texture0;
+uniform float textured;
+varying vec2 uv;
+varying vec4 tint;
+void main() {
+    frag_color = mix(vec4(1.0), texture(texture0, uv), textured) * tint;
+}
+"""
+
+# std140 layout of the Camera block: mat4 view_projection, vec2 viewport
+CAMERA_BLOCK_FLOATS = 16 + 4
+
+class ShaderRenderer:
+    name = "shader"
+    core = True
+
+    def __init__(self):
+        self.program = compile_program(MESH_VERTEX_SHADER, MESH_FRAGMENT_SHADER, {
+            "position": POSITION_ATTRIB,
+            "texcoord": TEXCOORD_ATTRIB,
+        }, core=True)
+        if self.program is None:
+            raise RuntimeError("Mesh shader is unavailable")
+        self.instanced = InstancedRenderer(core=True)
+        self.model = glGetUniformLocation(self.program, "model")
+        self.color = glGetUniformLocation(self.program, "color")
+        self.textured = glGetUniformLocation(self.program, "textured")
+        glUseProgram(self.program)
+        glUniform1i(glGetUniformLocation(self.program, "texture0"), 0)
+        glUseProgram(0)
+
+        self.camera_ubo = glGenBuffers(1)
+        glBindBuffer(GL_UNIFORM_BUFFER, self.camera_ubo)
+        glBufferData(GL_UNIFORM_BUFFER, CAMERA_BLOCK_FLOATS * 4, None, GL_DYNAMIC_DRAW)
+        glBindBuffer(GL_UNIFORM_BUFFER, 0)
+        glBindBufferBase(GL_UNIFORM_BUFFER, CAMERA_BINDING, self.camera_ubo)
+        self.camera = np.zeros(CAMERA_BLOCK_FLOATS, dtype=np.float32)
+
+        # One vertex array object per mesh, created on first use
+        self.vaos = {}
+        self.state = StateCache()
+        # Running totals for the profiler (instanced draws count in self.instanced)
+        self.draw_calls = 0
+        self.vertices = 0
+
+    def set_camera(self, projection, view):
+        self.camera[:16] = (projection @ view).T.reshape(-1)
+        self.camera[16:18] = glGetIntegerv(GL_VIEWPORT)[2:4]
+        glBindBuffer(GL_UNIFORM_BUFFER, self.camera_ubo)
+        glBufferSubData(GL_UNIFORM_BUFFER, 0, self.camera.nbytes, self.camera)
+        glBindBuffer(GL_UNIFORM_BUFFER, 0)
+
+    def _vertex_array(self, mesh):
+        vao = self.vaos.get(mesh)
+        if vao is None:
+            vao = glGenVertexArrays(1)
+            glBindVertexArray(vao)
+            glBindBuffer(GL_ARRAY_BUFFER, mesh.vbo)
+            glEnableVertexAttribArray(POSITION_ATTRIB)
+            glEnableVertexAttribArray(TEXCOORD_ATTRIB)
+            glVertexAttribPointer(POSITION_ATTRIB, 3, GL_FLOAT, GL_FALSE, VERTEX_STRIDE, ctypes.c_void_p(0))
+            glVertexAttribPointer(TEXCOORD_ATTRIB, 2, GL_FLOAT, GL_FALSE, VERTEX_STRIDE, ctypes.c_void_p(TEXCOORD_OFFSET))
+            glBindBuffer(GL_ELEMENT_ARRAY_BUFFER, mesh.ibo)
+            glBindVertexArray(0)
+            glBindBuffer(GL_ARRAY_BUFFER, 0)
+            self.vaos[mesh] = vao
+        return vao
+
+    def begin_batch(self):
+        self.state.begin()
+
+    def end_batch(self):
+        if self.state.values:
+            glBindVertexArray(0)
+            glUseProgram(0)
+        self.state.end()
+
+    def draw(self, mesh, model, texture=None, color=WHITE):
+        state = self.state
+        if state.changed("program", self.program):
+            glUseProgram(self.program)
+        if texture and state.changed("texture", texture):
+            glBindTexture(GL_TEXTURE_2D, texture)
+        if state.changed("textured", bool(texture)):
+            glUniform1f(self.textured, 1.0 if texture else 0.0)
+        if state.changed("color", color):
+            glUniform4f(self.color, *color)
+        glUniformMatrix4fv(self.model, 1, GL_TRUE, model.astype(np.float32))
+        if state.changed("mesh", mesh):
+            glBindVertexArray(self._vertex_array(mesh))
+        glDrawElements(GL_TRIANGLES, mesh.index_count, GL_UNSIGNED_INT, None)
+        if state.values is None:
+            glBindVertexArray(0)
+            glUseProgram(0)
+        self.draw_calls += 1
+        self.vertices += mesh.index_count
+
+    def draw_instanced(self, mesh, matrices, texture=None, color=WHITE):
+        if texture:
+            glBindTexture(GL_TEXTURE_2D, texture)
+        self.instanced.draw(mesh, matrices, color, bool(texture))
+
+    def release(self):
+        self.instanced.release()
+        if self.vaos:
+            glDeleteVertexArrays(len(self.vaos), list(self.vaos.values()))
+            self.vaos.clear()
+        glDeleteBuffers(1, [self.camera_ubo])
+        glDeleteProgram(self.program)
@@ -0,0 +1,56 @@
+from operator import itemgetter
+
+import numpy as np
+
+from renderer import WHITE
+
+# --------------------------
+# Collect a frame's draws and submit them sorted by state and depth
+# --------------------------
+class RenderQueue:
+    # submit() takes the same arguments as the renderer's draw() and only
+    # records the draw; flush() makes them all in one batch. Opaque draws
+    # go first, grouped by texture and then mesh, so the renderer binds
+    # each texture once and skips the state it already has set, and front
+    # to back within a group, so the depth test rejects hidden pixels early.
+    # Transparent draws follow, back to front, so each one blends over
+    # everything behind it.
+    def __init__(self, renderer):
+        self.renderer = renderer
+        self.view = np.eye(4)
+        # (sort key, mesh, model, texture, color) of each draw this frame
+        self.opaque = []
+        self.transparent = []
+        # Meshes numbered in the order first seen, so the keys hold only
+        # numbers and the order is the same from run to run
+        self.mesh_keys = {}
+
+    def begin(self, view):
+        # The camera of the draws to come, for their depths
+        self.view = view
+
+    def submit(self, mesh, model, texture=None, color=WHITE, transparent=False):
+        # Distance of the model's origin in front of the eye
+        depth = -float(self.view[2, :3] @ model[:3, 3] + self.view[2, 3])
+        if transparent:
+            self.transparent.append(((-depth,), mesh, model, texture, color))
+        else:
+            mesh_key = self.mesh_keys.setdefault(mesh, len(self.mesh_keys))
+            self.opaque.append(((int(texture or 0), mesh_key, depth), mesh, model, texture, color))
+
+    def flush_opaque(self):
+        self._draw(self.opaque)
+
+    def flush_transparent(self):
+        # After everything opaque, including what was drawn outside the queue
+        self._draw(self.transparent)
+
+    def _draw(self, items):
+        # The sort is stable, so draws with equal keys keep their order
+        items.sort(key=itemgetter(0))
+        renderer = self.renderer
+        renderer.begin_batch()
+        for _, mesh, model, texture, color in items:
+            renderer.draw(mesh, model, texture, color)
+        renderer.end_batch()
+        items.clear()
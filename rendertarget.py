@@ -0,0 +1,71 @@
+from OpenGL.GL import *
+
+# --------------------------
+# Draw the 3D pass at a lower resolution and stretch it onto the window
+# --------------------------
+class RenderTarget:
+    # An offscreen framebuffer (color and depth renderbuffers) of the window
+    # size times the render scale. begin() points drawing and the viewport
+    # at it; end() upscales it onto the window with one linear-filtered
+    # blit and points them back. At scale 1, or where framebuffer blits are
+    # missing, it steps aside and everything draws straight to the window.
+    def __init__(self, width, height):
+        self.window_width, self.window_height = width, height
+        self.width, self.height = width, height
+        self.scale = 1.0
+        self.supported = bool(glGenFramebuffers) and bool(glBlitFramebuffer)
+        self.fbo = None
+        self.renderbuffers = None
+
+    def set_scale(self, scale):
+        # Returns the scale in effect, which stays 1 without framebuffer support
+        if not self.supported or scale == self.scale:
+            return self.scale
+        self._release_framebuffer()
+        self.scale = scale
+        self.width = max(1, round(self.window_width * scale))
+        self.height = max(1, round(self.window_height * scale))
+        if scale < 1.0:
+            self.fbo = glGenFramebuffers(1)
+            self.renderbuffers = glGenRenderbuffers(2)
+            glBindFramebuffer(GL_FRAMEBUFFER, self.fbo)
+            for renderbuffer, storage, attachment in zip(
+                    self.renderbuffers, (GL_RGBA8, GL_DEPTH_COMPONENT24), (GL_COLOR_ATTACHMENT0, GL_DEPTH_ATTACHMENT)):
+                glBindRenderbuffer(GL_RENDERBUFFER, renderbuffer)
+                glRenderbufferStorage(GL_RENDERBUFFER, storage, self.width, self.height)
+                glFramebufferRenderbuffer(GL_FRAMEBUFFER, attachment, GL_RENDERBUFFER, renderbuffer)
+            glBindRenderbuffer(GL_RENDERBUFFER, 0)
+            complete = glCheckFramebufferStatus(GL_FRAMEBUFFER) == GL_FRAMEBUFFER_COMPLETE
+            glBindFramebuffer(GL_FRAMEBUFFER, 0)
+            if not complete:
+                print("Warning: Offscreen framebuffer incomplete. Rendering at full resolution.")
+                self.supported = False
+                self._release_framebuffer()
+                self.scale = 1.0
+                self.width, self.height = self.window_width, self.window_height
+        return self.scale
+
+    def begin(self):
+        if self.fbo is not None:
+            glBindFramebuffer(GL_FRAMEBUFFER, self.fbo)
+            glViewport(0, 0, self.width, self.height)
+
+    def end(self):
+        # The upscale pass; only color is copied, the overlay needs no depth
+        if self.fbo is None:
+            return
+        glBindFramebuffer(GL_READ_FRAMEBUFFER, self.fbo)
+        glBindFramebuffer(GL_DRAW_FRAMEBUFFER, 0)
+        glBlitFramebuffer(0, 0, self.width, self.height, 0, 0, self.window_width, self.window_height,
+                          GL_COLOR_BUFFER_BIT, GL_LINEAR)
+        glBindFramebuffer(GL_FRAMEBUFFER, 0)
+        glViewport(0, 0, self.window_width, self.window_height)
+
+    def _release_framebuffer(self):
+        if self.fbo is not None:
+            glDeleteFramebuffers(1, [self.fbo])
+            glDeleteRenderbuffers(2, list(self.renderbuffers))
+            self.fbo = self.renderbuffers = None
+
+    def release(self):
+        self._release_framebuffer()
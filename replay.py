@@ -0,0 +1,313 @@
+import os
+import pickle
+import sys
+import time
+
+import numpy as np
+
+from scene import Scene, load_catalog
+from simulation import Inputs, World
+
+# Like simulation.py, nothing here may import pygame or OpenGL.
+
+# --------------------------
+# File layout
+# --------------------------
+# A fixed-size header with everything needed to build the same world again
+# (its seed and options), then one fixed-size record per simulation step:
+# the inputs and the settings changed from outside (time warp, smoke cap),
+# plus, optionally, a snapshot of the rocket and the UFOs after the step.
+# Step n's record is at HEADER_SIZE + n * record size, so any step is found
+# without reading the ones before it, and a file cut short by a crash loses
+# at most the step being written.
+#
+# Next to it, PATH.keys holds a keyframe every KEYFRAME_STEPS steps, from
+# step 0: the whole world's state (World.state) as it was before that step,
+# random generators included. Seeking restores the last keyframe at or
+# before the step wanted and plays the records from there, so it is exact.
+# Each keyframe is its step and byte size (KEYFRAME) and then the pickled
+# state; like any pickle, only open recordings you trust.
+REPLAY_MAGIC = b"SSREPLAY"
+REPLAY_VERSION = 1
+HEADER_SIZE = 512
+
+HEADER = np.dtype([
+    ("magic", "S8"),
+    ("version", "<u4"),
+    ("record_size", "<u4"),
+    ("seed", "<u8"),
+    ("width", "<i4"),
+    ("height", "<i4"),
+    ("asteroid_count", "<i4"),
+    ("ufo_count", "<i4"),
+    ("smoke_limit", "<i4"),
+    ("smoke_rate", "<i4"),
+    ("gravity", "u1"),
+    ("snapshots", "u1"),
+    ("gravity_workers", "<i4"),
+    ("tick", "<f8"),
+    ("epoch", "<f8"),
+    ("scene", "S256"), # Catalog path, empty for a world without planets
+    # Added later, in what was padding, so older files read 0 here
+    ("swarm_count", "<i4"),
+])
+
+# Bits of a record's flags
+FOLLOW_ROCKET = 1
+FORWARD = 2
+BACKWARD = 4
+COLLAPSING = 8 # The rocket after the step (snapshots only)
+
+# Records written out at a time
+RECORD_BATCH = 600
+
+KEYFRAME_SUFFIX = ".keys"
+KEYFRAME = np.dtype([("step", "<u8"), ("size", "<u8")])
+# 30 s at 60 steps a second: a seek plays at most this many steps, and a
+# keyframe of a 100k-ship swarm is about 8 MB
+KEYFRAME_STEPS = 1800
+
+def record_dtype(ufo_count, snapshots):
+    fields = [
+        ("flags", "u1"),
+        ("mouse", "<f4", 2),
+        ("cursor", "<f4", 2),
+        ("time_warp", "<f8"),
+        ("smoke_limit", "<u4"),
+    ]
+    if snapshots:
+        fields += [
+            ("time", "<f8"),
+            ("epoch", "<f8"),
+            ("cursor_tilt", "<f8"),
+            ("rocket_pos", "<f8", 3),
+            ("rocket_vel", "<f8", 3),
+            ("rocket_forward", "<f8", 3),
+            ("rocket_size", "<f8"),
+            ("collapse_timer", "<f8"),
+            ("ufo_pos", "<f8", (ufo_count, 3)),
+            ("ufo_vel", "<f8", (ufo_count, 3)),
+        ]
+    return np.dtype(fields)
+
+# --------------------------
+# Write every step of a session
+# --------------------------
+class Recorder:
+    # Made right after the world, before its first step; write() is called
+    # after every step with the inputs it was given (see simthread.py)
+    def __init__(self, path, world, tick, scene_path="", gravity_workers=0, snapshots=False):
+        header = np.zeros(1, dtype=HEADER)
+        self.dtype = record_dtype(len(world.ufos), snapshots)
+        header["magic"] = REPLAY_MAGIC
+        header["version"] = REPLAY_VERSION
+        header["record_size"] = self.dtype.itemsize
+        header["seed"] = world.seed
+        header["width"], header["height"] = world.width, world.height
+        header["asteroid_count"] = world.asteroids.count
+        header["ufo_count"] = len(world.ufos)
+        header["smoke_limit"] = world.smoke_limit
+        header["smoke_rate"] = world.smoke_rate
+        header["gravity"] = world.gravity is not None
+        header["snapshots"] = snapshots
+        header["gravity_workers"] = gravity_workers
+        header["tick"] = tick
+        header["epoch"] = world.epoch
+        header["scene"] = scene_path.encode()
+        header["swarm_count"] = world.swarm.count if world.swarm is not None else 0
+        self.snapshots = snapshots
+        self.file = open(path, "wb")
+        self.file.write(header.tobytes().ljust(HEADER_SIZE, b"\0"))
+        self.keys = open(path + KEYFRAME_SUFFIX, "wb")
+        self.batch = np.zeros(RECORD_BATCH, dtype=self.dtype)
+        self.pending = 0
+        self.count = 0
+        self._write_keyframe(world)
+
+    def write(self, world, inputs):
+        record = self.batch[self.pending]
+        record["flags"] = ((FOLLOW_ROCKET if inputs.follow_rocket else 0) |
+                           (FORWARD if inputs.forward else 0) | (BACKWARD if inputs.backward else 0))
+        record["mouse"] = inputs.mouse_dx, inputs.mouse_dy
+        record["cursor"] = inputs.cursor
+        record["time_warp"] = world.time_warp
+        record["smoke_limit"] = world.smoke_limit
+        if self.snapshots:
+            rocket = world.rocket
+            if rocket.is_collapsing:
+                record["flags"] |= COLLAPSING
+            record["time"] = world.time
+            record["epoch"] = world.epoch
+            record["cursor_tilt"] = world.cursor_tilt
+            record["rocket_pos"] = rocket.pos
+            record["rocket_vel"] = rocket.vel
+            record["rocket_forward"] = rocket.forward
+            record["rocket_size"] = rocket.size
+            record["collapse_timer"] = rocket.collapse_timer
+            record["ufo_pos"] = [ufo.pos for ufo in world.ufos]
+            record["ufo_vel"] = [ufo.vel for ufo in world.ufos]
+        self.pending += 1
+        self.count += 1
+        if self.pending == RECORD_BATCH:
+            self.flush()
+        if self.count % KEYFRAME_STEPS == 0:
+            self._write_keyframe(world)
+
+    def _write_keyframe(self, world):
+        # The world before step self.count
+        state = pickle.dumps(world.state(), protocol=pickle.HIGHEST_PROTOCOL)
+        entry = np.zeros(1, dtype=KEYFRAME)
+        entry["step"], entry["size"] = self.count, len(state)
+        self.keys.write(entry.tobytes())
+        self.keys.write(state)
+        self.keys.flush()
+
+    def flush(self):
+        self.file.write(self.batch[:self.pending].tobytes())
+        self.file.flush()
+        self.pending = 0
+
+    def close(self):
+        if self.file is not None:
+            self.flush()
+            self.file.close()
+            self.keys.close()
+            self.file = None
+
+# --------------------------
+# Play a recording back, from the start or from any recorded step
+# --------------------------
+class Replay:
+    # The records are a memory-mapped array, so a session of any length
+    # opens at once and only the pages actually visited are read
+    def __init__(self, path):
+        with open(path, "rb") as f:
+            header = np.frombuffer(f.read(HEADER.itemsize), dtype=HEADER)
+        if len(header) == 0 or header["magic"][0] != REPLAY_MAGIC:
+            raise ValueError(f"'{path}' is not a recording")
+        self.header = header = header[0]
+        if header["version"] != REPLAY_VERSION:
+            raise ValueError(f"'{path}' is a version {header['version']} recording; "
+                             f"this build reads version {REPLAY_VERSION}")
+        self.snapshots = bool(header["snapshots"])
+        self.dtype = record_dtype(int(header["ufo_count"]), self.snapshots)
+        self.tick = float(header["tick"])
+        self.scene_path = header["scene"].decode()
+        count = (os.path.getsize(path) - HEADER_SIZE) // self.dtype.itemsize
+        self.records = (np.memmap(path, dtype=self.dtype, mode="r", offset=HEADER_SIZE, shape=(count,))
+                        if count > 0 else np.zeros(0, dtype=self.dtype))
+        # (step, offset) of every keyframe, read only when seeked to; one
+        # cut short by a crash is left out
+        self.keys_path = path + KEYFRAME_SUFFIX
+        self.keyframes = []
+        if os.path.exists(self.keys_path):
+            end = os.path.getsize(self.keys_path)
+            with open(self.keys_path, "rb") as f:
+                while True:
+                    entry = np.frombuffer(f.read(KEYFRAME.itemsize), dtype=KEYFRAME)
+                    if len(entry) == 0 or f.tell() + int(entry["size"][0]) > end:
+                        break
+                    self.keyframes.append((int(entry["step"][0]), f.tell()))
+                    f.seek(int(entry["size"][0]), os.SEEK_CUR)
+        # The step next() plays
+        self.position = 0
+
+    def __len__(self):
+        return len(self.records)
+
+    def make_world(self, scene=None):
+        # The recorded world before its first step; scene defaults to the
+        # recorded catalog
+        header = self.header
+        if scene is None and self.scene_path:
+            scene = Scene(load_catalog(self.scene_path))
+        world = World(int(header["width"]), int(header["height"]),
+                      asteroid_count=int(header["asteroid_count"]), ufo_count=int(header["ufo_count"]),
+                      seed=int(header["seed"]), smoke_limit=int(header["smoke_limit"]),
+                      smoke_rate=int(header["smoke_rate"]), scene=scene, gravity=bool(header["gravity"]),
+                      gravity_workers=int(header["gravity_workers"]), swarm_count=int(header["swarm_count"]))
+        world.set_epoch(float(header["epoch"]))
+        return world
+
+    def inputs(self, frame):
+        record = self.records[frame]
+        flags = int(record["flags"])
+        return Inputs(follow_rocket=bool(flags & FOLLOW_ROCKET), forward=bool(flags & FORWARD),
+                      backward=bool(flags & BACKWARD),
+                      mouse_dx=float(record["mouse"][0]), mouse_dy=float(record["mouse"][1]),
+                      cursor=(float(record["cursor"][0]), float(record["cursor"][1])))
+
+    def next(self, world):
+        # Sets the world up for the next recorded step and returns its
+        # inputs, or None once the recording is over
+        if self.position >= len(self.records):
+            return None
+        record = self.records[self.position]
+        world.time_warp = float(record["time_warp"])
+        world.smoke_limit = int(record["smoke_limit"])
+        inputs = self.inputs(self.position)
+        self.position += 1
+        return inputs
+
+    def seek(self, world, frame):
+        # Puts the world where it was after step frame - 1, so next() plays
+        # step frame: the last keyframe at or before it is restored and the
+        # steps in between are played, so the world is exactly as it was in
+        # the recorded run, whatever state it was in before
+        if not 0 <= frame <= len(self.records):
+            raise ValueError(f"Step {frame} is outside the recording's {len(self.records)} steps")
+        keyframes = [key for key in self.keyframes if key[0] <= frame]
+        if not keyframes:
+            if frame > 0:
+                raise ValueError(f"Seeking needs the recording's keyframes, '{self.keys_path}'")
+            # A world fresh from make_world() is at step 0 already
+            self.position = 0
+            return
+        step, offset = keyframes[-1]
+        with open(self.keys_path, "rb") as f:
+            f.seek(offset)
+            world.restore(pickle.load(f))
+        self.position = step
+        while self.position < frame:
+            world.step(self.tick, self.next(world))
+
+    def divergence(self, world, frame):
+        # Largest distance between the rocket or a UFO now and as recorded
+        # after step frame (snapshots only)
+        record = self.records[frame]
+        points = np.array([world.rocket.pos] + [ufo.pos for ufo in world.ufos])
+        recorded = np.concatenate([record["rocket_pos"][None], record["ufo_pos"]])
+        return float(np.abs(points - recorded).max())
+
+    def close(self):
+        if isinstance(self.records, np.memmap):
+            self.records._mmap.close()
+        self.records = np.zeros(0, dtype=self.dtype)
+
+# --------------------------
+# Headless playback: python replay.py PATH [FRAME]
+# --------------------------
+# Steps the recorded session as fast as the simulation goes, from the start
+# or from FRAME, and checks every step against the snapshots if it has them
+if __name__ == "__main__":
+    replay = Replay(sys.argv[1])
+    start_frame = int(sys.argv[2]) if len(sys.argv) > 2 else 0
+    world = replay.make_world()
+    replay.seek(world, start_frame)
+    worst = 0.0
+    start = time.perf_counter()
+    while True:
+        frame = replay.position
+        inputs = replay.next(world)
+        if inputs is None:
+            break
+        world.step(replay.tick, inputs)
+        if replay.snapshots:
+            worst = max(worst, replay.divergence(world, frame))
+    elapsed = time.perf_counter() - start
+    world.close()
+    steps = len(replay) - start_frame
+    print(f"{steps} steps in {elapsed:.3f}s ({steps * replay.tick / max(elapsed, 1e-9):,.0f}x real time)")
+    if replay.snapshots:
+        print(f"Largest divergence from the recording: {worst:.3g}")
+    replay.close()
@@ -0,0 +1,101 @@
+import math
+
+from simulation import Inputs
+
+# Like simulation.py, nothing here may import pygame or OpenGL.
+
+# Every benchmark frame advances the world by the same step, so runs are
+# comparable no matter how fast the machine renders
+BENCHMARK_DT = 1.0 / 60.0
+
+# Radians of yaw or pitch per unit of mouse motion (see Rocket.update_orientation)
+MOUSE_TURN = 0.005
+# Most mouse motion the autopilot uses in one frame
+MAX_MOUSE_STEP = 20.0
+
+# --------------------------
+# A scripted, seeded run of the main loop
+# --------------------------
+class Scenario:
+    def __init__(self, name, frames, camera_mode="default", world_options=None,
+                 setup=None, inputs=None, warmup=60, optional=False):
+        self.name = name
+        self.frames = frames       # Measured frames, after the warmup
+        self.warmup = warmup       # Frames left out of the results (uploads, first-use compiles)
+        self.optional = optional   # Only run by benchmark.py when asked for by name
+        self.camera_mode = camera_mode
+        self.world_options = world_options or {}
+        self._setup = setup
+        self._inputs = inputs
+
+    def setup(self, world):
+        if self._setup:
+            self._setup(world)
+
+    def inputs(self, frame, world):
+        if self._inputs:
+            return self._inputs(frame, world)
+        return Inputs(follow_rocket=self.camera_mode == "follow_rocket")
+
+# --------------------------
+# Autopilot: steer the rocket towards a point with mouse-like inputs
+# --------------------------
+def steer(rocket, target):
+    direction = [target[i] - rocket.pos[i] for i in range(3)]
+    distance = math.sqrt(sum(d * d for d in direction)) or 1.0
+    # Headings are atan2(x, z) of the forward vector; moving the mouse
+    # right (positive dx) increases it
+    heading = math.atan2(rocket.forward[0], rocket.forward[2])
+    wanted = math.atan2(direction[0], direction[2])
+    turn = (wanted - heading + math.pi) % (2 * math.pi) - math.pi
+    mouse_dx = max(-MAX_MOUSE_STEP, min(MAX_MOUSE_STEP, turn / MOUSE_TURN))
+    climb = direction[1] / distance - rocket.forward[1]
+    mouse_dy = max(-MAX_MOUSE_STEP, min(MAX_MOUSE_STEP, -climb / MOUSE_TURN))
+    return Inputs(follow_rocket=True, forward=True, mouse_dx=mouse_dx, mouse_dy=mouse_dy)
+
+# --------------------------
+# The scenarios
+# --------------------------
+def _overview_inputs(frame, world):
+    # The cursor traces a slow figure eight, trailing its usual smoke
+    t = frame * BENCHMARK_DT
+    x = world.width * (0.5 + 0.35 * math.sin(t * 0.7))
+    y = world.height * (0.5 + 0.3 * math.sin(t * 1.4))
+    return Inputs(cursor=(x, y))
+
+# Middle of the asteroid belt (see AsteroidField)
+BELT_RADIUS = 310.0
+
+def _belt_setup(world):
+    rocket = world.rocket
+    rocket.pos = [BELT_RADIUS, 5.0, 0.0]
+    rocket.forward = [0.0, 0.0, -1.0]
+
+def _belt_inputs(frame, world):
+    # Chase a point a little further round the belt, so the rocket flies
+    # along it through the asteroids
+    x, _, z = world.rocket.pos
+    angle = math.atan2(z, x) - 0.3
+    return steer(world.rocket, (BELT_RADIUS * math.cos(angle), 5.0, BELT_RADIUS * math.sin(angle)))
+
+def _black_hole_setup(world):
+    # Start a few seconds out, pointed roughly at it
+    rocket = world.rocket
+    rocket.pos = [1400.0, 400.0, 150.0]
+    rocket.forward = [1.0, 0.0, 0.0]
+
+def _black_hole_inputs(frame, world):
+    return steer(world.rocket, world.black_hole["pos"])
+
+SCENARIOS = {scenario.name: scenario for scenario in (
+    Scenario("overview", 600, inputs=_overview_inputs),
+    Scenario("belt", 900, "follow_rocket", setup=_belt_setup, inputs=_belt_inputs),
+    Scenario("black_hole", 600, "follow_rocket", setup=_black_hole_setup, inputs=_black_hole_inputs),
+    # 10k live smoke particles: about 250 per frame, each living 30-50 frames
+    Scenario("smoke_storm", 600, world_options={"smoke_limit": 10000, "smoke_rate": 250},
+             inputs=_overview_inputs),
+    # 100k UFOs steering through the system (see swarm.py). Optional: far
+    # too many triangles for llvmpipe, where a frame takes over a second
+    Scenario("swarm", 600, world_options={"swarm_count": 100000}, inputs=_overview_inputs,
+             optional=True),
+)}
@@ -0,0 +1,230 @@
+import json
+import math
+from collections import OrderedDict
+
+import numpy as np
+
+from transforms import rotate
+
+try:
+    import tomllib
+except ImportError: # Python < 3.11: JSON catalogs only
+    tomllib = None
+
+# Like simulation.py, nothing here may import pygame or OpenGL.
+
+# Samples per orbit in the ephemeris tables (see Scene.update)
+EPHEMERIS_SAMPLES = 256
+# Recent epochs whose matrices are kept, so going back to one is free
+EPOCH_CACHE_SIZE = 64
+
+# --------------------------
+# Kepler's equation
+# --------------------------
+def solve_kepler(mean_anomaly, eccentricity, tolerance=1e-12, max_iterations=50):
+    # Eccentric anomaly E with M = E - e sin E (radians), by Newton's method
+    # over whole arrays at once; starting from pi for very eccentric orbits
+    # keeps it from overshooting
+    mean_anomaly = np.asarray(mean_anomaly, dtype=np.float64)
+    e = np.broadcast_to(np.asarray(eccentricity, dtype=np.float64), mean_anomaly.shape)
+    anomaly = np.where(e < 0.8, mean_anomaly + e * np.sin(mean_anomaly), np.pi)
+    for _ in range(max_iterations):
+        step = (anomaly - e * np.sin(anomaly) - mean_anomaly) / (1.0 - e * np.cos(anomaly))
+        anomaly = anomaly - step
+        if np.abs(step).max(initial=0.0) < tolerance:
+            break
+    return anomaly
+
+def orbit_plane(inclination, node, periapsis):
+    # Columns: where the orbit plane's x (towards periapsis) and z axes end
+    # up, for arrays of angles in degrees; the same turns as build_orbit()
+    # in orbits.py, so bodies stay on their rings
+    w, i, n = np.radians(periapsis), np.radians(inclination), np.radians(node)
+    axes = np.zeros((len(w), 3, 2))
+    for column, (x, z) in enumerate(((np.cos(w), np.sin(w)), (-np.sin(w), np.cos(w)))):
+        y = z * np.sin(i)
+        z = z * np.cos(i)
+        axes[:, 0, column] = x * np.cos(n) - z * np.sin(n)
+        axes[:, 1, column] = y
+        axes[:, 2, column] = x * np.sin(n) + z * np.cos(n)
+    return axes
+
+# --------------------------
+# Load a catalog of orbiting bodies into flat arrays
+# --------------------------
+def load_catalog(path):
+    # JSON, or TOML on Python 3.11+, with the same layout: a "textures"
+    # table (name -> image file) and a list of "bodies", each of which may
+    # carry its own "moons" list and a "ring"
+    if path.lower().endswith(".toml"):
+        if tomllib is None:
+            raise RuntimeError(f"Reading '{path}' needs Python 3.11 or newer (tomllib)")
+        with open(path, "rb") as f:
+            return tomllib.load(f)
+    with open(path) as f:
+        return json.load(f)
+
+class Scene:
+    # One entry per body in parallel arrays, parents before their moons.
+    # Angles are in degrees, speeds in degrees per second of world time.
+    # Each body follows a Kepler orbit about its parent: distance is the
+    # semi-major axis, speed the mean motion, phase the mean anomaly at
+    # epoch 0, plus optional eccentricity, inclination, node (longitude of
+    # the ascending node) and periapsis (argument of periapsis).
+    def __init__(self, catalog):
+        self.textures = dict(catalog.get("textures", {}))
+        self.names = []
+        # Every distinct texture name; bodies refer to it by index
+        self.texture_names = []
+        rows = []
+        rings = []
+
+        def add(body, parent, depth):
+            index = len(self.names)
+            self.names.append(body["name"])
+            rows.append((parent, depth, body["distance"], body["speed"], body.get("phase", 0.0),
+                         body["size"], body.get("tilt", 0.0), body.get("spin", 0.0),
+                         self._texture_index(body.get("texture", body["name"])),
+                         body.get("mass", math.nan), body.get("eccentricity", 0.0),
+                         body.get("inclination", 0.0), body.get("node", 0.0), body.get("periapsis", 0.0)))
+            ring = body.get("ring")
+            if ring:
+                rings.append((index, ring["inner"], ring["outer"], self._texture_index(ring["texture"])))
+            for moon in body.get("moons", ()):
+                add(moon, index, depth + 1)
+
+        for body in catalog["bodies"]:
+            add(body, -1, 0)
+
+        columns = list(zip(*rows)) if rows else [()] * 14
+        self.count = len(rows)
+        self.parent = np.array(columns[0], dtype=np.int32)
+        depth = np.array(columns[1], dtype=np.int32)
+        self.distance = np.array(columns[2], dtype=np.float64)
+        self.speed = np.array(columns[3], dtype=np.float64)
+        self.phase = np.array(columns[4], dtype=np.float64)
+        self.size = np.array(columns[5], dtype=np.float64)
+        self.tilt = np.array(columns[6], dtype=np.float64) # Kept from the old table; not drawn
+        self.spin = np.array(columns[7], dtype=np.float64)
+        self.texture = np.array(columns[8], dtype=np.int32)
+        # Gravitational parameter (G * mass) for --gravity; NaN where the
+        # catalog leaves it to be worked out from the size (see gravity.py)
+        self.mass = np.array(columns[9], dtype=np.float64)
+        self.eccentricity = np.array(columns[10], dtype=np.float64)
+        self.inclination = np.array(columns[11], dtype=np.float64)
+        self.node = np.array(columns[12], dtype=np.float64)
+        self.periapsis = np.array(columns[13], dtype=np.float64)
+        # Bodies of each depth of the hierarchy, roots first
+        self.depths = [np.flatnonzero(depth == d) for d in range(int(depth.max(initial=-1)) + 1)]
+
+        columns = list(zip(*rings)) if rings else [()] * 4
+        self.ring_body = np.array(columns[0], dtype=np.int32)
+        self.ring_inner = np.array(columns[1], dtype=np.float64)
+        self.ring_outer = np.array(columns[2], dtype=np.float64)
+        self.ring_texture = np.array(columns[3], dtype=np.int32)
+
+        # Filled by update(): orbit frames (no spin), textured-sphere model
+        # matrices (spin, pole fix and size folded in) and centers
+        self.orbits = np.zeros((self.count, 4, 4))
+        self.models = np.zeros((self.count, 4, 4))
+        self.centers = self.orbits[:, :3, 3]
+        # The sphere maps have their poles on z; turn them onto y
+        self.pole_fix = rotate(-90, 1, 0, 0)[:3, :3]
+
+        self._build_ephemeris()
+        self._epochs = OrderedDict()
+
+    def _build_ephemeris(self, samples=EPHEMERIS_SAMPLES):
+        # Position relative to the parent at evenly spaced mean anomalies,
+        # with its exact derivative, so update() interpolates (cubic Hermite)
+        # instead of solving Kepler's equation for every body every frame.
+        # Kepler's equation is only solved here, once per sample.
+        mean_anomaly = np.linspace(0.0, 2 * np.pi, samples + 1)
+        e = self.eccentricity[:, None]
+        anomaly = solve_kepler(np.broadcast_to(mean_anomaly, (self.count, samples + 1)), e)
+        cos_e, sin_e = np.cos(anomaly), np.sin(anomaly)
+        semi_minor = np.sqrt(1.0 - e * e)
+        # In the orbit plane, with the parent at a focus. z runs negative
+        # so bodies keep turning the way rotate(angle, 0, 1, 0) turns them.
+        plane = np.stack([cos_e - e, -semi_minor * sin_e], axis=-1)
+        # dE/dM = 1 / (1 - e cos E)
+        slope = np.stack([-sin_e, -semi_minor * cos_e], axis=-1) / (1.0 - e * cos_e)[..., None]
+        axes = orbit_plane(self.inclination, self.node, self.periapsis) * self.distance[:, None, None]
+        self.ephemeris = np.einsum("bij,bsj->bsi", axes, plane)
+        # Per sample interval rather than per radian
+        self.ephemeris_slope = np.einsum("bij,bsj->bsi", axes, slope) * (2 * np.pi / samples)
+        self.samples = samples
+
+    def _texture_index(self, name):
+        if name not in self.texture_names:
+            self.texture_names.append(name)
+        return self.texture_names.index(name)
+
+    def roots(self):
+        return self.depths[0] if self.depths else np.zeros(0, dtype=np.intp)
+
+    def position_at(self, t, exact=False):
+        # Every body's position relative to its parent at epoch t; exact
+        # solves Kepler's equation instead of interpolating the tables
+        mean_anomaly = np.radians(np.mod(self.phase + t * self.speed, 360.0))
+        if exact:
+            anomaly = solve_kepler(mean_anomaly, self.eccentricity)
+            e = self.eccentricity
+            plane = np.stack([np.cos(anomaly) - e, -np.sqrt(1.0 - e * e) * np.sin(anomaly)], axis=-1)
+            axes = orbit_plane(self.inclination, self.node, self.periapsis) * self.distance[:, None, None]
+            return np.einsum("bij,bj->bi", axes, plane)
+        u = mean_anomaly * (self.samples / (2 * np.pi))
+        k = np.minimum(u.astype(np.intp), self.samples - 1)
+        f = (u - k)[:, None]
+        bodies = np.arange(self.count)
+        p0, p1 = self.ephemeris[bodies, k], self.ephemeris[bodies, k + 1]
+        m0, m1 = self.ephemeris_slope[bodies, k], self.ephemeris_slope[bodies, k + 1]
+        f2 = f * f
+        f3 = f2 * f
+        return ((2 * f3 - 3 * f2 + 1) * p0 + (f3 - 2 * f2 + f) * m0 +
+                (3 * f2 - 2 * f3) * p1 + (f3 - f2) * m1)
+
+    def update(self, t):
+        # Epochs seen lately (a paused clock, scrubbing back and forth) are
+        # copied from the cache
+        cached = self._epochs.get(t)
+        if cached is not None:
+            self._epochs.move_to_end(t)
+            self.orbits[:], self.models[:] = cached
+            return
+
+        # Each body's orbit frame sits at its position and is turned about
+        # y to face along it: for a circular orbit in the x-z plane exactly
+        # rotate(angle, 0, 1, 0) @ translate(distance, 0, 0)
+        position = self.position_at(t)
+        angle = np.arctan2(-position[:, 2], position[:, 0])
+        c, s = np.cos(angle), np.sin(angle)
+        orbits = self.orbits
+        orbits[:] = 0.0
+        orbits[:, 0, 0] = orbits[:, 2, 2] = c
+        orbits[:, 0, 2] = s
+        orbits[:, 2, 0] = -s
+        orbits[:, 1, 1] = orbits[:, 3, 3] = 1.0
+        # Moons orbit their parent's center, one level of the hierarchy at a time
+        for level, bodies in enumerate(self.depths):
+            if level == 0:
+                orbits[bodies, :3, 3] = position[bodies]
+            else:
+                orbits[bodies, :3, 3] = orbits[self.parent[bodies], :3, 3] + position[bodies]
+
+        # The spin only turns the body itself, not what is attached to its
+        # orbit frame (rings)
+        spin = np.radians(t * self.spin)
+        c, s = np.cos(spin), np.sin(spin)
+        spin_rotation = np.zeros((self.count, 3, 3))
+        spin_rotation[:, 0, 0] = spin_rotation[:, 2, 2] = c
+        spin_rotation[:, 0, 2] = s
+        spin_rotation[:, 2, 0] = -s
+        spin_rotation[:, 1, 1] = 1.0
+        self.models[:, :3, :3] = orbits[:, :3, :3] @ spin_rotation @ self.pole_fix * self.size[:, None, None]
+        self.models[:, :3, 3] = orbits[:, :3, 3]
+        self.models[:, 3, 3] = 1.0
+
+        self._epochs[t] = (orbits.copy(), self.models.copy())
+        if len(self._epochs) > EPOCH_CACHE_SIZE:
+            self._epochs.popitem(last=False)
@@ -0,0 +1,84 @@
+from OpenGL.GL import *
+
+# Shaders are written once in GLSL 1.20 style and get one of these headers,
+# so the same source runs on a compatibility context and on a core profile.
+# view_projection is the camera: the fixed-function matrices on a
+# compatibility context, the Camera uniform block on a core profile.
+COMPAT_VERTEX_HEADER = """#version 120
+#define texture texture2D
+#define view_projection gl_ModelViewProjectionMatrix
+uniform vec2 viewport;
+"""
+COMPAT_FRAGMENT_HEADER = """#version 120
+#define texture texture2D
+#define frag_color gl_FragColor
+"""
+CORE_VERTEX_HEADER = """#version 330 core
+#define attribute in
+#define varying out
+layout(std140) uniform Camera {
+    mat4 view_projection;
+    vec2 viewport;
+};
+"""
+CORE_FRAGMENT_HEADER = """#version 330 core
+#define varying in
+out vec4 frag_color;
+"""
+
+# Uniform buffer binding point of the Camera block
+CAMERA_BINDING = 0
+
+# --------------------------
+# Compile and link a GLSL program
+# --------------------------
+def compile_program(vertex_source, fragment_source, attributes=None, core=False):
+    # Returns None when shaders are unavailable so callers can fall back
+    # to the fixed-function path
+    if not bool(glCreateShader):
+        return None
+
+    vertex_header = CORE_VERTEX_HEADER if core else COMPAT_VERTEX_HEADER
+    fragment_header = CORE_FRAGMENT_HEADER if core else COMPAT_FRAGMENT_HEADER
+    try:
+        shader_ids = [
+            _compile_shader(GL_VERTEX_SHADER, vertex_header + vertex_source),
+            _compile_shader(GL_FRAGMENT_SHADER, fragment_header + fragment_source),
+        ]
+    except RuntimeError as e:
+        print(f"Warning: {e}. Falling back to fixed-function rendering.")
+        return None
+
+    program = glCreateProgram()
+    for shader in shader_ids:
+        glAttachShader(program, shader)
+    # Attribute locations are fixed before linking so VBO layouts can be shared
+    for name, location in (attributes or {}).items():
+        glBindAttribLocation(program, location, name)
+    glLinkProgram(program)
+
+    for shader in shader_ids:
+        glDetachShader(program, shader)
+        glDeleteShader(shader)
+
+    if glGetProgramiv(program, GL_LINK_STATUS) != GL_TRUE:
+        log = glGetProgramInfoLog(program).decode(errors="replace")
+        print(f"Warning: Shader link failed: {log}. Falling back to fixed-function rendering.")
+        glDeleteProgram(program)
+        return None
+
+    if core:
+        block = glGetUniformBlockIndex(program, "Camera")
+        if block != GL_INVALID_INDEX:
+            glUniformBlockBinding(program, block, CAMERA_BINDING)
+    return program
+
+def _compile_shader(shader_type, source):
+    shader = glCreateShader(shader_type)
+    glShaderSource(shader, source)
+    glCompileShader(shader)
+    if glGetShaderiv(shader, GL_COMPILE_STATUS) != GL_TRUE:
+        log = glGetShaderInfoLog(shader).decode(errors="replace")
+        glDeleteShader(shader)
+        raise RuntimeError(f"Shader compile failed: {log}")
+    return shader
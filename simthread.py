@@ -0,0 +1,193 @@
+import copy
+import threading
+import time
+
+import numpy as np
+
+from simulation import Inputs
+
+# Like simulation.py, nothing here may import pygame or OpenGL.
+
+# The simulation's fixed step, whatever the frame rate
+SIM_TICK = 1.0 / 60.0
+# Ticks the simulation may fall behind before it gives up on catching up
+MAX_TICKS_BEHIND = 5
+# Bodies that moved further than this in one tick were placed, not moved
+# (a reset rocket, a UFO starting a new pass); they are not interpolated
+MAX_LERP_DISTANCE = 100.0
+
+# --------------------------
+# What the renderer needs of one simulation step
+# --------------------------
+class Snapshot:
+    # Copies, so the simulation can go on stepping while a frame is drawn
+    # from it; never changed once published
+    def __init__(self, world, stamp):
+        self.stamp = stamp # When it was published (time.perf_counter)
+        self.time = world.time
+        self.epoch = world.epoch
+        self.rocket = _copy_body(world.rocket)
+        self.ufos = [_copy_body(ufo) for ufo in world.ufos]
+        self.asteroid_positions = world.asteroids.positions.copy()
+        self.asteroid_matrices = world.asteroids.matrices.copy()
+        # (3, n) positions and spin angles of the swarm, if any
+        swarm = world.swarm
+        self.swarm_positions = swarm.positions.copy() if swarm is not None else None
+        self.swarm_angles = swarm.angles.copy() if swarm is not None else None
+        # (x, y, vx, vy, length, lifetime) per star
+        self.shooting_stars = np.array([(star.x, star.y, star.vx, star.vy, star.length, star.lifetime)
+                                        for star in world.shooting_stars], dtype=np.float32).reshape(-1, 6)
+        self.smoke_quads = world.smoke.quads()
+        self.cursor_tilt = world.cursor_tilt
+        self.collisions = list(world.collisions)
+
+def _copy_body(body):
+    # A copy with its own vectors (pos, vel, forward, ...), which the
+    # simulation changes in place
+    body = copy.copy(body)
+    for name, value in vars(body).items():
+        if isinstance(value, list):
+            setattr(body, name, list(value))
+    return body
+
+def _lerp_point(a, b, alpha):
+    if sum((b[i] - a[i]) ** 2 for i in range(3)) > MAX_LERP_DISTANCE ** 2:
+        return list(b)
+    return [a[i] + (b[i] - a[i]) * alpha for i in range(3)]
+
+def interpolate(previous, latest, alpha):
+    # The state alpha of the way from previous to latest: everything that
+    # moves smoothly is blended, the rest (smoke, stars, events) is latest's
+    if alpha >= 1.0 or previous is latest:
+        return latest
+    state = copy.copy(latest)
+    state.time = previous.time + (latest.time - previous.time) * alpha
+    state.epoch = previous.epoch + (latest.epoch - previous.epoch) * alpha
+    state.rocket = copy.copy(latest.rocket)
+    state.rocket.pos = _lerp_point(previous.rocket.pos, latest.rocket.pos, alpha)
+    state.rocket.forward = [a + (b - a) * alpha for a, b in zip(previous.rocket.forward, latest.rocket.forward)]
+    state.ufos = []
+    for before, after in zip(previous.ufos, latest.ufos):
+        ufo = copy.copy(after)
+        ufo.pos = _lerp_point(before.pos, after.pos, alpha)
+        state.ufos.append(ufo)
+    # The matrices' last row holds the positions (column-major)
+    state.asteroid_positions = previous.asteroid_positions + \
+        (latest.asteroid_positions - previous.asteroid_positions) * alpha
+    state.asteroid_matrices = previous.asteroid_matrices + \
+        (latest.asteroid_matrices - previous.asteroid_matrices) * alpha
+    if latest.swarm_positions is not None and previous.swarm_positions is not None:
+        moved = latest.swarm_positions - previous.swarm_positions
+        jumped = (moved * moved).sum(axis=0) > MAX_LERP_DISTANCE ** 2
+        moved[:, jumped] = 0.0
+        state.swarm_positions = latest.swarm_positions - moved * np.float32(1.0 - alpha)
+        # The shorter way round, across 0/360
+        turned = (latest.swarm_angles - previous.swarm_angles + 180.0) % 360.0 - 180.0
+        state.swarm_angles = latest.swarm_angles - turned * np.float32(1.0 - alpha)
+    return state
+
+# --------------------------
+# The world stepped at a fixed tick on its own thread
+# --------------------------
+class SimulationThread:
+    # Steps the world every SIM_TICK seconds of wall time and publishes a
+    # Snapshot after each step; the last two published are kept (double
+    # buffered), and state() blends them for the moment being drawn. The
+    # renderer draws one tick behind the simulation, so it always has a
+    # step on either side of it and frame drops never change the physics.
+    # Without start(), step() runs the world in the caller's thread
+    # instead, as the scripted benchmarks do. Every step goes to the
+    # recorder, if any; with a replay, its recorded inputs drive the world
+    # instead of set_inputs(), and the thread ends with the recording.
+    def __init__(self, world, tick=SIM_TICK, recorder=None, replay=None):
+        self.world = world
+        self.tick = tick
+        self.recorder = recorder
+        self.replay = replay
+        # Held while the world steps; take it to change the world from outside
+        self.lock = threading.Lock()
+        self._input_lock = threading.Lock()
+        self._snapshot_lock = threading.Lock()
+        self._inputs = Inputs()
+        self._mouse_dx = self._mouse_dy = 0
+        self.previous = self.latest = Snapshot(world, time.perf_counter())
+        self.ticks = 0
+        self.dropped_ticks = 0
+        self._stop = threading.Event()
+        self._thread = None
+
+    def start(self):
+        self._thread = threading.Thread(target=self._run, name="simulation", daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        if self._thread is not None:
+            self._stop.set()
+            self._thread.join()
+            self._thread = None
+        if self.recorder is not None:
+            self.recorder.close()
+
+    def finished(self):
+        # A replay has played its last step
+        return self._thread is not None and not self._thread.is_alive()
+
+    def set_inputs(self, inputs):
+        # The latest keys and cursor; mouse motion adds up until a tick uses it
+        with self._input_lock:
+            self._mouse_dx += inputs.mouse_dx
+            self._mouse_dy += inputs.mouse_dy
+            self._inputs = inputs
+
+    def _take_inputs(self):
+        with self._input_lock:
+            inputs = copy.copy(self._inputs)
+            inputs.mouse_dx, inputs.mouse_dy = self._mouse_dx, self._mouse_dy
+            self._mouse_dx = self._mouse_dy = 0
+        return inputs
+
+    def step(self, dt, inputs):
+        with self.lock:
+            self.world.step(dt, inputs)
+            if self.recorder is not None:
+                self.recorder.write(self.world, inputs)
+            self._publish()
+
+    def _publish(self):
+        snapshot = Snapshot(self.world, time.perf_counter())
+        with self._snapshot_lock:
+            self.previous, self.latest = self.latest, snapshot
+        self.ticks += 1
+
+    def _run(self):
+        next_tick = time.perf_counter() + self.tick
+        while not self._stop.is_set():
+            now = time.perf_counter()
+            if now < next_tick:
+                time.sleep(next_tick - now)
+                continue
+            if self.replay is None:
+                inputs = self._take_inputs()
+            else:
+                with self.lock:
+                    inputs = self.replay.next(self.world)
+                if inputs is None:
+                    break
+            self.step(self.tick, inputs)
+            next_tick += self.tick
+            behind = int((time.perf_counter() - next_tick) / self.tick)
+            if behind > MAX_TICKS_BEHIND:
+                # Too slow to keep up: the world runs slower than real time
+                # rather than spending ever longer catching up
+                self.dropped_ticks += behind
+                next_tick += behind * self.tick
+
+    def state(self, now=None):
+        # The world as of one tick ago, blended from the last two snapshots
+        with self._snapshot_lock:
+            previous, latest = self.previous, self.latest
+        if self._thread is None:
+            return latest
+        now = time.perf_counter() if now is None else now
+        alpha = min(max((now - latest.stamp) / self.tick, 0.0), 1.0)
+        return interpolate(previous, latest, alpha)
@@ -0,0 +1,497 @@
+import copy
+import math
+import random
+import sys
+import time
+
+import numpy as np
+
+from asteroids import AsteroidField
+from collisions import Collision, SpatialGrid, sphere_contacts
+from gravity import (ASTEROID_GM_PER_VOLUME, BLACK_HOLE_GM, PLANET_GM_PER_VOLUME, SUN_GM,
+                     GravitySystem)
+from particles import ParticlePool
+from swarm import UFOSwarm
+
+# Nothing in this module may import pygame or OpenGL: the world has to step
+# in CI and on servers without a display.
+
+# Size of the 2D rocket cursor sprite; smoke is emitted at its tail
+CURSOR_W, CURSOR_H = 64, 64
+
+# Storage reserved for smoke; the live count is capped by World.smoke_limit
+SMOKE_CAPACITY = 100000
+
+# Radius of the sun sphere (see main.py)
+SUN_RADIUS = 100.0
+
+# Share of the rocket's speed left after one second of drag (2% per 60th
+# of a second), and of its size after a second of collapse
+ROCKET_DRAG = 0.98 ** 60
+COLLAPSE_SHRINK = 0.90 ** 60
+
+# The rocket collides as a sphere of this fraction of its size
+ROCKET_COLLISION_RADIUS = 0.35
+# Share of its speed into a body the rocket keeps when it bounces off
+BOUNCE_RESTITUTION = 0.5
+
+# Fastest the planets' clock may run, in times real speed
+MAX_TIME_WARP = 1e6
+
+# --------------------------
+# Shooting Star class
+# --------------------------
+class ShootingStar:
+    def __init__(self, screen_width, screen_height, rng=random):
+        self.w, self.h = screen_width, screen_height
+        # Start from a random edge
+        edge = rng.choice(['top', 'bottom', 'left', 'right'])
+        if edge == 'top':
+            self.x, self.y = rng.uniform(0, self.w), -10
+            self.vx, self.vy = rng.uniform(-4, 4), rng.uniform(5, 15)
+        elif edge == 'bottom':
+            self.x, self.y = rng.uniform(0, self.w), self.h + 10
+            self.vx, self.vy = rng.uniform(-4, 4), rng.uniform(-15, -5)
+        elif edge == 'left':
+            self.x, self.y = -10, rng.uniform(0, self.h)
+            self.vx, self.vy = rng.uniform(5, 15), rng.uniform(-4, 4)
+        else: # right
+            self.x, self.y = self.w + 10, rng.uniform(0, self.h)
+            self.vx, self.vy = rng.uniform(-15, -5), rng.uniform(-4, 4)
+
+        self.lifetime = 1.0 # Represents alpha, from 1.0 down to 0.0
+        self.length = rng.uniform(50, 150)
+
+    def update(self):
+        self.x += self.vx
+        self.y += self.vy
+        self.lifetime -= 0.01 # Fade out
+
+    def is_dead(self):
+        return self.lifetime <= 0 or \
+               self.x < -self.length or self.x > self.w + self.length or \
+               self.y < -self.length or self.y > self.h + self.length
+
+# --------------------------
+# UFO class
+# --------------------------
+class UFO:
+    def __init__(self, rng=random):
+        self.rng = rng
+        self.size = 15.0
+        self.rot_speed = rng.uniform(20, 50)
+        self.reset()
+
+    def update(self, dt):
+        for i in range(3):
+            self.pos[i] += self.vel[i] * dt
+        self.wrap()
+
+    def wrap(self):
+        # If UFO goes too far, reset it
+        if abs(self.pos[0]) > 1000 or abs(self.pos[1]) > 1000 or abs(self.pos[2]) > 1000:
+            self.reset()
+            return True
+        return False
+
+    def reset(self):
+        rng = self.rng
+        # Start at a random edge of a large box
+        self.pos = [rng.uniform(-800, 800), rng.uniform(-300, 300), rng.uniform(-800, 800)]
+        # Aim towards the center of the box
+        target = [rng.uniform(-200, 200), 0, rng.uniform(-200, 200)]
+        direction = [target[i] - self.pos[i] for i in range(3)]
+        norm = math.sqrt(sum(d*d for d in direction))
+        speed = rng.uniform(40, 80)
+        self.vel = [d / norm * speed for d in direction]
+
+# --------------------------
+# Rocket class for 3D flight
+# --------------------------
+class Rocket:
+    def __init__(self):
+        self.pos = [0.0, 0.0, 300.0] # Start in front of the sun
+        self.vel = [0.0, 0.0, 0.0]
+        # Forward vector (where the rocket is pointing)
+        self.forward = [0.0, 0.0, -1.0]
+        self.size = 20.0
+        self.is_collapsing = False
+        self.collapse_timer = 0.0
+        self.initial_pos = [0.0, 0.0, 300.0]
+        self.thrust = 0.0
+
+    def update(self, dt, forward, backward):
+        # --- Handle Controls ---
+        self.thrust = 0.0
+        if forward:
+            self.thrust = 150.0
+        if backward:
+            self.thrust = -100.0
+
+        if self.is_collapsing:
+            self.size *= COLLAPSE_SHRINK ** dt # Shrink rapidly
+            self.collapse_timer -= dt
+            if self.collapse_timer <= 0:
+                self.reset()
+            return # No other physics when collapsing
+
+        # --- Update Physics ---
+        # Apply thrust
+        for i in range(3):
+            self.vel[i] += self.forward[i] * self.thrust * dt
+
+        # Apply drag/friction, per second rather than per step
+        drag = ROCKET_DRAG ** dt
+        for i in range(3):
+            self.vel[i] *= drag
+
+        # Update position
+        for i in range(3):
+            self.pos[i] += self.vel[i] * dt
+
+    def bounce(self, normal, depth, restitution=BOUNCE_RESTITUTION):
+        # Back out of a body along the contact normal and lose the part of
+        # the velocity heading into it
+        into = sum(self.vel[i] * normal[i] for i in range(3))
+        if into < 0:
+            for i in range(3):
+                self.vel[i] -= (1 + restitution) * into * normal[i]
+        for i in range(3):
+            self.pos[i] += normal[i] * depth
+
+    def start_collapse(self, black_hole_pos):
+        if self.is_collapsing: return
+        self.is_collapsing = True
+        self.collapse_timer = 2.0 # Time until reset
+        # Set velocity to pull towards black hole
+        direction = [black_hole_pos[i] - self.pos[i] for i in range(3)]
+        self.vel = [d * 3 for d in direction] # Strong pull
+
+    def reset(self):
+        self.pos = list(self.initial_pos)
+        self.vel = [0.0, 0.0, 0.0]
+        self.forward = [0.0, 0.0, -1.0]
+        self.size = 20.0
+        self.is_collapsing = False
+
+    def update_orientation(self, mouse_dx, mouse_dy):
+        # Simple yaw and pitch based on mouse movement
+        yaw_angle = -mouse_dx * 0.005
+        pitch_angle = -mouse_dy * 0.005
+
+        # Rotate forward vector around Y-axis (yaw)
+        x, z = self.forward[0], self.forward[2]
+        self.forward[0] = x * math.cos(yaw_angle) - z * math.sin(yaw_angle)
+        self.forward[2] = x * math.sin(yaw_angle) + z * math.cos(yaw_angle)
+
+        # Rudimentary pitch (clamped to avoid flipping over)
+        self.forward[1] += pitch_angle
+        self.forward[1] = max(-0.8, min(0.8, self.forward[1]))
+
+# --------------------------
+# Player input for one simulation step
+# --------------------------
+class Inputs:
+    def __init__(self, follow_rocket=False, forward=False, backward=False,
+                 mouse_dx=0, mouse_dy=0, cursor=(0, 0)):
+        self.follow_rocket = follow_rocket # Rocket flight instead of the cursor
+        self.forward = forward             # W held
+        self.backward = backward           # S held
+        self.mouse_dx = mouse_dx           # Relative mouse motion in follow mode
+        self.mouse_dy = mouse_dy
+        self.cursor = cursor               # Mouse position in default mode
+
+# --------------------------
+# Everything that moves, stepped independently of rendering
+# --------------------------
+class World:
+    def __init__(self, width, height, asteroid_count=200, ufo_count=2, seed=None,
+                 smoke_limit=100, smoke_rate=3, scene=None, gravity=False, gravity_workers=0,
+                 swarm_count=0):
+        self.width, self.height = width, height
+        # Kept so a recording can build the same world again (see replay.py)
+        self.seed = seed if seed is not None else random.SystemRandom().getrandbits(63)
+        self.rng = random.Random(self.seed)
+        self.np_rng = np.random.default_rng(self.seed)
+        self.time = 0.0
+        # The planets' and the belt's clock, which time warp speeds up;
+        # the rocket, UFOs and effects always run on real time
+        self.epoch = 0.0
+        self.time_warp = 1.0
+
+        self.rocket = Rocket()
+        self.ufos = [UFO(self.rng) for _ in range(ufo_count)]
+        self.asteroids = AsteroidField(asteroid_count, self.np_rng)
+        # A fleet of many more UFOs kept in arrays, on its own random stream
+        # so the rest of the world is the same with or without it
+        self.swarm = UFOSwarm(swarm_count, np.random.default_rng((self.seed, 1))) if swarm_count else None
+
+        # Black Hole properties
+        self.black_hole = {
+            "pos": [2000, 500, 0], # Positioned far away from the solar system
+            "radius": 40.0, # The black sphere itself (event horizon)
+            "influence_radius": 100.0 # Where gravity starts to affect the rocket
+        }
+
+        # 2D effects in screen space
+        self.smoke = ParticlePool(max(SMOKE_CAPACITY, smoke_limit), self.np_rng)
+        self.smoke_limit = smoke_limit # Limit total particles
+        self.smoke_rate = smoke_rate   # Particles emitted per step
+        self.shooting_stars = []
+        self.cursor_tilt = 0.0
+        self.last_cursor_x = None
+
+        # Planets and moons (a scene.Scene), moved along with everything else
+        self.scene = scene
+        if scene is not None:
+            scene.update(self.epoch)
+        self.gravity = self._make_gravity(gravity_workers) if gravity else None
+
+        # Broad phase over the asteroids and UFOs, and the rocket's
+        # collisions of the last step
+        self.grid = SpatialGrid()
+        self.collisions = []
+
+    def set_time_warp(self, warp):
+        # Free bodies under gravity are integrated in real-time steps, so
+        # their planets can't run ahead
+        limit = 1.0 if self.gravity is not None else MAX_TIME_WARP
+        self.time_warp = max(1.0, min(limit, warp))
+
+    def set_epoch(self, epoch):
+        # Jump the planets to any point of their orbits; nothing is stepped
+        # in between, so this costs the same as a frame
+        self.epoch = epoch
+        if self.scene is not None:
+            self.scene.update(self.epoch)
+        if self.gravity is None:
+            self.asteroids.update(self.epoch)
+
+    def _make_gravity(self, workers):
+        # Real gravity: asteroids and UFOs become free bodies pulled by the
+        # sun, the planets and the black hole (and, weakly, by each other);
+        # the rocket feels the same attractors through Rocket's own physics
+        asteroids = self.asteroids
+        ufos = self.ufos
+        positions = np.concatenate([asteroids.base, np.array([ufo.pos for ufo in ufos]).reshape(-1, 3)])
+        velocities = np.concatenate([asteroids.orbit_velocities(SUN_GM),
+                                     np.array([ufo.vel for ufo in ufos]).reshape(-1, 3)])
+        # UFOs fly under power: pulled, but pulling nothing
+        masses = np.concatenate([ASTEROID_GM_PER_VOLUME * asteroids.size.astype(np.float64) ** 3,
+                                 np.zeros(len(ufos))])
+        gm = [SUN_GM]
+        if self.scene is not None:
+            planet_gm = PLANET_GM_PER_VOLUME * self.scene.size ** 3
+            gm.extend(np.where(np.isnan(self.scene.mass), planet_gm, self.scene.mass))
+        gm.append(BLACK_HOLE_GM)
+        return GravitySystem(positions, velocities, masses, gm, self.attractor_radii(), workers=workers)
+
+    def attractors(self):
+        # Positions of the big bodies: the sun, the scene's planets and
+        # moons, then the black hole
+        centers = [np.zeros((1, 3))]
+        if self.scene is not None:
+            centers.append(self.scene.centers)
+        centers.append(np.array([self.black_hole["pos"]], dtype=np.float64))
+        return np.concatenate(centers)
+
+    def attractor_radii(self):
+        radii = [SUN_RADIUS]
+        if self.scene is not None:
+            radii.extend(self.scene.size)
+        radii.append(self.black_hole["radius"])
+        return np.array(radii, dtype=np.float64)
+
+    def step(self, dt, inputs):
+        self.time += dt
+        self.epoch += dt * self.time_warp
+        if self.scene is not None:
+            self.scene.update(self.epoch)
+
+        if inputs.follow_rocket:
+            self._step_rocket(dt, inputs)
+            # Forget the cursor so returning to default mode doesn't jump the tilt
+            self.last_cursor_x = None
+        else:
+            self._step_cursor(inputs)
+
+        if self.gravity is not None:
+            self._step_gravity(dt)
+        else:
+            self.asteroids.update(self.epoch)
+            for ufo in self.ufos:
+                ufo.update(dt)
+        if self.swarm is not None:
+            # The swarm steers clear of the sun and the black hole's pull
+            # and keeps its own course under real gravity too
+            self.swarm.step(dt, [(0.0, 0.0, 0.0), self.black_hole["pos"]],
+                            [SUN_RADIUS, self.black_hole["influence_radius"]])
+        self._step_shooting_stars()
+        self.collisions = []
+        if inputs.follow_rocket:
+            self._collide_rocket()
+
+        self.smoke.update()
+
+    def _step_gravity(self, dt):
+        gravity = self.gravity
+        gravity.step(dt, self.attractors())
+        count = self.asteroids.count
+        self.asteroids.update(self.time, gravity.positions[:count])
+        for index, ufo in enumerate(self.ufos, count):
+            ufo.pos = gravity.positions[index].tolist()
+            ufo.vel = gravity.velocities[index].tolist()
+            if ufo.wrap():
+                gravity.place(index, ufo.pos, ufo.vel)
+
+    def _step_rocket(self, dt, inputs):
+        rocket = self.rocket
+        rocket.update_orientation(inputs.mouse_dx, inputs.mouse_dy)
+        if self.gravity is not None and not rocket.is_collapsing:
+            # A kick before Rocket's own thrust, drag and drift
+            pull = self.gravity.attraction(np.array([rocket.pos], dtype=np.float64), self.attractors())[0]
+            for i in range(3):
+                rocket.vel[i] += pull[i] * dt
+        rocket.update(dt, inputs.forward, inputs.backward)
+
+    def _collide_rocket(self):
+        # Once everything has moved: the few big bodies are tested directly,
+        # the asteroids and UFOs through the grid
+        rocket = self.rocket
+        if rocket.is_collapsing:
+            return
+        radius = rocket.size * ROCKET_COLLISION_RADIUS
+        pos = np.array(rocket.pos, dtype=np.float64)
+        collisions = self.collisions
+
+        last = len(self.attractor_radii()) - 1
+        for index, normal, depth in zip(*sphere_contacts(pos, radius, self.attractors(), self.attractor_radii())):
+            if index == 0:
+                collisions.append(Collision("sun", 0, normal.tolist(), float(depth)))
+            elif index == last:
+                collisions.append(Collision("black_hole", 0, normal.tolist(), float(depth)))
+            else:
+                collisions.append(Collision("planet", int(index) - 1, normal.tolist(), float(depth)))
+
+        asteroids = self.asteroids
+        ufo_centers = np.array([ufo.pos for ufo in self.ufos], dtype=np.float64).reshape(-1, 3)
+        self.grid.rebuild(np.concatenate([asteroids.positions, ufo_centers]),
+                          np.concatenate([asteroids.size, [ufo.size for ufo in self.ufos]]))
+        hits = self.grid.query(pos, radius)
+        for index, normal, depth in zip(*sphere_contacts(pos, radius, self.grid.centers[hits],
+                                                         self.grid.radii[hits])):
+            body = int(hits[index])
+            if body < asteroids.count:
+                collisions.append(Collision("asteroid", body, normal.tolist(), float(depth)))
+            else:
+                collisions.append(Collision("ufo", body - asteroids.count, normal.tolist(), float(depth)))
+
+        for collision in collisions:
+            if collision.kind == "black_hole":
+                # Past the event horizon (the rocket's center inside it)
+                if collision.depth >= radius:
+                    rocket.start_collapse(self.black_hole['pos'])
+                    break
+            elif collision.kind == "sun":
+                rocket.reset() # Burned up
+                break
+            else:
+                rocket.bounce(collision.normal, collision.depth)
+
+    def _step_cursor(self, inputs):
+        cursor_x, cursor_y = inputs.cursor
+        # Calculate 2D rocket tilt based on mouse velocity
+        cursor_dx = 0 if self.last_cursor_x is None else cursor_x - self.last_cursor_x
+        self.last_cursor_x = cursor_x
+
+        target_tilt = cursor_dx * 1.5
+        target_tilt = max(-25.0, min(25.0, target_tilt)) # Clamp between -25 and 25 degrees
+        # Smoothly interpolate to the target tilt for a nice easing effect
+        self.cursor_tilt += (target_tilt - self.cursor_tilt) * 0.1
+
+        # Add new particles at the rocket's tail
+        if len(self.smoke) < self.smoke_limit:
+            self.smoke.emit(self.smoke_rate, cursor_x + CURSOR_W / 2, cursor_y + CURSOR_H)
+
+    def _step_shooting_stars(self):
+        # Randomly add a new shooting star
+        if self.rng.random() < 0.015: # Adjust probability for more/fewer stars
+            if len(self.shooting_stars) < 5: # Limit concurrent stars
+                self.shooting_stars.append(ShootingStar(self.width, self.height, self.rng))
+
+        for star in reversed(self.shooting_stars):
+            star.update()
+            if star.is_dead():
+                self.shooting_stars.remove(star)
+
+    def state(self):
+        # Everything later steps depend on, copied, so restore() carries on
+        # from here exactly as this world would (see replay.py's keyframes).
+        # The planets, and the belt without gravity, follow from the epoch.
+        return {
+            "time": self.time, "epoch": self.epoch, "time_warp": self.time_warp,
+            "smoke_limit": self.smoke_limit, "cursor_tilt": self.cursor_tilt,
+            "last_cursor_x": self.last_cursor_x,
+            "rng": self.rng.getstate(), "np_rng": self.np_rng.bit_generator.state,
+            "rocket": copy.deepcopy(vars(self.rocket)),
+            # Each UFO's rng is the world's
+            "ufos": [{name: copy.deepcopy(value) for name, value in vars(ufo).items() if name != "rng"}
+                     for ufo in self.ufos],
+            "shooting_stars": copy.deepcopy(self.shooting_stars),
+            "smoke": self.smoke.state(),
+            "swarm": self.swarm.state() if self.swarm is not None else None,
+            "gravity": self.gravity.state() if self.gravity is not None else None,
+        }
+
+    def restore(self, state):
+        # Back to a state() of this world, or of one built the same way
+        self.time = state["time"]
+        self.time_warp = state["time_warp"]
+        self.smoke_limit = state["smoke_limit"]
+        self.cursor_tilt = state["cursor_tilt"]
+        self.last_cursor_x = state["last_cursor_x"]
+        self.rng.setstate(state["rng"])
+        self.np_rng.bit_generator.state = state["np_rng"]
+        vars(self.rocket).update(copy.deepcopy(state["rocket"]))
+        for ufo, saved in zip(self.ufos, state["ufos"]):
+            vars(ufo).update(copy.deepcopy(saved))
+        self.shooting_stars = copy.deepcopy(state["shooting_stars"])
+        self.smoke.restore(state["smoke"])
+        if self.swarm is not None:
+            self.swarm.restore(state["swarm"])
+        if self.gravity is not None:
+            self.gravity.restore(state["gravity"])
+            self.asteroids.update(self.time, self.gravity.positions[:self.asteroids.count])
+        self.set_epoch(state["epoch"])
+        self.collisions = []
+
+    def close(self):
+        # Stops the gravity's worker processes, if any
+        if self.gravity is not None:
+            self.gravity.close()
+
+# --------------------------
+# Headless stepping benchmark: python simulation.py [steps]
+# --------------------------
+# python simulation.py --gravity [steps] [asteroids] [workers]: the same
+# with real gravity, e.g. 100 steps of 100000 asteroids
+if __name__ == "__main__":
+    args = sys.argv[1:]
+    gravity = "--gravity" in args
+    args = [arg for arg in args if arg != "--gravity"]
+    steps = int(args[0]) if args else (200 if gravity else 10000)
+    asteroid_count = int(args[1]) if len(args) > 1 else 200
+    workers = int(args[2]) if len(args) > 2 else 0
+    dt = 1.0 / 60.0
+    for follow_rocket in (False, True):
+        world = World(1920, 1080, asteroid_count=asteroid_count, seed=0,
+                      gravity=gravity, gravity_workers=workers)
+        inputs = Inputs(follow_rocket=follow_rocket, forward=True, mouse_dx=2, cursor=(960, 540))
+        start = time.perf_counter()
+        for _ in range(steps):
+            world.step(dt, inputs)
+        elapsed = time.perf_counter() - start
+        world.close()
+        mode = "follow_rocket" if follow_rocket else "default"
+        print(f"{mode}: {steps} steps in {elapsed:.3f}s "
+              f"({steps / elapsed:,.0f} steps/s, {elapsed / steps * 1e6:.1f} us/step)")
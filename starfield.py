@@ -0,0 +1,237 @@
+import ctypes
+import math
+import os
+import sys
+
+import numpy as np
+from OpenGL.GL import *
+
+from shaders import compile_program
+
+# --------------------------
+# Binary star catalog
+# --------------------------
+# A 64-byte header, then one record per star, brightest (lowest magnitude)
+# first, so the stars down to any magnitude are a prefix of the file
+STAR_MAGIC = b"SSSTARCT"
+STAR_VERSION = 1
+STAR_HEADER_SIZE = 64
+STAR_HEADER = np.dtype([("magic", "S8"), ("version", "<u4"), ("count", "<u8")])
+# Unit direction, visual magnitude and sRGB color (alpha unused); the
+# records go to the GPU as they are
+STAR = np.dtype([("direction", "<f4", 3), ("magnitude", "<f4"), ("color", "u1", 4)])
+
+# Stars of this magnitude or brighter are drawn at full brightness; every
+# magnitude fainter is dimmer by STAR_FADE, so the faint ones add up to a
+# glow rather than vanishing
+FULL_BRIGHTNESS_MAGNITUDE = 3.0
+STAR_FADE = 10.0 ** (-0.4 * 0.5)
+# Stars dimmer than one step of an 8-bit channel change nothing on screen
+# and are never drawn, whatever the quality
+CONTRIBUTION_MAGNITUDE = FULL_BRIGHTNESS_MAGNITUDE + math.log(1 / 255) / math.log(STAR_FADE)
+# Point size in pixels at 1080 lines, from the faintest stars to magnitude -1.5
+MIN_POINT_SIZE = 1.0
+MAX_POINT_SIZE = 4.0
+
+# Stars uploaded to the GPU at a time, as the magnitude limit reaches them
+UPLOAD_CHUNK = 65536
+
+class StarCatalog:
+    # The records are memory-mapped, so opening takes no time whatever the
+    # size of the catalog, and only the pages of stars actually drawn are read
+    def __init__(self, path):
+        with open(path, "rb") as f:
+            header = np.frombuffer(f.read(STAR_HEADER.itemsize), dtype=STAR_HEADER)
+        if len(header) == 0 or header["magic"][0] != STAR_MAGIC or header["version"][0] != STAR_VERSION:
+            raise ValueError(f"'{path}' is not a version {STAR_VERSION} star catalog")
+        count = int(header["count"][0])
+        self.stars = (np.memmap(path, dtype=STAR, mode="r", offset=STAR_HEADER_SIZE, shape=(count,))
+                      if count else np.zeros(0, dtype=STAR))
+        self.magnitudes = self.stars["magnitude"]
+
+    def __len__(self):
+        return len(self.stars)
+
+    def count_brighter(self, magnitude):
+        # Stars of this magnitude or brighter: a binary search, thanks to the order
+        return int(np.searchsorted(self.magnitudes, magnitude, side="right"))
+
+def write_catalog(path, directions, magnitudes, colors):
+    order = np.argsort(magnitudes, kind="stable")
+    stars = np.zeros(len(order), dtype=STAR)
+    stars["direction"] = np.asarray(directions)[order]
+    stars["magnitude"] = np.asarray(magnitudes)[order]
+    stars["color"][:, :3] = np.asarray(colors)[order]
+    stars["color"][:, 3] = 255
+    header = np.zeros(1, dtype=STAR_HEADER)
+    header["magic"], header["version"], header["count"] = STAR_MAGIC, STAR_VERSION, len(stars)
+    with open(path, "wb") as f:
+        f.write(header.tobytes().ljust(STAR_HEADER_SIZE, b"\0"))
+        f.write(stars.tobytes())
+
+def build_synthetic_catalog(path, count=2000000, seed=0):
+    # A made-up sky with roughly the real one's statistics: about three times
+    # more stars per magnitude, a third of them crowded into a galactic
+    # band, and colors from hot blue-white to cool orange
+    rng = np.random.default_rng(seed)
+    directions = rng.normal(size=(count, 3))
+    band = rng.random(count) < 0.35
+    directions[band, 1] *= 0.12
+    # Tilt the band against the planets' plane
+    tilt = math.radians(60.0)
+    y, z = directions[:, 1].copy(), directions[:, 2].copy()
+    directions[:, 1] = y * math.cos(tilt) - z * math.sin(tilt)
+    directions[:, 2] = y * math.sin(tilt) + z * math.cos(tilt)
+    directions /= np.linalg.norm(directions, axis=1, keepdims=True)
+    # N(< m) grows as 10^(0.5 m), with about 9000 stars to magnitude 6.5
+    faintest = 6.5 + 2.0 * math.log10(count / 9000.0)
+    magnitudes = faintest + 2.0 * np.log10(1.0 - rng.random(count))
+    palette = np.array([(155, 176, 255), (202, 215, 255), (248, 247, 255), (255, 244, 234),
+                        (255, 210, 161), (255, 204, 111)], dtype=np.float64)
+    shade = rng.beta(2.0, 2.5, count) * (len(palette) - 1)
+    low = np.minimum(shade.astype(np.intp), len(palette) - 2)
+    f = (shade - low)[:, None]
+    colors = palette[low] * (1 - f) + palette[low + 1] * f
+    write_catalog(path, directions.astype(np.float32), magnitudes.astype(np.float32), colors.astype(np.uint8))
+
+# --------------------------
+# Draw the catalog as point sprites at infinity
+# --------------------------
+# Directions go in with w = 0, so the camera's position drops out and only
+# its rotation moves the stars; z is pinned inside the clip volume, since a
+# point at infinity lies beyond the far plane
+STAR_VERTEX_SHADER = """
+attribute vec3 direction;
+attribute float magnitude;
+attribute vec4 star_color;
+uniform float size_scale;
+varying vec4 color;
+void main() {
+    float brightness = min(pow(FADE, magnitude - FULL_MAGNITUDE), 1.0);
+    color = vec4(star_color.rgb, brightness);
+    float size = mix(MAX_SIZE, MIN_SIZE, clamp((magnitude + 1.5) / 5.0, 0.0, 1.0));
+    gl_PointSize = max(size * size_scale, 1.0);
+    gl_Position = view_projection * vec4(direction, 0.0);
+    gl_Position.z = 0.0;
+}
+"""
+
+STAR_FRAGMENT_SHADER = """
+varying vec4 color;
+void main() {
+    // Round, with a soft edge
+    float r = length(gl_PointCoord - vec2(0.5)) * 2.0;
+    frag_color = vec4(color.rgb, color.a * (1.0 - smoothstep(0.5, 1.0, r)));
+}
+"""
+
+DIRECTION_ATTRIB = 0
+MAGNITUDE_ATTRIB = 1
+COLOR_ATTRIB = 2
+
+class StarField:
+    # max_magnitude: the faintest limit draw() will ever be given
+    def __init__(self, catalog, core=False, max_magnitude=CONTRIBUTION_MAGNITUDE):
+        constants = (f"#define FADE {STAR_FADE:.8f}\n#define FULL_MAGNITUDE {FULL_BRIGHTNESS_MAGNITUDE:.4f}\n"
+                     f"#define MIN_SIZE {MIN_POINT_SIZE:.4f}\n#define MAX_SIZE {MAX_POINT_SIZE:.4f}\n")
+        self.program = compile_program(constants + STAR_VERTEX_SHADER, STAR_FRAGMENT_SHADER, {
+            "direction": DIRECTION_ATTRIB,
+            "magnitude": MAGNITUDE_ATTRIB,
+            "star_color": COLOR_ATTRIB,
+        }, core)
+        if self.program is None:
+            raise RuntimeError("Star shader is unavailable")
+        self.catalog = catalog
+        self.core = core
+        self.size_scale = glGetUniformLocation(self.program, "size_scale")
+        # Room for every star that could ever make a difference; filled
+        # from the catalog only as far as the magnitude limit has reached
+        self.capacity = catalog.count_brighter(min(max_magnitude, CONTRIBUTION_MAGNITUDE))
+        self.uploaded = 0
+        self.vbo = glGenBuffers(1)
+        glBindBuffer(GL_ARRAY_BUFFER, self.vbo)
+        glBufferData(GL_ARRAY_BUFFER, max(self.capacity, 1) * STAR.itemsize, None, GL_STATIC_DRAW)
+        glBindBuffer(GL_ARRAY_BUFFER, 0)
+        self.vao = glGenVertexArrays(1) if core else None
+        # Stars drawn in the last frame
+        self.count = 0
+        # Running totals for the profiler
+        self.draw_calls = 0
+        self.vertices = 0
+
+    def _upload(self, count):
+        glBindBuffer(GL_ARRAY_BUFFER, self.vbo)
+        while self.uploaded < count:
+            end = min(self.uploaded + UPLOAD_CHUNK, self.capacity)
+            stars = np.ascontiguousarray(self.catalog.stars[self.uploaded:end])
+            glBufferSubData(GL_ARRAY_BUFFER, self.uploaded * STAR.itemsize, stars.nbytes, stars)
+            self.uploaded = end
+        glBindBuffer(GL_ARRAY_BUFFER, 0)
+
+    def draw(self, magnitude_limit):
+        # Every star down to magnitude_limit (and no fainter than can show);
+        # the camera must already be set
+        count = min(self.catalog.count_brighter(magnitude_limit), self.capacity)
+        self.count = count
+        if not count:
+            return
+        if count > self.uploaded:
+            self._upload(count)
+        viewport = glGetIntegerv(GL_VIEWPORT)
+        glUseProgram(self.program)
+        glUniform1f(self.size_scale, viewport[3] / 1080.0)
+        glEnable(GL_PROGRAM_POINT_SIZE)
+        if not self.core:
+            # gl_PointCoord needs point sprites on a compatibility context
+            glEnable(GL_POINT_SPRITE)
+        # Light adds up, and the sky is behind everything
+        glBlendFunc(GL_SRC_ALPHA, GL_ONE)
+        glDisable(GL_DEPTH_TEST)
+        glDepthMask(GL_FALSE)
+
+        if self.vao is not None:
+            glBindVertexArray(self.vao)
+        glBindBuffer(GL_ARRAY_BUFFER, self.vbo)
+        glEnableVertexAttribArray(DIRECTION_ATTRIB)
+        glEnableVertexAttribArray(MAGNITUDE_ATTRIB)
+        glEnableVertexAttribArray(COLOR_ATTRIB)
+        glVertexAttribPointer(DIRECTION_ATTRIB, 3, GL_FLOAT, GL_FALSE, STAR.itemsize, ctypes.c_void_p(0))
+        glVertexAttribPointer(MAGNITUDE_ATTRIB, 1, GL_FLOAT, GL_FALSE, STAR.itemsize, ctypes.c_void_p(12))
+        glVertexAttribPointer(COLOR_ATTRIB, 4, GL_UNSIGNED_BYTE, GL_TRUE, STAR.itemsize, ctypes.c_void_p(16))
+        glDrawArrays(GL_POINTS, 0, count)
+        self.draw_calls += 1
+        self.vertices += count
+        glDisableVertexAttribArray(DIRECTION_ATTRIB)
+        glDisableVertexAttribArray(MAGNITUDE_ATTRIB)
+        glDisableVertexAttribArray(COLOR_ATTRIB)
+        glBindBuffer(GL_ARRAY_BUFFER, 0)
+        if self.vao is not None:
+            glBindVertexArray(0)
+
+        glDepthMask(GL_TRUE)
+        glEnable(GL_DEPTH_TEST)
+        glBlendFunc(GL_SRC_ALPHA, GL_ONE_MINUS_SRC_ALPHA)
+        if not self.core:
+            glDisable(GL_POINT_SPRITE)
+        glDisable(GL_PROGRAM_POINT_SIZE)
+        glUseProgram(0)
+
+    def release(self):
+        if self.vao is not None:
+            glDeleteVertexArrays(1, [self.vao])
+            self.vao = None
+        glDeleteBuffers(1, [self.vbo])
+        if self.program is not None:
+            glDeleteProgram(self.program)
+            self.program = None
+
+# --------------------------
+# Build a synthetic catalog: python starfield.py PATH [count]
+# --------------------------
+if __name__ == "__main__":
+    path = sys.argv[1]
+    count = int(sys.argv[2]) if len(sys.argv) > 2 else 2000000
+    build_synthetic_catalog(path, count)
+    catalog = StarCatalog(path)
+    print(f"Wrote {len(catalog):,} stars to '{path}' ({os.path.getsize(path) / 1e6:.1f} MB), "
+          f"{catalog.count_brighter(CONTRIBUTION_MAGNITUDE):,} of them bright enough to show")
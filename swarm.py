@@ -0,0 +1,298 @@
+import math
+import sys
+import time
+
+import numpy as np
+
+# Like simulation.py, nothing here may import pygame or OpenGL.
+
+# Ships start anywhere in this box (half-extents), aiming at a point near
+# the middle, and start over once past WRAP_DISTANCE on any axis, like the
+# two UFOs (see simulation.UFO)
+START_BOX = (800.0, 300.0, 800.0)
+TARGET_BOX = (200.0, 0.0, 200.0)
+WRAP_DISTANCE = 1000.0
+MIN_SPEED, MAX_SPEED = 40.0, 80.0
+MIN_SPIN, MAX_SPIN = 20.0, 50.0 # Degrees per second about their own axis
+
+# Swarm ships are smaller than the two UFOs, so a big fleet still has room
+SWARM_SHIP_SIZE = 6.0
+
+# Steering, in units per second squared. Ships seek their target until
+# they come within ARRIVE_RADIUS, then cruise on out of the box.
+SEEK_WEIGHT = 1.5 # Share of the velocity error corrected per second
+ARRIVE_RADIUS = 60.0
+SEPARATION_WEIGHT = 60.0
+# Neighbours in a cell that make a ship push away at full strength
+SEPARATION_CROWD = 4
+# Ships are pushed away from the sun and the black hole from this far
+# outside them, harder the deeper they get
+AVOID_MARGIN = 80.0
+AVOID_WEIGHT = 400.0
+MAX_STEER = 250.0
+# Slowest a ship may go, as a share of its cruising speed
+MIN_SPEED_SHARE = 0.5
+
+# Spatial hash of the separation: cells of a few ship sizes, hashed into
+# a table of at least as many slots as ships. The work is spread over
+# 2 * SEPARATION_CHUNKS steps (see UFOSwarm._separation), which is how often
+# each ship's push is renewed: 7.5 times a second at 60 steps a second,
+# while even the fastest ship moves less than half a cell.
+SEPARATION_CELL = 4.0 * SWARM_SHIP_SIZE
+SEPARATION_CHUNKS = 4
+HASH_PRIMES = (73856093, 19349663, 83492791)
+
+# The arrays of UFOSwarm kept from one step to the next; the rest is scratch
+SWARM_STATE = ("positions", "velocities", "targets", "speeds", "spin", "angles", "passed", "push",
+               "slots", "tables")
+
+def _length(v, out=None, scratch=None):
+    # Per-column length of a (3, n) array; written into out, with the help
+    # of scratch, when they are given
+    if out is None:
+        return np.sqrt(v[0] * v[0] + v[1] * v[1] + v[2] * v[2])
+    np.multiply(v[0], v[0], out=out)
+    for axis in (1, 2):
+        np.multiply(v[axis], v[axis], out=scratch)
+        out += scratch
+    return np.sqrt(out, out=out)
+
+# --------------------------
+# A fleet of UFOs as flat arrays
+# --------------------------
+class UFOSwarm:
+    # Every ship's state is a column of a few NumPy arrays and every step is
+    # a few dozen whole-array operations: seek towards the ship's target,
+    # separation from the others in its cell of a spatial hash, avoidance
+    # of the sun and the black hole, and a reset of the ships that left.
+    # Nothing loops over ships in Python. Vectors are stored (3, n), one
+    # contiguous row per axis, so every operation runs over long contiguous
+    # rows, and every intermediate goes into a buffer kept from step to
+    # step: fresh arrays of this size come from the OS as zeroed pages each
+    # time, which costs as much as the arithmetic. See python swarm.py for
+    # the time per step.
+    def __init__(self, count, rng=None, size=SWARM_SHIP_SIZE):
+        self.rng = rng if rng is not None else np.random.default_rng()
+        self.count = count
+        self.size = size
+        self.positions = np.zeros((3, count), dtype=np.float32)
+        self.velocities = np.zeros((3, count), dtype=np.float32)
+        self.targets = np.zeros((3, count), dtype=np.float32)
+        self.speeds = np.zeros(count, dtype=np.float32) # Cruising speed
+        self.spin = self.rng.uniform(MIN_SPIN, MAX_SPIN, count).astype(np.float32)
+        self.angles = self.rng.uniform(0.0, 360.0, count).astype(np.float32) # About y, degrees
+        self.passed = np.zeros(count, dtype=bool) # Past their target, on their way out
+        self.push = np.zeros((3, count), dtype=np.float32) # Last separation
+
+        # The spatial hash: every ship's slot, and per slot the ships in it
+        # and the sums of their x, y and z, from the first half of the
+        # separation to the second
+        self.table_size = 1 << max(10, int(count - 1).bit_length())
+        self.slots = np.zeros(count, dtype=np.intp)
+        self.tables = np.zeros((4, self.table_size), dtype=np.float32)
+        self.ones = np.ones(count, dtype=np.float32)
+        self.hashing = False
+        self.reset_since_hash = [] # Index arrays of ships reset in between
+
+        # Scratch: a vector and three numbers per ship
+        self.vector = np.zeros((3, count), dtype=np.float32)
+        self.steer = np.zeros((3, count), dtype=np.float32)
+        self.scratch = np.zeros((3, count), dtype=np.float32)
+        self.steps = 0
+        self.resets = 0
+        self._reset(np.arange(count))
+
+    def state(self):
+        # Everything the next steps depend on, copied (see World.state)
+        state = {name: getattr(self, name).copy() for name in SWARM_STATE}
+        state.update(rng=self.rng.bit_generator.state, hashing=self.hashing, steps=self.steps,
+                     resets=self.resets, reset_since_hash=[index.copy() for index in self.reset_since_hash])
+        return state
+
+    def restore(self, state):
+        for name in SWARM_STATE:
+            getattr(self, name)[...] = state[name]
+        self.rng.bit_generator.state = state["rng"]
+        self.hashing, self.steps, self.resets = state["hashing"], state["steps"], state["resets"]
+        self.reset_since_hash = [index.copy() for index in state["reset_since_hash"]]
+
+    def _reset(self, index):
+        # Vectorized UFO.reset() for the ships in index
+        k = len(index)
+        if not k:
+            return
+        rng = self.rng
+        positions = rng.uniform(-1.0, 1.0, (3, k)) * np.reshape(START_BOX, (3, 1))
+        targets = rng.uniform(-1.0, 1.0, (3, k)) * np.reshape(TARGET_BOX, (3, 1))
+        speeds = rng.uniform(MIN_SPEED, MAX_SPEED, k)
+        direction = targets - positions
+        self.positions[:, index] = positions
+        self.targets[:, index] = targets
+        self.speeds[index] = speeds
+        self.velocities[:, index] = direction * (speeds / np.maximum(_length(direction), 1e-6))
+        self.passed[index] = False
+        self.push[:, index] = 0.0
+        if self.hashing:
+            # Their slots are where they were
+            self.reset_since_hash.append(index)
+        self.resets += k
+
+    def _separation(self):
+        # Push each ship away from the centroid of the others in its cell.
+        # The cells are hashed into a fixed table and summed into it with
+        # np.add.at, so there is no sort and no pair list. The work is
+        # spread evenly over steps: the ships are hashed and summed one
+        # chunk per step, then pushed away from their cell's centroid one
+        # chunk per step (they have moved by a fraction of a cell since).
+        # Every other hash the grid shifts by half a cell, so neighbours
+        # across a cell border still see each other.
+        phase = self.steps % (2 * SEPARATION_CHUNKS)
+        chunk = phase % SEPARATION_CHUNKS
+        start = self.count * chunk // SEPARATION_CHUNKS
+        stop = self.count * (chunk + 1) // SEPARATION_CHUNKS
+        pos, slots, tables = self.positions[:, start:stop], self.slots[start:stop], self.tables
+        a, b, c = self.scratch[:, start:stop]
+        if phase < SEPARATION_CHUNKS:
+            if phase == 0:
+                tables.fill(0.0)
+                self.hashing = True
+            offset = SEPARATION_CELL * 0.5 * (self.steps // (2 * SEPARATION_CHUNKS) & 1)
+            cell = self.vector[0, start:stop]
+            hashed = self.vector[1, start:stop].view(np.int32)
+            for axis, prime in enumerate(HASH_PRIMES):
+                np.add(pos[axis], offset, out=cell)
+                cell *= 1.0 / SEPARATION_CELL
+                np.floor(cell, out=cell)
+                np.copyto(hashed, cell, casting="unsafe")
+                # int32 products wrap around, which is fine for a hash
+                hashed *= prime
+                if axis == 0:
+                    np.copyto(slots, hashed)
+                else:
+                    slots ^= hashed
+            slots &= self.table_size - 1
+            np.add.at(tables[0], slots, self.ones[start:stop])
+            for axis in range(3):
+                np.add.at(tables[axis + 1], slots, pos[axis])
+            return
+
+        away = self.push[:, start:stop]
+        others = np.take(tables[0], slots, out=a)
+        others -= 1.0
+        np.add(others, 1.0, out=b)
+        share = np.maximum(others, 1.0, out=c)
+        np.reciprocal(share, out=share)
+        for axis in range(3):
+            # pos minus the mean of the others: (n pos - sum) / (n - 1) with n = others + 1
+            np.multiply(pos[axis], b, out=away[axis])
+            away[axis] -= np.take(tables[axis + 1], slots, out=self.vector[0, start:stop])
+            away[axis] *= share
+        strength = np.minimum(others, SEPARATION_CROWD, out=a)
+        strength *= SEPARATION_WEIGHT / SEPARATION_CROWD
+        distance = _length(away, b, c)
+        np.maximum(distance, 1e-3, out=distance)
+        strength /= distance
+        away *= strength
+        # Ships reset since the hash were counted where they used to be
+        for index in self.reset_since_hash:
+            self.push[:, index[(index >= start) & (index < stop)]] = 0.0
+        if phase == 2 * SEPARATION_CHUNKS - 1:
+            self.reset_since_hash = []
+            self.hashing = False
+
+    def step(self, dt, obstacle_centers, obstacle_radii):
+        # obstacle_centers, obstacle_radii: the spheres to keep clear of
+        pos, vel, steer, vector = self.positions, self.velocities, self.steer, self.vector
+        a, b, c = self.scratch
+
+        # Seek: the velocity error towards the cruising speed along the
+        # line to the target, corrected at SEEK_WEIGHT a second
+        np.subtract(self.targets, pos, out=steer)
+        distance = _length(steer, a, b)
+        self.passed |= distance < ARRIVE_RADIUS
+        gain = np.multiply(~self.passed, SEEK_WEIGHT, out=b)
+        np.maximum(distance, 1e-3, out=distance)
+        factor = np.divide(self.speeds, distance, out=a)
+        factor *= gain
+        steer *= factor
+        np.multiply(vel, gain, out=vector)
+        steer -= vector
+
+        self._separation()
+        steer += self.push
+
+        # Avoid: pushed straight out, harder the deeper within the margin.
+        # An obstacle no ship can come near before the wrap is skipped; the
+        # others are a handful of passes over the whole fleet, as the ships
+        # crowd round the sun and a gather of the near ones costs more
+        for center, radius in zip(np.asarray(obstacle_centers, dtype=np.float32), obstacle_radii):
+            reach = radius + AVOID_MARGIN
+            if (np.abs(center) - reach > WRAP_DISTANCE).any():
+                continue
+            np.subtract(pos, center[:, None], out=vector)
+            distance = _length(vector, a, b)
+            depth = np.subtract(reach, distance, out=b)
+            np.maximum(depth, 0.0, out=depth)
+            np.maximum(distance, 1e-3, out=distance)
+            depth /= distance
+            depth *= AVOID_WEIGHT / AVOID_MARGIN
+            vector *= depth
+            steer += vector
+
+        # Integrate, with the steering and the speed kept in bounds
+        magnitude = _length(steer, a, b)
+        limit = np.minimum(magnitude, MAX_STEER, out=b)
+        np.maximum(magnitude, 1e-6, out=magnitude)
+        limit /= magnitude
+        limit *= dt
+        steer *= limit
+        vel += steer
+        speed = _length(vel, a, b)
+        wanted = np.multiply(self.speeds, MIN_SPEED_SHARE, out=b)
+        np.maximum(wanted, speed, out=wanted)
+        np.minimum(wanted, self.speeds, out=wanted)
+        np.maximum(speed, 1e-6, out=speed)
+        wanted /= speed
+        vel *= wanted
+        np.multiply(vel, dt, out=vector)
+        pos += vector
+        # Spin is positive and far less than a turn per step, so one
+        # subtraction keeps the angles in [0, 360)
+        self.angles += np.multiply(self.spin, dt, out=a)
+        np.subtract(self.angles, 360.0, out=self.angles, where=self.angles >= 360.0)
+        self.steps += 1
+
+        farthest = np.max(np.abs(pos, out=vector), axis=0, out=a)
+        self._reset(np.flatnonzero(farthest > WRAP_DISTANCE))
+
+def swarm_matrices(positions, angles, size):
+    # Column-major model matrices (as AsteroidField keeps them): spun about
+    # y by angles (degrees), scaled by size and moved to positions (n, 3)
+    radians = np.radians(angles)
+    c, s = np.cos(radians) * size, np.sin(radians) * size
+    m = np.zeros((len(positions), 4, 4), dtype=np.float32)
+    m[:, 0, 0] = c
+    m[:, 0, 2] = -s
+    m[:, 1, 1] = size
+    m[:, 2, 0] = s
+    m[:, 2, 2] = c
+    m[:, 3, :3] = positions
+    m[:, 3, 3] = 1.0
+    return m
+
+# --------------------------
+# Headless timing: python swarm.py [ships] [steps]
+# --------------------------
+if __name__ == "__main__":
+    count = int(sys.argv[1]) if len(sys.argv) > 1 else 100000
+    steps = int(sys.argv[2]) if len(sys.argv) > 2 else 300
+    swarm = UFOSwarm(count, np.random.default_rng(0))
+    # The sun and the black hole, as in simulation.World
+    centers, radii = [(0.0, 0.0, 0.0), (2000.0, 500.0, 0.0)], [100.0, 100.0]
+    start = time.perf_counter()
+    for _ in range(steps):
+        swarm.step(1.0 / 60.0, centers, radii)
+    elapsed = time.perf_counter() - start
+    inside = _length(swarm.positions) < radii[0]
+    print(f"{count:,} ships: {elapsed / steps * 1e3:.2f} ms per step, {swarm.resets - count:,} resets "
+          f"in {steps} steps, {int(inside.sum())} inside the sun")
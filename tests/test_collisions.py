@@ -0,0 +1,25 @@
+import numpy as np
+
+from collisions import SpatialGrid, sphere_contacts
+
+def test_grid_query_matches_brute_force():
+    rng = np.random.default_rng(0)
+    centers = rng.uniform(-200.0, 200.0, (2000, 3))
+    radii = rng.uniform(0.5, 3.5, 2000)
+    grid = SpatialGrid()
+    grid.rebuild(centers, radii)
+    for center, radius in zip(rng.uniform(-200.0, 200.0, (50, 3)), rng.uniform(1.0, 30.0, 50)):
+        distance = np.linalg.norm(centers - center, axis=1)
+        expected = np.flatnonzero(distance < radius + radii)
+        assert sorted(grid.query(center, radius).tolist()) == expected.tolist()
+
+def test_grid_query_larger_than_the_grid():
+    grid = SpatialGrid()
+    grid.rebuild([(0.0, 0.0, 0.0), (100.0, 0.0, 0.0)], [1.0, 1.0])
+    assert sorted(grid.query((50.0, 0.0, 0.0), 1000.0).tolist()) == [0, 1]
+
+def test_sphere_contacts_normal_and_depth():
+    hit, normal, depth = sphere_contacts((0.0, 3.0, 0.0), 1.0, [(0.0, 0.0, 0.0), (10.0, 0.0, 0.0)], [2.5, 1.0])
+    assert hit.tolist() == [0]
+    assert np.allclose(normal, [(0.0, 1.0, 0.0)])
+    assert np.allclose(depth, [0.5])
@@ -0,0 +1,52 @@
+import numpy as np
+
+from gravity import SOFTENING, GravitySystem, Octree
+
+def _direct(positions, masses, softening=SOFTENING):
+    d = positions[None, :, :] - positions[:, None, :]
+    r2 = np.einsum("ijk,ijk->ij", d, d) + softening * softening
+    return np.einsum("ijk,ij->ik", d, masses[None, :] / (r2 * np.sqrt(r2)))
+
+def _tree(positions, masses, theta):
+    tree = Octree(positions, masses)
+    acc = np.zeros_like(positions)
+    for first, last in tree.chunks(256):
+        acc[tree.bodies(first, last)] = tree.accelerations(first, last, theta)
+    return acc
+
+def _bodies(count=1500, seed=0):
+    rng = np.random.default_rng(seed)
+    # A clumpy disc, so the tree gets both crowded and empty cells
+    radius = rng.uniform(10.0, 300.0, count)
+    angle = rng.uniform(0.0, 2 * np.pi, count)
+    positions = np.stack([radius * np.cos(angle), rng.normal(0.0, 5.0, count), radius * np.sin(angle)], axis=1)
+    return positions, rng.uniform(0.1, 2.0, count)
+
+def test_octree_without_approximation_is_the_direct_sum():
+    positions, masses = _bodies(600)
+    assert np.allclose(_tree(positions, masses, 0.0), _direct(positions, masses), rtol=1e-9, atol=1e-12)
+
+def test_octree_is_close_to_the_direct_sum():
+    positions, masses = _bodies()
+    exact = _direct(positions, masses)
+    errors = []
+    for theta in (0.5, 0.3):
+        error = np.linalg.norm(_tree(positions, masses, theta) - exact, axis=1) / np.linalg.norm(exact, axis=1)
+        # The worst few are bodies whose pulls nearly cancel
+        assert np.median(error) < 0.02
+        assert np.percentile(error, 99) < 0.1
+        errors.append(np.median(error))
+    # A smaller opening angle opens more cells
+    assert errors[1] < errors[0]
+
+def test_leapfrog_keeps_a_circular_orbit():
+    gm, radius = 8.0e4, 300.0
+    speed = np.sqrt(gm / radius)
+    system = GravitySystem([(radius, 0.0, 0.0)], [(0.0, 0.0, speed)], [0.0], [gm], [1.0])
+    sun = np.zeros((1, 3))
+    period = 2 * np.pi * radius / speed
+    steps = 600
+    for _ in range(steps):
+        system.step(period / steps, sun)
+    assert abs(np.linalg.norm(system.positions[0]) - radius) < 1e-3 * radius
+    assert np.allclose(system.positions[0], (radius, 0.0, 0.0), atol=0.01 * radius)
@@ -0,0 +1,48 @@
+import numpy as np
+
+from particles import ParticlePool
+
+def test_emit_stops_at_capacity():
+    pool = ParticlePool(10, np.random.default_rng(0))
+    assert pool.emit(6, 0.0, 0.0) == 6
+    assert pool.emit(6, 0.0, 0.0) == 4
+    assert pool.emit(1, 0.0, 0.0) == 0
+    assert len(pool) == 10
+
+def test_swap_remove_keeps_every_live_particle():
+    pool = ParticlePool(100, np.random.default_rng(0))
+    pool.emit(50, 0.0, 0.0)
+    # Tag each particle by its x, and kill every third one
+    pool.x[:50] = np.arange(50)
+    pool.vx[:50] = 0.0
+    pool.lifetime[:50] = np.where(np.arange(50) % 3 == 0, 1.0, 10.0)
+    pool.update()
+    survivors = [i for i in range(50) if i % 3]
+    assert len(pool) == len(survivors)
+    assert sorted(pool.x[:len(pool)].tolist()) == survivors
+    # Every field moved along with x
+    assert (pool.lifetime[:len(pool)] == 9.0).all()
+
+def test_update_removes_everything_that_expired():
+    pool = ParticlePool(1000, np.random.default_rng(1))
+    pool.emit(1000, 10.0, 10.0)
+    for _ in range(50):
+        pool.update()
+    assert len(pool) == 0
+
+def test_quads_have_four_corners_per_particle():
+    pool = ParticlePool(10, np.random.default_rng(0))
+    pool.emit(3, 5.0, 5.0)
+    quads = pool.quads()
+    assert quads.shape == (12, 6)
+    assert np.allclose(quads[:4, 0].min() + quads[:4, 0].max(), 2 * pool.x[0])
+
+def test_state_restores_the_live_particles():
+    pool = ParticlePool(100, np.random.default_rng(0))
+    pool.emit(20, 0.0, 0.0)
+    state = pool.state()
+    pool.update()
+    pool.emit(20, 50.0, 50.0)
+    pool.restore(state)
+    assert len(pool) == 20
+    assert np.array_equal(pool.x[:20], state["x"])
@@ -0,0 +1,104 @@
+import os
+
+import numpy as np
+import pytest
+
+import replay
+from replay import Recorder, Replay
+from simulation import Inputs, World
+
+DT = 1.0 / 60.0
+
+def _inputs(step):
+    if step % 300 < 120:
+        return Inputs(cursor=(200 + step % 97, 300))
+    return Inputs(follow_rocket=True, forward=step % 40 < 30, mouse_dx=step % 9 - 4, mouse_dy=step % 5 - 2)
+
+def _record(path, steps, snapshots=True, **options):
+    world = World(800, 600, seed=11, **options)
+    recorder = Recorder(str(path), world, DT, snapshots=snapshots)
+    for step in range(steps):
+        if step == 200:
+            # Changed from outside, as the time warp keys do
+            world.set_time_warp(100.0)
+        world.step(DT, _inputs(step))
+        recorder.write(world, _inputs(step))
+    recorder.close()
+    return world
+
+def _play(recording, start=0):
+    world = recording.make_world()
+    recording.seek(world, start)
+    worst = 0.0
+    while True:
+        frame = recording.position
+        inputs = recording.next(world)
+        if inputs is None:
+            return world, worst
+        world.step(recording.tick, inputs)
+        worst = max(worst, recording.divergence(world, frame))
+
+@pytest.fixture
+def short_keyframes(monkeypatch):
+    monkeypatch.setattr(replay, "KEYFRAME_STEPS", 150)
+
+def test_header_round_trip(tmp_path):
+    world = _record(tmp_path / "run.bin", 10, snapshots=False, asteroid_count=50, ufo_count=3)
+    recording = Replay(str(tmp_path / "run.bin"))
+    assert len(recording) == 10
+    assert recording.tick == DT
+    rebuilt = recording.make_world()
+    assert rebuilt.seed == world.seed
+    assert rebuilt.asteroids.count == 50 and len(rebuilt.ufos) == 3
+    recording.close()
+
+def test_replay_matches_the_recording(tmp_path):
+    recorded = _record(tmp_path / "run.bin", 500)
+    recording = Replay(str(tmp_path / "run.bin"))
+    world, worst = _play(recording)
+    assert worst == 0.0
+    assert world.time_warp == recorded.time_warp
+    assert np.array_equal(world.asteroids.positions, recorded.asteroids.positions)
+    recording.close()
+
+def test_seek_from_keyframes_is_exact(tmp_path, short_keyframes):
+    recorded = _record(tmp_path / "run.bin", 500, gravity=True, asteroid_count=200, swarm_count=300)
+    recording = Replay(str(tmp_path / "run.bin"))
+    assert [step for step, _ in recording.keyframes] == [0, 150, 300, 450]
+    for start in (0, 149, 150, 321, 500):
+        world, worst = _play(recording, start)
+        assert worst == 0.0
+        assert np.array_equal(world.gravity.positions, recorded.gravity.positions)
+        assert np.array_equal(world.swarm.positions, recorded.swarm.positions)
+        assert world.rng.getstate() == recorded.rng.getstate()
+        world.close()
+    recording.close()
+
+def test_file_cut_short_keeps_the_whole_records(tmp_path, short_keyframes):
+    path = tmp_path / "run.bin"
+    _record(path, 400)
+    size = os.path.getsize(path)
+    with open(path, "r+b") as f:
+        f.truncate(size - 5)
+    keys = str(path) + replay.KEYFRAME_SUFFIX
+    with open(keys, "r+b") as f:
+        f.truncate(os.path.getsize(keys) - 5)
+    recording = Replay(str(path))
+    assert len(recording) == 399
+    # The last keyframe was cut short and is left out
+    assert [step for step, _ in recording.keyframes] == [0, 150]
+    world, worst = _play(recording, 200)
+    assert worst == 0.0
+    recording.close()
+
+def test_seek_needs_keyframes(tmp_path):
+    path = tmp_path / "run.bin"
+    _record(path, 50)
+    os.remove(str(path) + replay.KEYFRAME_SUFFIX)
+    recording = Replay(str(path))
+    with pytest.raises(ValueError):
+        recording.seek(recording.make_world(), 10)
+    # A fresh world is at step 0 anyway
+    world, worst = _play(recording)
+    assert worst == 0.0
+    recording.close()
@@ -0,0 +1,22 @@
+import os
+
+import numpy as np
+
+from scene import Scene, load_catalog, solve_kepler
+
+CATALOG = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "scene.json")
+
+def test_solve_kepler_satisfies_keplers_equation():
+    mean_anomaly, e = np.meshgrid(np.linspace(0.0, 2 * np.pi, 73), [0.0, 0.1, 0.5, 0.8, 0.95, 0.99])
+    anomaly = solve_kepler(mean_anomaly, e)
+    assert np.abs(anomaly - e * np.sin(anomaly) - mean_anomaly).max() < 1e-10
+
+def test_solve_kepler_circular_orbit_is_identity():
+    mean_anomaly = np.linspace(0.0, 2 * np.pi, 10)
+    assert np.allclose(solve_kepler(mean_anomaly, 0.0), mean_anomaly)
+
+def test_ephemeris_tables_follow_the_exact_orbits():
+    scene = Scene(load_catalog(CATALOG))
+    for t in (0.0, 12.5, 1234.5, 1e6):
+        error = np.linalg.norm(scene.position_at(t) - scene.position_at(t, exact=True), axis=1)
+        assert (error <= 1e-3 * scene.distance + 1e-6).all()
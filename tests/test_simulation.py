@@ -0,0 +1,71 @@
+import numpy as np
+import pytest
+
+from simulation import SUN_RADIUS, Inputs, World
+
+DT = 1.0 / 60.0
+
+def _inputs(step):
+    # Cursor for a while, then rocket flight with some turning
+    if step < 100:
+        return Inputs(cursor=(400 + step, 300))
+    return Inputs(follow_rocket=True, forward=step % 50 < 40, mouse_dx=step % 7 - 3, mouse_dy=step % 5 - 2)
+
+def _run(world, steps, first=0):
+    for step in range(first, first + steps):
+        world.step(DT, _inputs(step))
+    return world
+
+def _bodies(world):
+    return np.array([world.rocket.pos] + [ufo.pos for ufo in world.ufos])
+
+def test_same_seed_same_world():
+    a = _run(World(800, 600, seed=7), 300)
+    b = _run(World(800, 600, seed=7), 300)
+    assert np.array_equal(_bodies(a), _bodies(b))
+    assert np.array_equal(a.asteroids.positions, b.asteroids.positions)
+    assert len(a.smoke) == len(b.smoke)
+
+def test_rocket_flies_forward_under_thrust():
+    world = World(800, 600, seed=0)
+    start = list(world.rocket.pos)
+    for _ in range(60):
+        world.step(DT, Inputs(follow_rocket=True, forward=True))
+    # Pointing along -z from in front of the sun
+    assert world.rocket.pos[2] < start[2] - 10.0
+    assert world.time == pytest.approx(1.0)
+
+def test_cursor_mode_emits_smoke_up_to_the_limit():
+    world = World(800, 600, seed=0, smoke_limit=50, smoke_rate=10)
+    for _ in range(30):
+        world.step(DT, Inputs(cursor=(100, 100)))
+    assert 0 < len(world.smoke) <= 50 + 10
+
+def test_rocket_burns_up_in_the_sun():
+    world = World(800, 600, seed=0)
+    world.rocket.pos = [0.0, 0.0, SUN_RADIUS + 5.0]
+    world.rocket.forward = [0.0, 0.0, -1.0]
+    world.rocket.vel = [0.0, 0.0, -300.0]
+    for _ in range(10):
+        world.step(DT, Inputs(follow_rocket=True, forward=True))
+        if any(collision.kind == "sun" for collision in world.collisions):
+            break
+    else:
+        pytest.fail("the rocket never reached the sun")
+    # Back at the start
+    assert world.rocket.pos == world.rocket.initial_pos
+
+def test_restored_state_carries_on_exactly():
+    # With real gravity and a swarm, so every part of World.state is used
+    options = dict(asteroid_count=300, seed=3, gravity=True, swarm_count=500)
+    world = _run(World(800, 600, **options), 150)
+    state = world.state()
+    _run(world, 150, 150)
+    copy = World(800, 600, **options)
+    copy.restore(state)
+    _run(copy, 150, 150)
+    assert np.array_equal(_bodies(world), _bodies(copy))
+    assert np.array_equal(world.gravity.positions, copy.gravity.positions)
+    assert np.array_equal(world.swarm.positions, copy.swarm.positions)
+    assert world.rng.getstate() == copy.rng.getstate()
+    assert len(world.shooting_stars) == len(copy.shooting_stars)
@@ -0,0 +1,234 @@
+import hashlib
+import io
+import os
+import threading
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor, as_completed
+
+import numpy as np
+from PIL import Image
+from OpenGL.GL import *
+from OpenGL.GL.EXT.texture_compression_s3tc import *
+from OpenGL.extensions import hasGLExtension
+# The high-level wrappers allocate their own output, so read the mip
+# levels straight into one preallocated array instead
+from OpenGL.raw.GL.VERSION.GL_1_0 import glGetTexImage
+from OpenGL.raw.GL.VERSION.GL_1_3 import glGetCompressedTexImage
+
+# Decoded pixels are cached here, keyed by a hash of the source file
+TEXTURE_CACHE_DIR = ".texture_cache"
+# Bump when the cached pixel layout changes so stale entries are ignored
+CACHE_VERSION = 2
+
+# Resident texture memory allowed before rarely used textures are evicted
+DEFAULT_TEXTURE_BUDGET = 256 * 1024 * 1024
+
+# --------------------------
+# Decode an image into flipped RGB or RGBA pixels (safe to run on worker threads)
+# --------------------------
+def decode_image(filename, cache_dir=TEXTURE_CACHE_DIR):
+    # Returns the pixels and the cache key of the source file (None when the
+    # file is missing or caching is off)
+    try:
+        with open(filename, "rb") as f:
+            data = f.read()
+    except FileNotFoundError:
+        print(f"Error: Texture file not found at '{filename}'. Creating a placeholder.")
+        # Create a white placeholder texture
+        return np.full((256, 256, 3), 255, dtype=np.uint8), None
+
+    key = cache_path = None
+    if cache_dir:
+        key = hashlib.sha1(data).hexdigest()
+        cache_path = os.path.join(cache_dir, f"{key}.v{CACHE_VERSION}.npy")
+        try:
+            # Warm start: map the decoded pixels straight from disk
+            return np.load(cache_path, mmap_mode="r"), key
+        except (OSError, ValueError):
+            pass
+
+    img = Image.open(io.BytesIO(data))
+    img = img.transpose(Image.FLIP_TOP_BOTTOM)
+    # Opaque images (all the JPEG maps) don't need an alpha channel
+    has_alpha = img.mode in ("RGBA", "LA", "PA") or "transparency" in img.info
+    pixels = np.asarray(img.convert("RGBA" if has_alpha else "RGB"))
+
+    if cache_path:
+        save_cached(cache_path, pixels)
+    return pixels, key
+
+def save_cached(path, array):
+    try:
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        # Write to a temporary name first so a crash never leaves a torn entry
+        # Unique per thread too: decoder workers may write the same entry at once
+        tmp_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+        with open(tmp_path, "wb") as f:
+            np.save(f, array, allow_pickle=False)
+        os.replace(tmp_path, path)
+    except OSError as e:
+        print(f"Warning: Could not write texture cache entry '{path}': {e}")
+
+def mipmap_cache_path(cache_dir, key, internal_format):
+    return os.path.join(cache_dir, f"{key}.v{CACHE_VERSION}.{internal_format:x}.npy")
+
+def load_mipmaps(cache_dir, key, internal_format):
+    # Mip chain built (and compressed) by the driver on an earlier run, if any
+    if not cache_dir or key is None:
+        return None
+    try:
+        return np.load(mipmap_cache_path(cache_dir, key, internal_format), mmap_mode="r")
+    except (OSError, ValueError):
+        return None
+
+# --------------------------
+# Pick internal formats for the current context
+# --------------------------
+def texture_formats():
+    # Maps channel count -> (internal format, bytes per 4x4 block); the
+    # block size is None for uncompressed formats
+    renderer = (glGetString(GL_RENDERER) or b"").lower()
+    # Software rasterizers have no video memory bandwidth to save and would
+    # only spend CPU time decoding blocks on every sample
+    software = any(name in renderer for name in (b"llvmpipe", b"softpipe", b"swiftshader"))
+    if hasGLExtension("GL_EXT_texture_compression_s3tc") and not software:
+        return {
+            3: (GL_COMPRESSED_RGB_S3TC_DXT1_EXT, 8),
+            4: (GL_COMPRESSED_RGBA_S3TC_DXT5_EXT, 16),
+        }
+    return {3: (GL_RGB8, None), 4: (GL_RGBA8, None)}
+
+def mip_sizes(width, height):
+    sizes = [(width, height)]
+    while width > 1 or height > 1:
+        width, height = max(1, width // 2), max(1, height // 2)
+        sizes.append((width, height))
+    return sizes
+
+# --------------------------
+# Upload pixels with a full mipmap chain (main thread only)
+# --------------------------
+def upload_texture(pixels, formats, mipmaps=None):
+    # Returns the texture id, its size in video memory and, when the driver
+    # had to build the mip chain, that chain for caching
+    height, width, channels = pixels.shape
+    internal_format, block_bytes = formats[channels]
+    pixel_format = GL_RGBA if channels == 4 else GL_RGB
+    levels = mip_sizes(width, height)
+    if block_bytes:
+        level_bytes = [((w + 3) // 4) * ((h + 3) // 4) * block_bytes for w, h in levels]
+        video_bytes = sum(level_bytes)
+    else:
+        level_bytes = [w * h * channels for w, h in levels]
+        # Drivers pad RGB8 to four bytes per texel
+        video_bytes = sum(w * h * 4 for w, h in levels)
+
+    texture_id = glGenTextures(1)
+    glBindTexture(GL_TEXTURE_2D, texture_id)
+
+    glTexParameteri(GL_TEXTURE_2D, GL_TEXTURE_MIN_FILTER, GL_LINEAR_MIPMAP_LINEAR)
+    glTexParameteri(GL_TEXTURE_2D, GL_TEXTURE_MAG_FILTER, GL_LINEAR)
+    glPixelStorei(GL_UNPACK_ALIGNMENT, 1)
+    glPixelStorei(GL_PACK_ALIGNMENT, 1)
+
+    if mipmaps is not None and len(mipmaps) == sum(level_bytes):
+        # Warm start: the mip chain goes up exactly as the driver built it
+        offset = 0
+        for level, ((w, h), size) in enumerate(zip(levels, level_bytes)):
+            data = np.ascontiguousarray(mipmaps[offset:offset + size])
+            if block_bytes:
+                glCompressedTexImage2D(GL_TEXTURE_2D, level, internal_format, w, h, 0, data)
+            else:
+                glTexImage2D(GL_TEXTURE_2D, level, internal_format, w, h,
+                             0, pixel_format, GL_UNSIGNED_BYTE, data)
+            offset += size
+        return texture_id, video_bytes, None
+
+    # Let the driver build (and compress) the mips once, then read them back
+    glTexImage2D(GL_TEXTURE_2D, 0, internal_format, width, height,
+                 0, pixel_format, GL_UNSIGNED_BYTE, np.ascontiguousarray(pixels))
+    glGenerateMipmap(GL_TEXTURE_2D)
+    mipmaps = np.empty(sum(level_bytes), dtype=np.uint8)
+    offset = 0
+    for level, size in enumerate(level_bytes):
+        if block_bytes:
+            glGetCompressedTexImage(GL_TEXTURE_2D, level, mipmaps[offset:offset + size])
+        else:
+            glGetTexImage(GL_TEXTURE_2D, level, pixel_format, GL_UNSIGNED_BYTE, mipmaps[offset:offset + size])
+        offset += size
+    return texture_id, video_bytes, mipmaps
+
+# --------------------------
+# Texture manager with a video memory budget
+# --------------------------
+class TextureManager:
+    # Used like the old textures dict: textures["Sun"] returns a GL texture id,
+    # reloading the texture first if it was evicted
+    def __init__(self, filenames, budget=DEFAULT_TEXTURE_BUDGET, cache_dir=TEXTURE_CACHE_DIR):
+        self.filenames = dict(filenames)
+        self.budget = budget
+        self.cache_dir = cache_dir
+        self.formats = texture_formats()
+        # name -> (texture id, bytes), least recently used first
+        self.resident = OrderedDict()
+        self.resident_bytes = 0
+        self.frame = 0
+        self.last_used = {}
+        self.evictions = 0
+        self.reloads = 0
+
+    def preload(self, names=None, workers=None):
+        # Decode in parallel (or map from the pixel cache) and upload as each
+        # texture becomes ready
+        names = [name for name in (names or self.filenames) if name not in self.resident]
+        with ThreadPoolExecutor(max_workers=workers) as pool:
+            futures = {pool.submit(self._read, name): name for name in names}
+            for future in as_completed(futures):
+                self._store(futures[future], *future.result())
+        self._evict()
+
+    def begin_frame(self):
+        self.frame += 1
+
+    def __getitem__(self, name):
+        if name not in self.resident:
+            self.reloads += 1
+            self._store(name, *self._read(name))
+        self.resident.move_to_end(name)
+        self.last_used[name] = self.frame
+        self._evict()
+        return self.resident[name][0]
+
+    def __contains__(self, name):
+        return name in self.filenames
+
+    def _read(self, name):
+        # Everything that doesn't need the GL context
+        pixels, key = decode_image(self.filenames[name], self.cache_dir)
+        internal_format = self.formats[pixels.shape[2]][0]
+        return pixels, key, load_mipmaps(self.cache_dir, key, internal_format)
+
+    def _store(self, name, pixels, key, mipmaps):
+        texture_id, size, mipmaps = upload_texture(pixels, self.formats, mipmaps)
+        if mipmaps is not None and self.cache_dir and key is not None:
+            internal_format = self.formats[pixels.shape[2]][0]
+            save_cached(mipmap_cache_path(self.cache_dir, key, internal_format), mipmaps)
+        self.resident[name] = (texture_id, size)
+        self.resident_bytes += size
+
+    def _evict(self):
+        # Never evict a texture already used this frame, even when over
+        # budget, or a too-small budget would reload textures every frame
+        while self.resident_bytes > self.budget:
+            name = next(iter(self.resident))
+            if self.last_used.get(name) == self.frame:
+                break
+            texture_id, size = self.resident.pop(name)
+            glDeleteTextures(1, [texture_id])
+            self.resident_bytes -= size
+            self.evictions += 1
+
+    def release(self):
+        glDeleteTextures(len(self.resident), [texture_id for texture_id, _ in self.resident.values()])
+        self.resident.clear()
+        self.resident_bytes = 0
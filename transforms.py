@@ -0,0 +1,73 @@
+import math
+
+import numpy as np
+
+# Matrices here follow the maths convention (column vectors, M @ v), so they
+# compose in the same order as the glRotatef/glTranslatef calls they replace.
+# GL wants them column-major: transpose before handing one over.
+
+# --------------------------
+# Model transforms
+# --------------------------
+def translate(x, y, z):
+    m = np.eye(4)
+    m[:3, 3] = (x, y, z)
+    return m
+
+def scale(x, y=None, z=None):
+    m = np.eye(4)
+    m[0, 0] = x
+    m[1, 1] = x if y is None else y
+    m[2, 2] = x if z is None else z
+    return m
+
+def rotate(angle, x, y, z):
+    # Same as glRotatef: angle in degrees about the (normalized) axis
+    axis = np.array((x, y, z), dtype=np.float64)
+    x, y, z = axis / np.linalg.norm(axis)
+    c, s = math.cos(math.radians(angle)), math.sin(math.radians(angle))
+    oc = 1.0 - c
+    m = np.eye(4)
+    m[:3, :3] = (
+        (x * x * oc + c, x * y * oc - z * s, x * z * oc + y * s),
+        (y * x * oc + z * s, y * y * oc + c, y * z * oc - x * s),
+        (z * x * oc - y * s, z * y * oc + x * s, z * z * oc + c),
+    )
+    return m
+
+# --------------------------
+# Camera transforms
+# --------------------------
+def perspective(fov_y, aspect, near, far):
+    # Same as gluPerspective
+    f = 1.0 / math.tan(math.radians(fov_y) / 2.0)
+    m = np.zeros((4, 4))
+    m[0, 0] = f / aspect
+    m[1, 1] = f
+    m[2, 2] = (far + near) / (near - far)
+    m[2, 3] = 2.0 * far * near / (near - far)
+    m[3, 2] = -1.0
+    return m
+
+def ortho_2d(left, right, bottom, top):
+    # Same as gluOrtho2D
+    m = np.eye(4)
+    m[0, 0] = 2.0 / (right - left)
+    m[1, 1] = 2.0 / (top - bottom)
+    m[2, 2] = -1.0
+    m[0, 3] = -(right + left) / (right - left)
+    m[1, 3] = -(top + bottom) / (top - bottom)
+    return m
+
+def look_at(eye, center, up):
+    # Same as gluLookAt
+    eye = np.asarray(eye, dtype=np.float64)
+    forward = np.asarray(center, dtype=np.float64) - eye
+    forward /= np.linalg.norm(forward)
+    side = np.cross(forward, up)
+    side /= np.linalg.norm(side)
+    up = np.cross(side, forward)
+    m = np.eye(4)
+    m[0, :3], m[1, :3], m[2, :3] = side, up, -forward
+    m[:3, 3] = -m[:3, :3] @ eye
+    return m